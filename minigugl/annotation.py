@@ -1,14 +1,37 @@
-"""Annotations for video frames."""
+"""Annotations for video frames.
+
+The font and the caches are set up on first use, so importing this module
+stays cheap.
+"""
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, NamedTuple, Optional, Tuple
 
 import cv2
+import numpy as np
 
 from minigugl import config
+from minigugl.cache import LruCache
 
 Point = Tuple[int, int]
 TextOrg = Point
 BoxCoords = Tuple[Point, Point]
+Region = Tuple[int, int, int, int]
+Color = Tuple[int, int, int]
+
+# Channel order of frames, e.g. BGR as produced by OpenCV and VideoGear
+BGR = 'bgr'
+RGB = 'rgb'
+
+# Annotation colors in RGB order
+BOX_COLOR: Color = (255, 255, 255)  # white background
+TEXT_COLOR: Color = (0, 0, 0)  # black text
+
+# Opacity is handled as 8-bit fixed-point number
+# (0 = transparent, 256 = opaque)
+OPACITY_BITS = 8
+OPACITY_OPAQUE = 1 << OPACITY_BITS
+_OPACITY_ROUNDING = 1 << (OPACITY_BITS - 1)
 
 
 class AnnotationCoords(NamedTuple):
@@ -18,13 +41,42 @@ class AnnotationCoords(NamedTuple):
     box_coords: BoxCoords
 
 
-# Font setup for OpenCV
-ft = cv2.freetype.createFreeType2()
 font_file = Path(__file__).parent / 'fonts' / 'SourceCodePro-Regular.ttf'
-ft.loadFontData(
-    fontFileName=str(font_file),
-    id=0,
-)
+
+
+@lru_cache(maxsize=None)
+def get_font() -> Any:
+    """Load the font for OpenCV once, on first use.
+
+    Returns:
+        FreeType2 instance with the font loaded.
+    """
+    ft = cv2.freetype.createFreeType2()
+    ft.loadFontData(
+        fontFileName=str(font_file),
+        id=0,
+    )
+    return ft
+
+
+@lru_cache(maxsize=None)
+def get_text_sizes() -> 'LruCache[Tuple[int, int]]':
+    """Get the cache of measured text sizes.
+
+    Returns:
+        Cache shared by all cameras, sized by ANNOTATION_CACHE_SIZE.
+    """
+    return LruCache(config.settings.annotation_cache_size)
+
+
+@lru_cache(maxsize=None)
+def get_text_tiles() -> 'LruCache[Any]':
+    """Get the cache of rasterized text tiles (box background + glyphs).
+
+    Returns:
+        Cache shared by all cameras, sized by ANNOTATION_CACHE_SIZE.
+    """
+    return LruCache(config.settings.annotation_cache_size)
 
 
 def get_text_size(
@@ -41,333 +93,223 @@ def get_text_size(
     Returns:
         Tuple representing text width and text height as integers.
     """
-    text_width, text_height = ft.getTextSize(
-        text,
-        config.settings.annotation_font_height,
-        thickness=-1,
-    )[0]
+    font_height = config.settings.annotation_font_height
+    cache_key = (text, font_height)
+    text_width, text_height = get_text_sizes().get(
+        cache_key,
+        lambda: get_font().getTextSize(text, font_height, thickness=-1)[0],
+    )
     if override_text_height:
         return text_width, override_text_height
     return text_width, text_height
 
 
-def get_bottom_left_coords(
-    text_width: int,
-    text_height: int,
-    text_x: int,
-    text_y: int,
-) -> Tuple[TextOrg, BoxCoords]:
-    """Get coordinates for text and background in bottom left corner.
+def to_channel_order(color: Color, color_order: str = BGR) -> Color:
+    """Convert an RGB color to the channel order of a frame.
 
     Args:
-        text_width: Width of the text to be drawn.
-        text_height: Height of the text to be drawn.
-        text_x: X coordinate of the bottom-left corner of the text.
-        text_y: Y coordinate of the bottom-left corner of the text.
+        color: Color as RGB tuple.
+        color_order: Channel order of the frame (BGR or RGB).
 
     Returns:
-        A tuple consisting of tuples for text point and text box coordinates.
+        Color tuple in the channel order of the frame.
     """
-    text_offset_x = (
-        text_x +
-        config.settings.annotation_padding +
-        config.settings.annotation_margin
-    )
-    text_offset_y = (
-        text_y -
-        config.settings.annotation_padding -
-        config.settings.annotation_margin
-    )
-    box_coords = (
-        (
-            text_offset_x - config.settings.annotation_padding,
-            text_offset_y + config.settings.annotation_padding,
-        ),
-        (
-            text_offset_x + text_width + config.settings.annotation_padding,
-            text_offset_y - text_height - config.settings.annotation_padding,
-        ),
-    )
-    text_org = (text_offset_x, text_offset_y)
-    return AnnotationCoords(text_org, box_coords)
+    if color_order == BGR:
+        return color[2], color[1], color[0]
+    return color
 
 
-def get_bottom_right_coords(
-    text_width: int,
-    text_height: int,
-    text_x: int,
-    text_y: int,
-) -> Tuple[TextOrg, BoxCoords]:
-    """Get coordinates for text and background in bottom right corner.
+def to_fixed_opacity(alpha: float) -> int:
+    """Convert an opacity level to its fixed-point representation.
 
     Args:
-        text_width: Width of the text to be drawn.
-        text_height: Height of the text to be drawn.
-        text_x: X coordinate of the bottom-right corner of the text.
-        text_y: Y coordinate of the bottom-right corner of the text.
+        alpha: Opacity level between 0.0 (transparent) and 1.0 (opaque).
 
     Returns:
-        A tuple consisting of tuples for text point and text box coordinates.
+        Opacity as integer between 0 and OPACITY_OPAQUE.
     """
-    text_offset_x = (
-        text_x -
-        config.settings.annotation_padding -
-        config.settings.annotation_margin
-    )
-    text_offset_y = (
-        text_y -
-        config.settings.annotation_padding -
-        config.settings.annotation_margin
-    )
-    box_coords = (
-        (
-            text_offset_x - config.settings.annotation_padding,
-            text_offset_y + config.settings.annotation_padding,
-        ),
-        (
-            text_offset_x + text_width + config.settings.annotation_padding,
-            text_offset_y - text_height - config.settings.annotation_padding,
-        ),
-    )
-    text_org = (text_offset_x, text_offset_y)
-    return AnnotationCoords(text_org, box_coords)
+    return min(max(int(round(alpha * OPACITY_OPAQUE)), 0), OPACITY_OPAQUE)
 
 
-def get_top_left_coords(
-    text_width: int,
-    text_height: int,
-    text_x: int,
-    text_y: int,
-) -> Tuple[TextOrg, BoxCoords]:
-    """Get coordinates for text and background in top left corner.
+def get_box_region(
+    frame_shape: Tuple[int, ...],
+    box_coords: BoxCoords,
+) -> Optional[Region]:
+    """Get the frame region covered by a text box, clipped to the frame.
 
     Args:
-        text_width: Width of the text to be drawn.
-        text_height: Height of the text to be drawn.
-        text_x: X coordinate of the top-left corner of the text.
-        text_y: Y coordinate of the top-left corner of the text.
+        frame_shape: Shape of the frame (height, width, channels).
+        box_coords: Box coordinates as tuple of points.
 
     Returns:
-        A tuple consisting of tuples for text point and text box coordinates.
+        Tuple of (x_start, y_start, x_end, y_end) with exclusive end
+        coordinates or None if the box lies outside of the frame.
     """
-    text_offset_x = (
-        text_x +
-        config.settings.annotation_padding +
-        config.settings.annotation_margin
+    x_start, x_end = _clip_span(
+        box_coords[0][0], box_coords[1][0], frame_shape[1],
     )
-    text_offset_y = (
-        text_y +
-        config.settings.annotation_padding +
-        config.settings.annotation_margin
-    )
-    box_coords = (
-        (
-            text_offset_x - config.settings.annotation_padding,
-            text_offset_y + config.settings.annotation_padding,
-        ),
-        (
-            text_offset_x + text_width + config.settings.annotation_padding,
-            text_offset_y - text_height - config.settings.annotation_padding,
-        ),
+    y_start, y_end = _clip_span(
+        box_coords[0][1], box_coords[1][1], frame_shape[0],
     )
-    text_org = (text_offset_x, text_offset_y)
-    return AnnotationCoords(text_org, box_coords)
+    if x_start >= x_end or y_start >= y_end:
+        return None
+    return x_start, y_start, x_end, y_end
+
+
+def _clip_span(corner_a: int, corner_b: int, size: int) -> Tuple[int, int]:
+    start = max(min(corner_a, corner_b), 0)
+    # cv2.rectangle() fills both corner points, hence the +1 for the end
+    return start, min(max(corner_a, corner_b) + 1, size)
 
 
-def get_top_right_coords(
+def blend(background: Any, overlay: Any, opacity: int) -> None:
+    """Alpha-blend overlay onto background in place using fixed-point math.
+
+    Equivalent to cv2.addWeighted(overlay, alpha, background, 1 - alpha, 0)
+    with alpha = opacity / OPACITY_OPAQUE, but without float conversion.
+
+    Args:
+        background: Image (or view of an image) to blend into.
+        overlay: Image of the same shape as background.
+        opacity: Fixed-point opacity of the overlay (see to_fixed_opacity).
+    """
+    if opacity >= OPACITY_OPAQUE:
+        background[...] = overlay
+        return
+    blended = overlay.astype(np.uint16)
+    blended *= opacity
+    blended += background.astype(np.uint16) * (OPACITY_OPAQUE - opacity)
+    blended += _OPACITY_ROUNDING
+    blended >>= OPACITY_BITS
+    background[...] = blended
+
+
+def get_text_tile(
+    text: str,
     text_width: int,
     text_height: int,
-    text_x: int,
-    text_y: int,
-) -> Tuple[TextOrg, BoxCoords]:
-    """Get coordinates for text and background in top right corner.
+    channels: int = 3,
+    color_order: str = BGR,
+) -> Any:
+    """Get the rasterized text box for a text, rendered once and cached.
+
+    The tile contains the white box background including padding and the
+    black text. Cached tiles are shared and therefore read-only.
 
     Args:
+        text: Text to be drawn as string.
         text_width: Width of the text to be drawn.
         text_height: Height of the text to be drawn.
-        text_x: X coordinate of the top-right corner of the text.
-        text_y: Y coordinate of the top-right corner of the text.
+        channels: Number of color channels of the target frame.
+        color_order: Channel order of the target frame (BGR or RGB).
 
     Returns:
-        A tuple consisting of tuples for text point and text box coordinates.
+        Read-only image of the text box as numpy array.
     """
-    text_offset_x = (
-        text_x -
-        config.settings.annotation_padding -
-        config.settings.annotation_margin
-    )
-    text_offset_y = (
-        text_y +
-        config.settings.annotation_padding +
-        config.settings.annotation_margin
-    )
-    box_coords = (
+    font_height = config.settings.annotation_font_height
+    padding = config.settings.annotation_padding
+    return get_text_tiles().get(
         (
-            text_offset_x - config.settings.annotation_padding,
-            text_offset_y + config.settings.annotation_padding,
+            text,
+            font_height,
+            padding,
+            text_width,
+            text_height,
+            channels,
+            color_order,
         ),
-        (
-            text_offset_x + text_width + config.settings.annotation_padding,
-            text_offset_y - text_height - config.settings.annotation_padding,
+        lambda: _render_text_tile(
+            text=text,
+            text_width=text_width,
+            text_height=text_height,
+            font_height=font_height,
+            padding=padding,
+            channels=channels,
+            color_order=color_order,
         ),
     )
-    text_org = (text_offset_x, text_offset_y)
-    return AnnotationCoords(text_org, box_coords)
 
 
-def add_text(
-    frame: Any,
+def _render_text_tile(  # noqa: WPS211
     text: str,
-    text_org: TextOrg,
-    box_coords: BoxCoords,
-) -> None:
-    """Draw text with background on an frame.
-
-    Args:
-        frame: Input frame as OpenCV image.
-        text: Text to be drawn as string.
-        text_org: Bottom-left corner of the text in the image as tuple of ints.
-        box_coords: Box coordinates as tuple of points.
-    """
-    # Add background
-    cv2.rectangle(
-        img=frame,
-        pt1=box_coords[0],
-        pt2=box_coords[1],
-        color=(255, 255, 255),  # white background
-        thickness=cv2.FILLED,
-    )
-    ft.putText(
-        img=frame,
+    text_width: int,
+    text_height: int,
+    font_height: int,
+    padding: int,
+    channels: int,
+    color_order: str,
+) -> Any:
+    # Box corners are inclusive (see cv2.rectangle), hence the +1
+    tile_height = text_height + 2 * padding + 1
+    tile_width = text_width + 2 * padding + 1
+    tile = np.empty((tile_height, tile_width, channels), dtype=np.uint8)
+    tile[...] = to_channel_order(BOX_COLOR, color_order)[:channels]
+    get_font().putText(
+        img=tile,
         text=text,
-        org=text_org,
-        fontHeight=config.settings.annotation_font_height,
-        color=(0, 0, 0),  # black text
+        org=(padding, padding + text_height),
+        fontHeight=font_height,
+        color=to_channel_order(TEXT_COLOR, color_order),
         thickness=-1,
         line_type=cv2.LINE_AA,
         bottomLeftOrigin=True,
     )
+    tile.flags.writeable = False
+    return tile
 
 
-def add_annotation_bottom_left(
+def add_text(
     frame: Any,
     text: str,
-    override_text_height: Optional[int] = None,
+    box_coords: BoxCoords,
+    opacity: int = OPACITY_OPAQUE,
+    color_order: str = BGR,
 ) -> None:
-    """Add text annotation to frame on bottom left.
-
-    Args:
-        frame: Input frame as OpenCV image.
-        text: Text to be drawn as string.
-        override_text_height: Override text height in case OpenCV's
-            getTextSize() acts buggy.
-    """
-    (text_width, text_height) = get_text_size(
-        text=text,
-        override_text_height=override_text_height,
-    )
-    text_org, box_coords = get_bottom_left_coords(
-        text_width=text_width,
-        text_height=text_height,
-        text_x=0,
-        text_y=frame.shape[0],
-    )
-    add_text(
-        frame=frame,
-        text=text,
-        text_org=text_org,
-        box_coords=box_coords,
-    )
-
+    """Draw text with background on an frame.
 
-def add_annotation_bottom_right(
-    frame: Any,
-    text: str,
-    override_text_height: Optional[int] = None,
-) -> None:
-    """Add text annotation to frame on bottom right.
+    Stamps the cached text tile onto the region covered by the text box and
+    leaves the rest of the frame untouched. The tile places the text within
+    the box, padded by ANNOTATION_PADDING.
 
     Args:
         frame: Input frame as OpenCV image.
         text: Text to be drawn as string.
-        override_text_height: Override text height in case OpenCV's
-            getTextSize() acts buggy.
+        box_coords: Box coordinates as tuple of points.
+        opacity: Fixed-point opacity of the annotation (see to_fixed_opacity).
+        color_order: Channel order of the frame (BGR or RGB).
     """
-    (text_width, text_height) = get_text_size(
-        text=text,
-        override_text_height=override_text_height,
-    )
-    text_org, box_coords = get_bottom_right_coords(
-        text_width=text_width,
-        text_height=text_height,
-        text_x=frame.shape[1] - text_width,
-        text_y=frame.shape[0],
-    )
-    add_text(
-        frame=frame,
-        text=text,
-        text_org=text_org,
-        box_coords=box_coords,
+    region = get_box_region(frame.shape, box_coords)
+    if region is None:
+        return
+    tile = _get_box_tile(frame, text, box_coords, color_order)
+    # the tile covers the whole box, which may reach beyond the frame
+    origin = (
+        min(box_coords[0][0], box_coords[1][0]),
+        min(box_coords[0][1], box_coords[1][1]),
     )
+    blend(_crop(frame, region), _crop(tile, region, origin), opacity)
 
 
-def add_annotation_top_left(
+def _get_box_tile(
     frame: Any,
     text: str,
-    override_text_height: Optional[int] = None,
-) -> None:
-    """Add text annotation to frame on top left.
-
-    Args:
-        frame: Input frame as OpenCV image.
-        text: Text to be drawn as string.
-        override_text_height: Override text height in case OpenCV's
-            getTextSize() acts buggy.
-    """
-    (text_width, text_height) = get_text_size(
-        text=text,
-        override_text_height=override_text_height,
-    )
-    text_org, box_coords = get_top_left_coords(
-        text_width=text_width,
-        text_height=text_height,
-        text_x=0,
-        text_y=text_height,
-    )
-    add_text(
-        frame=frame,
+    box_coords: BoxCoords,
+    color_order: str,
+) -> Any:
+    padding = config.settings.annotation_padding
+    (x_a, y_a), (x_b, y_b) = box_coords
+    return get_text_tile(
         text=text,
-        text_org=text_org,
-        box_coords=box_coords,
+        text_width=abs(x_b - x_a) - 2 * padding,
+        text_height=abs(y_b - y_a) - 2 * padding,
+        channels=frame.shape[2] if frame.ndim > 2 else 1,
+        color_order=color_order,
     )
 
 
-def add_annotation_top_right(
-    frame: Any,
-    text: str,
-    override_text_height: Optional[int] = None,
-) -> None:
-    """Add text annotation to frame on top right.
-
-    Args:
-        frame: Input frame as OpenCV image.
-        text: Text to be drawn as string.
-        override_text_height: Override text height in case OpenCV's
-            getTextSize() acts buggy.
-    """
-    (text_width, text_height) = get_text_size(
-        text=text,
-        override_text_height=override_text_height,
-    )
-    text_org, box_coords = get_top_right_coords(
-        text_width=text_width,
-        text_height=text_height,
-        text_x=frame.shape[1] - text_width,
-        text_y=text_height,
-    )
-    add_text(
-        frame=frame,
-        text=text,
-        text_org=text_org,
-        box_coords=box_coords,
-    )
+def _crop(image: Any, region: Region, origin: Point = (0, 0)) -> Any:
+    x_start, y_start, x_end, y_end = region
+    return image[
+        y_start - origin[1]:y_end - origin[1],
+        x_start - origin[0]:x_end - origin[0],
+    ]
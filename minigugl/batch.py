@@ -0,0 +1,537 @@
+"""Offline annotation and transcoding of recorded video files.
+
+Input files are split into chunks at key frames, about one segment
+length (VIDEO_SEGMENT_LENGTH_SEC) each. A pool of processes, one per CPU
+core by default, annotates and encodes the chunks in parallel. Each chunk
+becomes one output segment, named with OUTPUT_FILENAME after the footage
+time of its first frame. The footage time is parsed from the input
+filename (e.g. video_2021-04-14_20-15-30.mp4, as recorded in pass-through
+mode) or derived from the file's modification time.
+
+Example:
+    python -m minigugl.batch /archive/raw --output-dir /archive/annotated
+"""
+import argparse
+import json
+import os
+import subprocess  # noqa: S404
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from fractions import Fraction
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from minigugl import annotation, clock, config, layout
+from minigugl.ffmpeg import SEGMENT_MUXER_OPTIONS, FFmpegWriter
+from minigugl.recorder import build_ffmpeg_options
+from minigugl.segments import parse_start_time
+
+VIDEO_SUFFIXES = frozenset(('.avi', '.mkv', '.mov', '.mp4', '.ts'))
+CHANNELS = 3  # frames are decoded to BGR
+FFPROBE_OPTIONS = ('-v', 'error', '-select_streams', 'v:0')
+STREAM_ENTRIES = (
+    'stream=width,height,avg_frame_rate:format=duration,start_time'
+)
+DECODER_OPTIONS = ('-hide_banner', '-loglevel', 'error')
+RAW_VIDEO_OUTPUT = ('-map', '0:v:0', '-f', 'rawvideo', '-pix_fmt', 'bgr24')
+
+Annotation = Tuple[layout.AnnotationLayout, clock.TimestampFormatter]
+
+
+class VideoInfo(NamedTuple):
+    """Properties of the first video stream of a file.
+
+    Attributes:
+        width: Frame width in pixels.
+        height: Frame height in pixels.
+        framerate: Average framerate.
+        duration: Duration in seconds.
+        key_frames: Times of all key frames in seconds from the start.
+    """
+
+    width: int
+    height: int
+    framerate: float
+    duration: float
+    key_frames: List[float]
+
+
+class Chunk(NamedTuple):
+    """Part of an input file starting at a key frame, encoded as one segment.
+
+    Attributes:
+        source: Path of the input file.
+        offset: Start within the input file in seconds.
+        duration: Duration in seconds, None until the end of the file.
+        start: Footage time of the first frame as UNIX timestamp.
+        output: Path of the output segment.
+    """
+
+    source: Path
+    offset: float
+    duration: Optional[float]
+    start: float
+    output: Path
+
+
+Task = Tuple[Chunk, config.CameraSettings]
+
+
+def find_videos(inputs: Iterable[Path]) -> List[Tuple[Path, Path]]:
+    """Collect video files, searching directories recursively.
+
+    Args:
+        inputs: Paths of video files or directories.
+
+    Returns:
+        Sorted paths of all video files, each with its directory relative
+        to the input directory (e.g. the camera's directory), which is kept
+        within the output directory.
+    """
+    videos: Set[Tuple[Path, Path]] = set()
+    for input_path in inputs:
+        if input_path.is_dir():
+            videos.update(
+                (path, path.parent.relative_to(input_path))
+                for path in input_path.rglob('*')
+                if path.suffix.lower() in VIDEO_SUFFIXES and path.is_file()
+            )
+        else:
+            videos.add((input_path, Path()))
+    return sorted(videos)
+
+
+def get_ffprobe_path(ffmpeg_path: str) -> str:
+    """Get the path of ffprobe, expected next to FFmpeg.
+
+    Args:
+        ffmpeg_path: Path to the FFmpeg executable.
+
+    Returns:
+        Path to the ffprobe executable.
+    """
+    if Path(ffmpeg_path).parent == Path():
+        return 'ffprobe'
+    return str(Path(ffmpeg_path).with_name('ffprobe'))
+
+
+def probe_video(path: Path, ffprobe_path: str) -> VideoInfo:
+    """Read the properties and key frames of a file's first video stream.
+
+    Key frames are taken from the packet flags, without decoding.
+
+    Args:
+        path: Path of the video file.
+        ffprobe_path: Path to the ffprobe executable.
+
+    Returns:
+        Properties of the video stream.
+    """
+    probe = json.loads(
+        _run_ffprobe(path, ffprobe_path, STREAM_ENTRIES, 'json'),
+    )
+    stream = probe['streams'][0]
+    packets = _run_ffprobe(
+        path, ffprobe_path, 'packet=pts_time,flags', 'csv=p=0',
+    )
+    return VideoInfo(
+        width=int(stream['width']),
+        height=int(stream['height']),
+        framerate=float(Fraction(stream['avg_frame_rate'])),
+        duration=float(probe['format']['duration']),
+        key_frames=_parse_key_frames(
+            packets, float(probe['format'].get('start_time', 0)),
+        ),
+    )
+
+
+def _run_ffprobe(
+    path: Path,
+    ffprobe_path: str,
+    entries: str,
+    output_format: str,
+) -> str:
+    return subprocess.check_output(  # noqa: S603
+        [
+            ffprobe_path,
+            *FFPROBE_OPTIONS,
+            '-show_entries',
+            entries,
+            '-of',
+            output_format,
+            str(path),
+        ],
+        universal_newlines=True,
+    )
+
+
+def _parse_key_frames(packets: str, start_time: float) -> List[float]:
+    key_frames = []
+    for line in packets.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if flags.startswith('K') and pts_time != 'N/A':
+            key_frames.append(float(pts_time) - start_time)
+    return sorted(key_frames)
+
+
+def split_at_key_frames(
+    key_frames: List[float],
+    duration: float,
+    chunk_sec: float,
+) -> List[Tuple[float, float]]:
+    """Split a video into chunks starting at key frames.
+
+    Each chunk ends at the first key frame at least chunk_sec after its
+    start, so chunks can be decoded independently.
+
+    Args:
+        key_frames: Times of all key frames in seconds from the start.
+        duration: Duration of the video in seconds.
+        chunk_sec: Minimum duration of a chunk in seconds.
+
+    Returns:
+        List of offsets and durations in seconds.
+    """
+    boundaries: List[float] = [0]
+    for key_frame in key_frames:
+        if key_frame - boundaries[-1] >= chunk_sec:
+            boundaries.append(key_frame)
+    boundaries.append(max(duration, boundaries[-1]))
+    return [
+        (start, end - start)
+        for start, end in zip(boundaries, boundaries[1:])
+        if end > start
+    ]
+
+
+def plan_chunks(
+    source: Path,
+    camera: config.CameraSettings,
+    video_info: VideoInfo,
+    input_pattern: str,
+) -> List[Chunk]:
+    """Split an input file into chunks with named output segments.
+
+    Args:
+        source: Path of the input file.
+        camera: Settings for the output, see OUTPUT_DIR and OUTPUT_FILENAME.
+        video_info: Properties of the input file's video stream.
+        input_pattern: strftime pattern to parse the footage time from the
+            input filename.
+
+    Returns:
+        Chunks in footage order.
+    """
+    start = parse_start_time(source, input_pattern)
+    if start is None:
+        # recording ended when the file got written the last time
+        start = source.stat().st_mtime - video_info.duration
+    chunks = split_at_key_frames(
+        video_info.key_frames,
+        video_info.duration,
+        camera.video_segment_length_sec,
+    )
+    return [
+        Chunk(
+            source=source,
+            offset=offset,
+            # half a frame less, so no frame ends up in two chunks
+            duration=(
+                None if index == len(chunks) - 1
+                else duration - 0.5 / video_info.framerate
+            ),
+            start=start + offset,
+            output=Path(camera.output_dir) / time.strftime(
+                camera.output_filename, time.localtime(start + offset),
+            ),
+        )
+        for index, (offset, duration) in enumerate(chunks)
+    ]
+
+
+def get_encoder_options(camera: config.CameraSettings) -> Dict[str, Any]:
+    """Get the FFmpeg output parameters of live recording for a single file.
+
+    Args:
+        camera: Settings for the output.
+
+    Returns:
+        Dict of FFmpeg parameters as expected by WriteGear.
+    """
+    return {
+        key: option_value
+        for key, option_value in build_ffmpeg_options(camera).items()
+        if key not in SEGMENT_MUXER_OPTIONS and key != '-clones'
+    }
+
+
+@lru_cache(maxsize=None)
+def _get_annotation() -> Annotation:
+    # once per worker process, loading the font with the first frame
+    return (
+        layout.AnnotationLayout(
+            config.settings.annotation_layout,
+            opacity=annotation.to_fixed_opacity(
+                config.settings.annotation_opacity,
+            ),
+        ),
+        clock.TimestampFormatter(
+            config.settings.annotation_timestamp_format,
+            precision=config.settings.annotation_timestamp_precision,
+        ),
+    )
+
+
+def _start_decoder(
+    chunk: Chunk,
+    ffmpeg_path: str,
+) -> 'subprocess.Popen[bytes]':
+    # seeking before the input is fast and exact, as it is a key frame
+    input_args = ['-ss', str(chunk.offset), '-i', str(chunk.source)]
+    duration_args = [] if chunk.duration is None else [
+        '-t', str(chunk.duration),
+    ]
+    return subprocess.Popen(  # noqa: S603
+        [
+            ffmpeg_path,
+            *DECODER_OPTIONS,
+            *input_args,
+            *duration_args,
+            *RAW_VIDEO_OUTPUT,
+            '-',
+        ],
+        stdout=subprocess.PIPE,
+    )
+
+
+def _read_frames(
+    decoder: 'subprocess.Popen[bytes]',
+    shape: Tuple[int, int, int],
+) -> Iterable[Any]:
+    # frames are read into the same buffer, written before the next one
+    frame_buffer = bytearray(int(np.prod(shape)))
+    frame = np.frombuffer(frame_buffer, dtype=np.uint8).reshape(shape)
+    stdout = decoder.stdout
+    while stdout.readinto(frame_buffer) == len(frame_buffer):  # type: ignore
+        yield frame
+
+
+def _encode_frames(
+    decoder: 'subprocess.Popen[bytes]',
+    writer: FFmpegWriter,
+    chunk: Chunk,
+    camera: config.CameraSettings,
+) -> int:
+    annotation_layout, timestamp_formatter = _get_annotation()
+    shape = (camera.video_height, camera.video_width, CHANNELS)
+    frame_count = 0
+    for frame in _read_frames(decoder, shape):
+        annotation_layout.draw(frame, {
+            layout.TIME: timestamp_formatter.format(
+                chunk.start + frame_count / camera.video_framerate,
+            ),
+            layout.CAMERA: camera.name,
+        })
+        writer.write(frame)
+        frame_count += 1
+    return frame_count
+
+
+def process_chunk(chunk: Chunk, camera: config.CameraSettings) -> Path:
+    """Decode, annotate, and encode a chunk into its output segment.
+
+    Runs in a worker process.
+
+    Args:
+        chunk: Chunk of an input file.
+        camera: Settings for the output, with the input's frame size and
+            framerate.
+
+    Raises:
+        RuntimeError: If decoding failed or the chunk has no frames.
+
+    Returns:
+        Path of the written output segment.
+    """
+    ffmpeg_path = config.settings.ffmpeg_path or 'ffmpeg'
+    writer = FFmpegWriter(
+        output_filename=str(chunk.output),
+        ffmpeg_path=ffmpeg_path,
+        **get_encoder_options(camera),
+    )
+    decoder = _start_decoder(chunk, ffmpeg_path)
+    frame_count = _encode_frames(decoder, writer, chunk, camera)
+    writer.close()
+    if decoder.wait():
+        raise RuntimeError('Decoding failed with exit code {0}'.format(
+            decoder.returncode,
+        ))
+    if not frame_count or not chunk.output.exists():
+        raise RuntimeError('No frames written to {0}'.format(chunk.output))
+    return chunk.output
+
+
+def build_camera(
+    video: Path,
+    output_dir: Path,
+    video_info: VideoInfo,
+    name: str,
+) -> config.CameraSettings:
+    """Build the output settings for an input file.
+
+    Encoding settings (e.g. VIDEO_CODEC, VIDEO_CRF) are taken from the
+    global settings, frame size and framerate from the input file.
+
+    Args:
+        video: Path of the input file.
+        output_dir: Directory of the output segments.
+        video_info: Properties of the input file's video stream.
+        name: Name of the camera, used in annotations.
+
+    Returns:
+        Settings for encoding the input file.
+    """
+    # global settings that are no camera settings are ignored
+    return config.CameraSettings(**{
+        **config.settings.dict(),
+        'name': name,
+        'video_source': str(video),
+        'output_dir': str(output_dir),
+        'video_width': video_info.width,
+        'video_height': video_info.height,
+        'video_framerate': round(video_info.framerate),
+        'renditions': [],
+    })
+
+
+def check_outputs(tasks: Iterable[Task]) -> None:
+    """Make sure no two chunks are written to the same output segment.
+
+    Args:
+        tasks: Chunks with their output settings.
+
+    Raises:
+        ValueError: If chunks share an output segment.
+    """
+    sources: Dict[Path, Path] = {}
+    for chunk, _ in tasks:
+        other = sources.setdefault(chunk.output, chunk.source)
+        if other != chunk.source:
+            raise ValueError('{0} and {1} both start at {2}'.format(
+                other, chunk.source, chunk.output,
+            ))
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m minigugl.batch',
+        description='Annotate and transcode recorded video files.',
+    )
+    parser.add_argument('inputs', nargs='+', type=Path)
+    parser.add_argument('--output-dir', type=Path, required=True)
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        help='number of worker processes (default: number of CPU cores)',
+    )
+    parser.add_argument(
+        '--input-pattern',
+        help='strftime pattern of the input filenames (default: ' +
+        'OUTPUT_FILENAME)',
+    )
+    parser.add_argument(
+        '--name',
+        default='camera0',
+        help='camera name for annotations (default: camera0)',
+    )
+    return parser.parse_args()
+
+
+def _plan_video(
+    video: Path,
+    output_dir: Path,
+    args: argparse.Namespace,
+    ffprobe_path: str,
+) -> List[Task]:
+    video_info = probe_video(video, ffprobe_path)
+    camera = build_camera(video, output_dir, video_info, args.name)
+    input_pattern = args.input_pattern or config.settings.output_filename
+    return [
+        (chunk, camera)
+        for chunk in plan_chunks(video, camera, video_info, input_pattern)
+    ]
+
+
+def _plan(
+    videos: List[Tuple[Path, Path]],
+    args: argparse.Namespace,
+) -> List[Task]:
+    ffprobe_path = get_ffprobe_path(config.settings.ffmpeg_path or 'ffmpeg')
+    tasks: List[Task] = []
+    for video, subdir in videos:
+        tasks.extend(
+            _plan_video(video, args.output_dir / subdir, args, ffprobe_path),
+        )
+    check_outputs(tasks)
+    return tasks
+
+
+def _make_output_dirs(tasks: List[Task]) -> None:
+    output_dirs = {Path(camera.output_dir) for _, camera in tasks}
+    for output_dir in output_dirs:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+
+def _log_result(future: 'Future[Path]', chunk: Chunk) -> bool:
+    try:
+        logger.info('Wrote {0}', future.result())
+    except Exception:
+        logger.exception(
+            'Failed to process {0} at {1:.1f}s',
+            chunk.source,
+            chunk.offset,
+        )
+        return False
+    return True
+
+
+def _process(tasks: List[Task], jobs: int) -> int:
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(process_chunk, chunk, camera): chunk
+            for chunk, camera in tasks
+        }
+        return sum(
+            not _log_result(future, futures[future])
+            for future in as_completed(futures)
+        )
+
+
+def main() -> None:
+    """Annotate and transcode all input files with a pool of processes."""
+    args = _parse_args()
+    videos = find_videos(args.inputs)
+    try:
+        tasks = _plan(videos, args)
+    except ValueError as error:
+        sys.exit('Output segments collide: {0}'.format(error))
+    _make_output_dirs(tasks)
+    logger.info(
+        'Processing {0} files in {1} chunks with {2} processes',
+        len(videos),
+        len(tasks),
+        args.jobs,
+    )
+    failed = _process(tasks, args.jobs)
+    if failed:
+        sys.exit('{0} of {1} chunks failed'.format(failed, len(tasks)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+r"""End-to-end throughput benchmark with a local synthetic MJPEG source.
+
+Every combination of resolution, framerate, codec, and annotation setting
+runs the recorder of minigugl.client, with the same stages, annotations,
+and writer, in a separate process for a fixed duration, reading from a
+synthetic MJPEG stream served over HTTP by this process.
+
+Example:
+    python -m minigugl.benchmark --duration 30 \
+        --resolution 640x480 1280x720 --framerate 24 30
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import resource
+import subprocess  # noqa: S404
+import sys
+import tempfile
+import time
+from threading import Lock
+from typing import Any, Dict, List, Sequence, Tuple, cast
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from minigugl import client, location
+from minigugl.clock import CapturedFrame
+from minigugl.recorder import Recorder
+from minigugl.server import (
+    QuietRequestHandler,
+    send_mjpeg_frame,
+    send_mjpeg_headers,
+    serve_in_thread,
+)
+
+Resolution = Tuple[int, int]
+Measurements = Dict[str, Any]
+
+# latitude, longitude, speed (m/s), course, and altitude of the GPS fields
+SAMPLE_GPS_FIX = (37.774889, -122.419389, 11.7, 274, 16)
+LATENCY_PERCENTILES = (50, 90, 99)
+SYNTHETIC_JPEG_QUALITY = 80
+PIXEL_LEVELS = 256
+BAR_WIDTH_RATIO = 20  # the moving bar covers 1/20 of the frame width
+KIB = 1024
+DEFAULT_DURATION_SEC = 30
+
+ANNOTATIONS = 'annotations'
+PLAIN = '{0}'
+ONE_DECIMAL = '{0:.1f}'
+NO_DECIMALS = '{0:.0f}'
+# measurement and its format per column of the table
+TABLE_COLUMNS = (
+    ('resolution', PLAIN),
+    ('framerate', PLAIN),
+    ('codec', PLAIN),
+    (ANNOTATIONS, PLAIN),
+    ('fps', ONE_DECIMAL),
+    ('latency_p50_ms', ONE_DECIMAL),
+    ('latency_p90_ms', ONE_DECIMAL),
+    ('latency_p99_ms', ONE_DECIMAL),
+    ('frames_dropped', PLAIN),
+    ('cpu_python_percent', NO_DECIMALS),
+    ('cpu_ffmpeg_percent', NO_DECIMALS),
+    ('rss_python_mib', NO_DECIMALS),
+    ('rss_ffmpeg_mib', NO_DECIMALS),
+)
+
+
+class SyntheticMjpegHandler(QuietRequestHandler):
+    """Serve an endless synthetic MJPEG stream.
+
+    The query string sets the stream properties, e.g.
+    /stream.mjpg?width=640&height=480&fps=24. One second of distinct frames
+    is encoded once per resolution and then served in a loop, so serving
+    the stream costs almost no CPU.
+    """
+
+    _frames: Dict[Tuple[int, int, int], List[bytes]] = {}
+    _frames_lock = Lock()
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Stream JPEG frames at the requested framerate until disconnect."""
+        width, height, fps = _parse_stream_query(self.path)
+        frames = self._get_frames(width, height, fps)
+        send_mjpeg_headers(self)
+        try:
+            self._send_frames(frames, fps)
+        except ConnectionError:
+            return  # client disconnected
+
+    @classmethod
+    def _get_frames(cls, width: int, height: int, fps: int) -> List[bytes]:
+        with cls._frames_lock:
+            if (width, height, fps) not in cls._frames:
+                cls._frames[(width, height, fps)] = _render_frames(
+                    width, height, fps,
+                )
+            return cls._frames[(width, height, fps)]
+
+    def _send_frames(self, frames: List[bytes], fps: int) -> None:
+        next_frame_at = time.monotonic()
+        for jpeg in itertools.cycle(frames):
+            send_mjpeg_frame(self, jpeg)
+            next_frame_at += 1 / fps
+            time.sleep(max(next_frame_at - time.monotonic(), 0))
+
+
+def _parse_stream_query(path: str) -> Tuple[int, int, int]:
+    query = parse_qs(urlparse(path).query)
+    return (
+        int(query.get('width', ['640'])[0]),
+        int(query.get('height', ['480'])[0]),
+        int(query.get('fps', ['24'])[0]),
+    )
+
+
+def _render_frames(width: int, height: int, count: int) -> List[bytes]:
+    # random noise keeps the encoder busy, a moving bar adds motion
+    rng = np.random.default_rng(0)
+    shape = (height, width, 3)
+    background = rng.integers(0, PIXEL_LEVELS, shape, dtype=np.uint8)
+    bar_width = max(width // BAR_WIDTH_RATIO, 1)
+    return [
+        _encode_frame(background, index * width // count, bar_width)
+        for index in range(count)
+    ]
+
+
+def _encode_frame(background: Any, bar_x: int, bar_width: int) -> bytes:
+    frame = background.copy()
+    frame[:, bar_x:bar_x + bar_width] = (0, 0, 255)
+    return cv2.imencode(
+        '.jpg',
+        frame,
+        [cv2.IMWRITE_JPEG_QUALITY, SYNTHETIC_JPEG_QUALITY],
+    )[1].tobytes()
+
+
+def _percentile(samples: Sequence[float], percent: int) -> float:
+    if not samples:
+        return math.nan
+    return float(np.percentile(samples, percent))
+
+
+class LatencyRecorder(Recorder):
+    """Recorder keeping the latency of every encoded frame.
+
+    Attributes:
+        latencies: Seconds from reading each frame until it was encoded.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Open the video source and the segmented output.
+
+        Args:
+            args: Positional arguments of Recorder.
+            kwargs: Keyword arguments of Recorder.
+        """
+        super().__init__(*args, **kwargs)
+        self.latencies: List[float] = []
+
+    def _encode(self, frame: CapturedFrame) -> None:
+        super()._encode(frame)
+        self.latencies.append(time.monotonic() - frame.captured_at)
+
+
+def run_pipeline(duration: float) -> Measurements:  # noqa: WPS210
+    """Record the configured video source for a fixed duration.
+
+    Runs the recorder, annotator, and stages of minigugl.client with the
+    regular settings (VIDEO_SOURCE, OUTPUT_DIR, VIDEO_WIDTH, etc.) and a
+    fixed GPS fix, and measures latency from reading a frame until it has
+    been encoded.
+
+    Args:
+        duration: Recording duration in seconds.
+
+    Returns:
+        Dict with measured throughput, latency, and resource usage.
+    """
+    gps_coordinates = location.GpsCoordinates()
+    gps_coordinates.update(*SAMPLE_GPS_FIX)
+    annotator = client.Annotator(gps_coordinates)
+    drawtext_annotations = client.create_drawtext_annotations(annotator)
+    if drawtext_annotations:
+        drawtext_annotations.start()
+    recorders = client.create_recorders(
+        annotator, drawtext_annotations, recorder_class=LatencyRecorder,
+    )
+    recorder = cast(LatencyRecorder, recorders[0])
+    started_at = time.perf_counter()
+    recorder.start()
+    recorder.join(duration)
+    recorder.stop()  # like on SIGINT, queued frames are still encoded
+    recorder.join()
+    elapsed = time.perf_counter() - started_at
+    recorder.close()  # waits for FFmpeg, so its resource usage is included
+    if drawtext_annotations:
+        drawtext_annotations.stop()
+
+    pipeline = recorder.pipeline
+    own_usage = resource.getrusage(resource.RUSAGE_SELF)
+    ffmpeg_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    measurements: Measurements = {
+        'frames_in': pipeline.frames_in,
+        'frames_out': pipeline.frames_out,
+        'frames_dropped': pipeline.dropped,
+        'fps': pipeline.frames_out / elapsed,
+        'cpu_python_percent': (
+            100 * (own_usage.ru_utime + own_usage.ru_stime) / elapsed
+        ),
+        'cpu_ffmpeg_percent': (
+            100 * (ffmpeg_usage.ru_utime + ffmpeg_usage.ru_stime) / elapsed
+        ),
+        'rss_python_mib': own_usage.ru_maxrss / KIB,  # ru_maxrss is in KiB
+        'rss_ffmpeg_mib': ffmpeg_usage.ru_maxrss / KIB,
+    }
+    for percent in LATENCY_PERCENTILES:
+        measurements['latency_p{0}_ms'.format(percent)] = 1000 * _percentile(
+            recorder.latencies, percent,
+        )
+    return measurements
+
+
+def _build_env(
+    source_url: str,
+    resolution: Resolution,
+    framerate: int,
+    codec: str,
+    annotate: bool,
+) -> Dict[str, str]:
+    width, height = resolution
+    env = {
+        **os.environ,
+        'VIDEO_SOURCE': '{0}?width={1}&height={2}&fps={3}'.format(
+            source_url, width, height, framerate,
+        ),
+        'VIDEO_WIDTH': str(width),
+        'VIDEO_HEIGHT': str(height),
+        'VIDEO_FRAMERATE': str(framerate),
+        'VIDEO_CODEC': codec,
+        'RECORDING_MODE': 'decode',
+    }
+    if not annotate:
+        # an empty layout skips the annotation stage
+        env.update({
+            'ANNOTATION_BACKEND': 'opencv',
+            'ANNOTATION_LAYOUT': json.dumps({}),
+        })
+    env.pop('CAMERAS', None)
+    return env
+
+
+def _run_combination(  # noqa: WPS211
+    source_url: str,
+    resolution: Resolution,
+    framerate: int,
+    codec: str,
+    annotate: bool,
+    duration: float,
+) -> Measurements:
+    env = _build_env(source_url, resolution, framerate, codec, annotate)
+    with tempfile.TemporaryDirectory(prefix='minigugl-benchmark-') as tmp:
+        completed = subprocess.run(  # noqa: S603
+            [
+                sys.executable,
+                '-m',
+                'minigugl.benchmark',
+                '--child',
+                '--duration',
+                str(duration),
+            ],
+            env={**env, 'OUTPUT_DIR': tmp},
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+    measurements: Measurements = json.loads(
+        completed.stdout.decode().splitlines()[-1],
+    )
+    measurements.update({
+        'resolution': '{0}x{1}'.format(*resolution),
+        'framerate': framerate,
+        'codec': codec,
+        ANNOTATIONS: annotate,
+    })
+    return measurements
+
+
+def _format_table(runs: Sequence[Measurements]) -> str:
+    rows = [[name for name, _ in TABLE_COLUMNS]]
+    rows.extend(_format_row(measurements) for measurements in runs)
+    widths = [max(map(len, column)) for column in zip(*rows)]
+    return '\n'.join(_align_row(row, widths) for row in rows)
+
+
+def _format_row(measurements: Measurements) -> List[str]:
+    return [
+        template.format(measurements[name])
+        for name, template in TABLE_COLUMNS
+    ]
+
+
+def _align_row(row: List[str], widths: List[int]) -> str:
+    cells = (cell.rjust(width) for cell, width in zip(row, widths))
+    return '  '.join(cells)
+
+
+def _parse_resolution(resolution: str) -> Resolution:
+    width, height = resolution.lower().split('x')
+    return int(width), int(height)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m minigugl.benchmark',
+        description='Measure sustained recording throughput.',
+    )
+    parser.add_argument(
+        '--duration', type=float, default=DEFAULT_DURATION_SEC,
+    )
+    parser.add_argument(
+        '--resolution',
+        nargs='+',
+        type=_parse_resolution,
+        default=[(640, 480)],
+        help='one or more WIDTHxHEIGHT values',
+    )
+    parser.add_argument('--framerate', nargs='+', type=int, default=[24])
+    parser.add_argument('--codec', nargs='+', default=['libx264'])
+    parser.add_argument(
+        '--annotations',
+        dest=ANNOTATIONS,
+        action='store_const',
+        const=[True],
+        default=[True, False],
+        help='only benchmark with annotations (default: with and without)',
+    )
+    parser.add_argument(
+        '--no-annotations',
+        dest=ANNOTATIONS,
+        action='store_const',
+        const=[False],
+        help='only benchmark without annotations',
+    )
+    parser.add_argument('--json', action='store_true', help='print JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the benchmark sweep and print the results."""
+    args = _parse_args()
+    if args.child:
+        measurements = run_pipeline(args.duration)
+        sys.stdout.write('{0}\n'.format(json.dumps(measurements)))
+        return
+    server = serve_in_thread(SyntheticMjpegHandler, '127.0.0.1', 0)
+    source_url = 'http://127.0.0.1:{0}/stream.mjpg'.format(
+        server.server_address[1],
+    )
+    runs = _run_sweep(source_url, args)
+    server.shutdown()
+    if args.json:
+        sys.stdout.write('{0}\n'.format(json.dumps(runs, indent=2)))
+    else:
+        sys.stdout.write('{0}\n'.format(_format_table(runs)))
+
+
+def _run_sweep(
+    source_url: str,
+    args: argparse.Namespace,
+) -> List[Measurements]:
+    return [
+        _run_combination(
+            source_url,
+            resolution,
+            framerate,
+            codec,
+            annotate,
+            args.duration,
+        )
+        for resolution, framerate, codec, annotate in itertools.product(
+            args.resolution, args.framerate, args.codec, args.annotations,
+        )
+    ]
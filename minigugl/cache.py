@@ -0,0 +1,77 @@
+"""Bounded, thread-safe least recently used (LRU) cache."""
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Generic, Hashable, TypeVar
+
+CachedValue = TypeVar('CachedValue')
+
+
+class LruCache(Generic[CachedValue]):
+    """Thread-safe mapping with least recently used eviction.
+
+    In contrast to functools.lru_cache(), the size can be set at runtime and
+    values are created through a factory passed in on lookup.
+
+    Attributes:
+        maxsize: Maximum number of entries before the oldest get evicted.
+        hits: Number of lookups served from the cache.
+        misses: Number of lookups that required the factory.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        """Initialize empty cache.
+
+        Args:
+            maxsize: Maximum number of entries kept in the cache.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, CachedValue]' = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        """Get the number of cached entries.
+
+        Returns:
+            Number of entries as int.
+        """
+        return len(self._entries)
+
+    def get(
+        self,
+        key: Hashable,
+        factory: Callable[[], CachedValue],
+    ) -> CachedValue:
+        """Get a cached value or create it with the given factory.
+
+        The factory is called outside of the internal lock, so concurrent
+        misses for the same key might create the value more than once.
+
+        Args:
+            key: Hashable key of the cache entry.
+            factory: Callable without arguments creating a missing value.
+
+        Returns:
+            The cached or newly created value.
+        """
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                return self._entries[key]
+        cached_value = factory()
+        with self._lock:
+            self._entries[key] = cached_value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return cached_value
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,449 @@
+r"""Catalog of recorded segments in SQLite for time and location queries.
+
+Each camera's completed segments are added as they roll over, with their
+wall-clock time range, frame count, size, and GPS bounding box. Segments
+are indexed by start time and by bounding box (R*Tree if available), so
+queries take logarithmic time regardless of the number of segments.
+
+Example:
+    python -m minigugl.catalog /data/front \
+        --from 2021-04-14T14:03 --to 2021-04-14T14:07
+    python -m minigugl.catalog /data/front --near 37.7749 -122.4194
+"""
+import argparse
+import math
+import sqlite3
+import sys
+from collections import deque
+from pathlib import Path
+from threading import Lock
+from typing import Deque, Iterable, List, NamedTuple, Optional, Tuple
+
+import arrow
+
+from minigugl.segments import Segment
+from minigugl.track import GpsFix
+
+CATALOG_FILENAME = '.minigugl-catalog.sqlite3'
+METERS_PER_DEGREE = 111320  # length of a degree of latitude
+DEFAULT_RADIUS_M = 100
+MIN_COS_LAT = 1e-6  # avoids dividing by zero at the poles
+
+# min_lat, max_lat, min_lon, max_lon
+Bounds = Tuple[float, float, float, float]
+
+SEGMENTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS segments (
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL,
+        camera TEXT NOT NULL,
+        start REAL NOT NULL,
+        end REAL NOT NULL,
+        frames INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )
+"""
+# longest segment duration, to bound time range queries on start
+META_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    )
+"""
+SCHEMA = (
+    SEGMENTS_SCHEMA,
+    'CREATE INDEX IF NOT EXISTS segments_start ON segments (start)',
+    META_SCHEMA,
+)
+RTREE_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS segment_bounds USING rtree (
+        id, min_lat, max_lat, min_lon, max_lon
+    )
+"""
+# fallback if SQLite lacks the R*Tree module
+BOUNDS_TABLE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS segment_bounds (
+        id INTEGER PRIMARY KEY,
+        min_lat REAL, max_lat REAL, min_lon REAL, max_lon REAL
+    )
+"""
+BOUNDS_INDEX_SCHEMA = """
+    CREATE INDEX IF NOT EXISTS segment_bounds_lat ON segment_bounds (min_lat)
+"""
+TABLE_SCHEMA = (BOUNDS_TABLE_SCHEMA, BOUNDS_INDEX_SCHEMA)
+INSERT_SEGMENT = """
+    INSERT INTO segments (path, camera, start, end, frames, size)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+UPDATE_MAX_DURATION = """
+    INSERT OR REPLACE INTO meta (key, value)
+    VALUES ('max_duration', max(?, coalesce(
+        (SELECT value FROM meta WHERE key = 'max_duration'), 0
+    )))
+"""
+# range scan on the start index, bounded by the longest segment
+SELECT_BETWEEN = """
+    SELECT path, camera, start, end, frames, size,
+        min_lat, max_lat, min_lon, max_lon
+    FROM segments
+    LEFT JOIN segment_bounds USING (id)
+    WHERE start BETWEEN ? AND ? AND end >= ?
+    ORDER BY start
+"""
+SELECT_NEAR = """
+    SELECT path, camera, start, end, frames, size,
+        min_lat, max_lat, min_lon, max_lon
+    FROM segment_bounds
+    JOIN segments USING (id)
+    WHERE max_lat >= ? AND min_lat <= ?
+    AND max_lon >= ? AND min_lon <= ?
+    ORDER BY start
+"""
+
+
+class CatalogEntry(NamedTuple):
+    """Segment as recorded in the catalog.
+
+    Attributes:
+        path: Path of the segment file.
+        camera: Name of the camera.
+        start: Wall-clock start time as UNIX timestamp.
+        end: Wall-clock end time as UNIX timestamp.
+        frames: Number of frames.
+        size: File size in bytes.
+        bounds: GPS bounding box (min_lat, max_lat, min_lon, max_lon) or
+            None without GPS fix.
+    """
+
+    path: Path
+    camera: str
+    start: float
+    end: float
+    frames: int
+    size: int
+    bounds: Optional[Bounds]
+
+
+def _to_entry(row: sqlite3.Row) -> CatalogEntry:
+    bounds = None
+    if row['min_lat'] is not None:
+        bounds = (
+            row['min_lat'], row['max_lat'], row['min_lon'], row['max_lon'],
+        )
+    return CatalogEntry(
+        path=Path(row['path']),
+        camera=row['camera'],
+        start=row['start'],
+        end=row['end'],
+        frames=row['frames'],
+        size=row['size'],
+        bounds=bounds,
+    )
+
+
+class GpsHistory(object):
+    """Recent GPS positions to derive the bounding box of a segment.
+
+    Attributes:
+        max_age_sec: Time positions are kept for in seconds.
+    """
+
+    def __init__(self, max_age_sec: float) -> None:
+        """Initialize empty history.
+
+        Args:
+            max_age_sec: Time positions are kept for in seconds.
+        """
+        self.max_age_sec = max_age_sec
+        self._positions: Deque[Tuple[float, float, float]] = deque()
+        self._lock = Lock()
+
+    def on_fix(self, fix: GpsFix) -> None:
+        """Record a position, see GpsCoordinates.subscribe.
+
+        Args:
+            fix: GPS fix.
+        """
+        with self._lock:
+            self._positions.append((fix.time, fix.lat, fix.lon))
+            while self._positions[0][0] < fix.time - self.max_age_sec:
+                self._positions.popleft()
+
+    def get_bounds(self, start: float, end: float) -> Optional[Bounds]:
+        """Get the bounding box of all positions within a time range.
+
+        Args:
+            start: Start of the time range as UNIX timestamp.
+            end: End of the time range as UNIX timestamp.
+
+        Returns:
+            Bounding box (min_lat, max_lat, min_lon, max_lon) or None.
+        """
+        with self._lock:
+            positions = [
+                position
+                for position in self._positions
+                if start <= position[0] <= end
+            ]
+        if not positions:
+            return None
+        _, lats, lons = zip(*positions)
+        return min(lats), max(lats), min(lons), max(lons)
+
+
+class SegmentCatalog(object):
+    """SQLite catalog of segments, safe to use from multiple threads.
+
+    Attributes:
+        path: Path of the SQLite database file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Open (and create if necessary) the catalog database.
+
+        Args:
+            path: Path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = Lock()
+        self._connection = sqlite3.connect(
+            str(path), check_same_thread=False,
+        )
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+            try:
+                self._connection.execute(RTREE_SCHEMA)
+            except sqlite3.OperationalError:
+                for statement in TABLE_SCHEMA:  # noqa: WPS440
+                    self._connection.execute(statement)
+
+    def add(  # noqa: WPS211
+        self,
+        segment: Segment,
+        camera: str,
+        frames: int,
+        bounds: Optional[Bounds] = None,
+    ) -> None:
+        """Add or replace a segment.
+
+        Args:
+            segment: Completed segment.
+            camera: Name of the camera.
+            frames: Number of frames.
+            bounds: GPS bounding box (min_lat, max_lat, min_lon, max_lon).
+        """
+        with self._lock:
+            with self._connection:
+                self._delete(segment.path)
+                cursor = self._connection.execute(INSERT_SEGMENT, (
+                    str(segment.path),
+                    camera,
+                    segment.start,
+                    segment.end,
+                    frames,
+                    segment.size,
+                ))
+                if bounds is not None:
+                    self._connection.execute(
+                        'INSERT INTO segment_bounds VALUES (?, ?, ?, ?, ?)',
+                        (cursor.lastrowid, *bounds),
+                    )
+                self._connection.execute(
+                    UPDATE_MAX_DURATION, (segment.end - segment.start,),
+                )
+
+    def remove(self, segment: Segment) -> None:
+        """Remove a segment, e.g. after it got deleted.
+
+        Args:
+            segment: Segment to be removed.
+        """
+        with self._lock:
+            with self._connection:
+                self._delete(segment.path)
+
+    def between(self, start: float, end: float) -> List[CatalogEntry]:
+        """Find segments overlapping a time range.
+
+        Args:
+            start: Start of the time range as UNIX timestamp.
+            end: End of the time range as UNIX timestamp.
+
+        Returns:
+            Segments ordered by start time.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'max_duration'",
+            ).fetchone()
+            max_duration = row[0] if row else 0
+            rows = self._connection.execute(
+                SELECT_BETWEEN, (start - max_duration, end, start),
+            ).fetchall()
+        return [_to_entry(row) for row in rows]
+
+    def near(
+        self,
+        lat: float,
+        lon: float,
+        radius_m: float = DEFAULT_RADIUS_M,
+    ) -> List[CatalogEntry]:
+        """Find segments recorded within a radius around a position.
+
+        Args:
+            lat: GPS latitude.
+            lon: GPS longitude.
+            radius_m: Radius in meters.
+
+        Returns:
+            Segments whose bounding box intersects the radius' bounding box,
+            ordered by start time.
+        """
+        lat_delta = radius_m / METERS_PER_DEGREE
+        lon_delta = radius_m / (
+            METERS_PER_DEGREE * max(math.cos(math.radians(lat)), MIN_COS_LAT)
+        )
+        with self._lock:
+            rows = self._connection.execute(
+                SELECT_NEAR,
+                (
+                    lat - lat_delta,
+                    lat + lat_delta,
+                    lon - lon_delta,
+                    lon + lon_delta,
+                ),
+            ).fetchall()
+        return [_to_entry(row) for row in rows]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _delete(self, path: Path) -> None:
+        row = self._connection.execute(
+            'SELECT id FROM segments WHERE path = ?', (str(path),),
+        ).fetchone()
+        if row:
+            self._connection.execute(
+                'DELETE FROM segments WHERE id = ?', (row[0],),
+            )
+            self._connection.execute(
+                'DELETE FROM segment_bounds WHERE id = ?', (row[0],),
+            )
+
+
+class SegmentCataloger(object):
+    """Add the completed segments of a camera to a catalog.
+
+    Attributes:
+        catalog: Catalog the segments are added to.
+        camera: Name of the camera.
+    """
+
+    def __init__(
+        self,
+        catalog: SegmentCatalog,
+        camera: str,
+        framerate: int,
+        gps_history: Optional[GpsHistory] = None,
+    ) -> None:
+        """Initialize cataloger for a camera.
+
+        Args:
+            catalog: Catalog the segments are added to.
+            camera: Name of the camera.
+            framerate: Output framerate, to derive the number of frames.
+            gps_history: Recent GPS positions, None without GPS.
+        """
+        self.catalog = catalog
+        self.camera = camera
+        self._framerate = framerate
+        self._gps_history = gps_history
+
+    def on_segment(self, segment: Segment) -> None:
+        """Add a completed segment to the catalog, see SegmentWatcher.
+
+        Args:
+            segment: Completed segment.
+        """
+        bounds = None
+        if self._gps_history:
+            bounds = self._gps_history.get_bounds(segment.start, segment.end)
+        self.catalog.add(
+            segment,
+            camera=self.camera,
+            frames=round((segment.end - segment.start) * self._framerate),
+            bounds=bounds,
+        )
+
+
+def _parse_time(time_value: str) -> float:
+    # local time, like the segment filenames
+    return arrow.get(time_value, tzinfo='local').timestamp()
+
+
+def _format_entries(entries: Iterable[CatalogEntry]) -> str:
+    return '\n'.join(
+        '{0}\t{1}\t{2}\t{3}'.format(
+            arrow.get(entry.start).to('local').isoformat(),
+            arrow.get(entry.end).to('local').isoformat(),
+            entry.camera,
+            entry.path,
+        )
+        for entry in entries
+    )
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m minigugl.catalog',
+        description='Find recorded segments by time range or location.',
+    )
+    parser.add_argument('output_dir', type=Path)
+    parser.add_argument('--from', dest='start', type=_parse_time, default=0)
+    parser.add_argument(
+        '--to', dest='end', type=_parse_time, default=math.inf,
+    )
+    parser.add_argument(
+        '--near',
+        nargs=2,
+        type=float,
+        metavar=('LAT', 'LON'),
+        help='find segments recorded near a position',
+    )
+    parser.add_argument('--radius', type=float, default=DEFAULT_RADIUS_M)
+    return parser.parse_args()
+
+
+def _find_entries(
+    catalog: SegmentCatalog,
+    args: argparse.Namespace,
+) -> List[CatalogEntry]:
+    if not args.near:
+        return catalog.between(args.start, args.end)
+    lat, lon = args.near
+    return [
+        entry
+        for entry in catalog.near(lat, lon, radius_m=args.radius)
+        if entry.start <= args.end and entry.end >= args.start
+    ]
+
+
+def main() -> None:
+    """Query the catalog of an output directory and print the segments."""
+    args = _parse_args()
+    catalog_path = args.output_dir / CATALOG_FILENAME
+    if not catalog_path.exists():
+        sys.exit('No catalog found at {0}'.format(catalog_path))
+    catalog = SegmentCatalog(catalog_path)
+    entries = _find_entries(catalog, args)
+    catalog.close()
+    if entries:
+        sys.stdout.write('{0}\n'.format(_format_entries(entries)))
+
+
+if __name__ == '__main__':
+    main()
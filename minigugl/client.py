@@ -1,165 +1,512 @@
-"""Video stream client for Raspberry Pi-powered dash cam."""
+"""Video stream client for Raspberry Pi-powered dash cam.
+
+Nothing gets initialized on import. main() parses the settings, starts
+the GPS reader, and opens all cameras in parallel while the font loads.
+"""
+import math
 import signal
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional, Sequence, Type, Union
 
-import arrow
-import cv2
 from loguru import logger
-from vidgear.gears import VideoGear, WriteGear
 
-from minigugl import annotation, config
+from minigugl import (  # noqa: WPS235
+    annotation,
+    catalog,
+    clips,
+    clock,
+    config,
+    drawtext,
+    layout,
+    location,
+    metrics,
+    preview,
+    retention,
+    track,
+)
 from minigugl.log import setup_logging
+from minigugl.recorder import PassthroughRecorder, RecordedOutput, Recorder
 
-if config.settings.enable_gps:
-    from minigugl import location  # noqa: WPS433
+SHUTDOWN_TIMEOUT_SEC = 5
+GPS_VALUE_FIELDS = frozenset((layout.SPEED, layout.HEADING, layout.ALTITUDE))
+KMH_PER_MPS = 3.6
+# VideoGear decodes to and WriteGear (rgb_mode=False) encodes from BGR frames
+FRAME_COLOR_ORDER = annotation.BGR
 
-setup_logging(
-    log_level=config.settings.log_level,
-    log_format=config.settings.log_format,
-)
-
-opencv_options = {
-    'CAP_PROP_FRAME_WIDTH': config.settings.video_width,
-    'CAP_PROP_FRAME_HEIGHT': config.settings.video_height,
-    'CAP_PROP_FPS': config.settings.video_framerate,
-}
-stream = VideoGear(
-    source=config.settings.video_source,
-    **opencv_options,
-).start()
-
-# https://trac.ffmpeg.org/wiki/Encode/H.264
-# https://www.ffmpeg.org/ffmpeg-all.html#Codec-Options
-ffmpeg_options = {
-    '-c:v': config.settings.video_codec,
-    '-map': 0,  # map all streams from the first input to output
-    '-segment_time': config.settings.video_segment_length_sec,
-    '-g': config.settings.video_framerate,  # group of picture (GOP) size = fps
-    '-sc_threshold': 0,  # disable scene detection
-    '-force_key_frames': 'expr:gte(t,n_forced*{0})'.format(
-        # force key frame every x seconds
-        config.settings.video_segment_length_sec,
-    ),
-    # use `-clones` for `-f` parameter since WriteGear internally applies
-    # critical '-f rawvideo' parameter to every FFmpeg pipeline
-    '-clones': ['-f', 'segment'],  # enable segment muxer
-    '-input_framerate': config.settings.video_framerate,
-    '-r': config.settings.video_framerate,  # output framerate
-    '-pix_fmt': 'yuv420p',  # for output to work in QuickTime
-    '-reset_timestamps': 1,  # reset timestamps at beginning of each segment
-    '-strftime': 1,  # expand the segment filename with localtime
-}
-if config.settings.video_codec == 'libx264':
-    ffmpeg_options.update({
-        '-crf': 22,  # constant rate factor, decides quality
-        '-preset': 'fast',  # preset for encoding speed/compression ratio
-        '-tune': 'zerolatency',  # fast encoding and low-latency streaming
-    })
-Path(config.settings.output_dir).mkdir(parents=True, exist_ok=True)
-writer = WriteGear(
-    # Example: video_2021-04-14_20-15-30.mp4
-    # April 14th, 2021, at 8:15:30pm
-    output_filename=str(
-        Path(
-            config.settings.output_dir,
-        ) / 'video_%Y-%m-%d_%H-%M-%S.mp4',  # noqa: WPS323
-    ),
-    logging=True,
-    **ffmpeg_options,
-)
+AnyRecorder = Union[Recorder, PassthroughRecorder]
 
 
-def _signal_handler(signalnum: int, _: Any) -> None:
+def _signal_handler(
+    recorders: Sequence[AnyRecorder],
+    drawtext_annotations: Optional[drawtext.DrawtextAnnotations],
+    signalnum: int,
+    _: Any,
+) -> None:
     """Handle signal from user interruption (e.g. CTRL+C).
 
     Logs an error message and exits with non-zero exit code. Args are ignored.
 
     Args:
+        recorders: Recorders to be stopped.
+        drawtext_annotations: Annotations drawn by FFmpeg to be stopped
+            once FFmpeg exited, None without.
         signalnum: Recevied signal number.
     """
     logger.info('Received signal: {0}', signal.Signals(signalnum).name)
-    # safely close video stream & writer
-    stream.stop()
-    writer.close()
+    # safely close video streams & writers after queued frames are written
+    for recorder in recorders:
+        recorder.stop()
+    for recorder in recorders:  # noqa: WPS440
+        recorder.join(timeout=SHUTDOWN_TIMEOUT_SEC)
+        recorder.close()
+    if drawtext_annotations:
+        drawtext_annotations.stop()
     sys.exit(0)
 
 
-# Register handler for (keyboard) interrupts
-signal.signal(signal.SIGINT, _signal_handler)
-signal.signal(signal.SIGTERM, _signal_handler)
+def _clip_signal_handler(
+    clip_buffers: Sequence[clips.ClipBuffer],
+    signalnum: int,
+    _: Any,
+) -> None:
+    """Handle signal to export a clip from each camera's clip buffer.
+
+    Args:
+        clip_buffers: Clip buffers of all cameras.
+        signalnum: Recevied signal number.
+    """
+    logger.info('Received signal: {0}', signal.Signals(signalnum).name)
+    for clip_buffer in clip_buffers:
+        clip_buffer.trigger()
+
+
+def _format_gps_value(value_format: str, gps_value: float) -> Optional[str]:
+    return None if math.isnan(gps_value) else value_format.format(gps_value)
 
 
-def _add_text_annotations(
-    img: Any,
-    top_left: Optional[str] = None,
-    top_right: Optional[str] = None,
-    bottom_left: Optional[str] = None,
-    bottom_right: Optional[str] = None,
-) -> Any:
-    if not any([top_left, top_right, bottom_left, bottom_right]):
-        return img
+class Annotator(object):
+    """Annotations of frames and captions, shared by all cameras.
+
+    Attributes:
+        gps_coordinates: Latest GPS coordinates, None without GPS.
+        layout: Lines per corner, geometry resolved once per frame size.
+    """
 
-    alpha = 0.7  # opacity level
-    overlay = img.copy()  # to allow opacity
-    override_text_height = config.settings.annotation_override_text_height
+    def __init__(
+        self,
+        gps_coordinates: Optional[location.GpsCoordinates] = None,
+    ) -> None:
+        """Set up layout and timestamp formatting without loading the font.
 
-    if top_left:
-        annotation.add_annotation_top_left(
-            frame=overlay,
-            text=top_left,
-            override_text_height=override_text_height,
+        Args:
+            gps_coordinates: Latest GPS coordinates, None without GPS.
+        """
+        self.gps_coordinates = gps_coordinates
+        self.layout = layout.AnnotationLayout(
+            config.settings.annotation_layout,
+            opacity=annotation.to_fixed_opacity(
+                config.settings.annotation_opacity,
+            ),
+            color_order=FRAME_COLOR_ORDER,
         )
-    if top_right:
-        annotation.add_annotation_top_right(
-            overlay,
-            top_right,
-            override_text_height=override_text_height,
+        # timestamps are formatted once per second
+        self._wall_clock = clock.WallClock()
+        self._timestamp_formatter = clock.TimestampFormatter(
+            config.settings.annotation_timestamp_format,
+            precision=config.settings.annotation_timestamp_precision,
         )
-    if bottom_left:
-        annotation.add_annotation_bottom_left(
-            overlay,
-            bottom_left,
-            override_text_height=override_text_height,
+
+    def get_timestamp(self, wall_time: Optional[float] = None) -> str:
+        """Format a wall-clock time, the current time by default.
+
+        Args:
+            wall_time: Wall-clock time as UNIX timestamp.
+
+        Returns:
+            Formatted timestamp.
+        """
+        return self._timestamp_formatter.format(
+            time.time() if wall_time is None else wall_time,
         )
-    if bottom_right:
-        annotation.add_annotation_bottom_right(
-            overlay,
-            bottom_right,
-            override_text_height=override_text_height,
+
+    def get_location(self) -> Optional[str]:
+        """Get the latest GPS coordinates in DMS.
+
+        Returns:
+            GPS coordinates or None without GPS.
+        """
+        if self.gps_coordinates is None:
+            return None
+        # single reference read of the precomputed text, without any locking
+        return self.gps_coordinates.snapshot.dms
+
+    def get_caption(self) -> str:
+        """Get timestamp and optionally GPS coordinates as subtitles.
+
+        Returns:
+            Caption for the current time.
+        """
+        return '\n'.join(filter(None, (
+            self.get_timestamp(), self.get_location(),
+        )))
+
+    def annotate_frame(
+        self,
+        frame: clock.CapturedFrame,
+        camera_name: str,
+    ) -> clock.CapturedFrame:
+        """Draw the annotations onto a captured frame in place.
+
+        Args:
+            frame: Captured frame in BGR channel order.
+            camera_name: Name of the camera for the camera field.
+
+        Returns:
+            The annotated frame.
+        """
+        self.layout.draw(frame.image, self._get_field_values(
+            frame, camera_name,
+        ))
+        return frame
+
+    def _get_field_values(
+        self,
+        frame: clock.CapturedFrame,
+        camera_name: str,
+    ) -> Dict[str, Optional[str]]:
+        # only the fields used by the layout are formatted
+        fields = self.layout.fields
+        field_values: Dict[str, Optional[str]] = {layout.CAMERA: camera_name}
+        if layout.TIME in fields:
+            field_values[layout.TIME] = self.get_timestamp(
+                self._wall_clock.to_wall(frame.captured_at),
+            )
+        if layout.LOCATION in fields:
+            field_values[layout.LOCATION] = self.get_location()
+        if self.gps_coordinates and fields & GPS_VALUE_FIELDS:
+            snapshot = self.gps_coordinates.snapshot
+            field_values.update({
+                layout.SPEED: _format_gps_value(
+                    '{0:.0f} km/h', snapshot.speed * KMH_PER_MPS,
+                ),
+                layout.HEADING: _format_gps_value('{0:.0f}°', snapshot.track),
+                layout.ALTITUDE: _format_gps_value('{0:.0f} m', snapshot.alt),
+            })
+        return field_values
+
+
+def create_drawtext_annotations(
+    annotator: Annotator,
+) -> Optional[drawtext.DrawtextAnnotations]:
+    """Create the annotations drawn by FFmpeg, if configured.
+
+    Args:
+        annotator: Annotator providing the GPS coordinates.
+
+    Returns:
+        Drawtext annotations, None with ANNOTATION_BACKEND=opencv.
+    """
+    if config.settings.annotation_backend != config.AnnotationBackend.FFMPEG:
+        return None
+    # FFmpeg expands the timestamp and reloads the GPS coordinates per frame
+    return drawtext.DrawtextAnnotations(
+        timestamp_corner=drawtext.BOTTOM_LEFT,
+        text_sources=(
+            {drawtext.BOTTOM_RIGHT: annotator.get_location}
+            if annotator.gps_coordinates
+            else {}
+        ),
+        interval_sec=config.settings.gps_interval_sec,
+    )
+
+
+def _create_recorder(
+    camera: config.CameraSettings,
+    annotator: Annotator,
+    drawtext_annotations: Optional[drawtext.DrawtextAnnotations],
+    recorder_class: Type[Recorder],
+) -> AnyRecorder:
+    video_filter = (
+        drawtext_annotations.video_filter if drawtext_annotations else None
+    )
+    if camera.recording_mode == config.RecordingMode.PASSTHROUGH:
+        return PassthroughRecorder(
+            camera,
+            caption=annotator.get_caption,
+            video_filter=video_filter,
         )
+    # an empty layout skips the annotation stage
+    skip_annotation = drawtext_annotations is not None or not any(
+        annotator.layout.corners.values(),
+    )
+    return recorder_class(
+        camera,
+        annotate=None if skip_annotation else partial(
+            annotator.annotate_frame, camera_name=camera.name,
+        ),
+        video_filter=video_filter,
+    )
 
-    return cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0)
 
+def create_recorders(
+    annotator: Annotator,
+    drawtext_annotations: Optional[drawtext.DrawtextAnnotations],
+    recorder_class: Type[Recorder] = Recorder,
+) -> List[AnyRecorder]:
+    """Open all cameras in parallel while the font loads.
 
-if __name__ == '__main__':
-    if config.settings.enable_gps:
-        gps_coordinates = location.start_gps_thread()
-
-    while True:
-        frame = stream.read()  # read frames from stream
-
-        # check for frame if None-type
-        if frame is None:
-            break
-
-        # explicit conversion of color space because of
-        # https://github.com/opencv/opencv/issues/18120
-        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # add text annotations: timestamp and optionally GPS coordinates
-        img = _add_text_annotations(
-            img,
-            bottom_left=arrow.now().format(arrow.FORMAT_RFC2822),
-            bottom_right=(
-                str(gps_coordinates)
-                if config.settings.enable_gps
-                else None
+    Args:
+        annotator: Annotator shared by all cameras.
+        drawtext_annotations: Annotations drawn by FFmpeg, None to draw
+            them in Python.
+        recorder_class: Recorder (sub)class used for decoding cameras.
+
+    Returns:
+        One recorder per camera, not started yet.
+    """
+    # one recorder per camera, all sharing font, text tiles, and GPS reader
+    cameras = config.settings.resolve_cameras()
+    with ThreadPoolExecutor(max_workers=len(cameras) + 1) as executor:
+        if not drawtext_annotations:
+            executor.submit(annotation.get_font)  # while cameras are opened
+        return list(executor.map(
+            partial(
+                _create_recorder,
+                annotator=annotator,
+                drawtext_annotations=drawtext_annotations,
+                recorder_class=recorder_class,
             ),
+            cameras,
+        ))
+
+
+def _start_catalogs(
+    outputs: Sequence[RecordedOutput],
+    gps_coordinates: Optional[location.GpsCoordinates],
+) -> Dict[str, catalog.SegmentCatalog]:
+    # one catalog per output directory, shared by its cameras
+    segment_catalogs: Dict[str, catalog.SegmentCatalog] = {}
+    gps_history = None
+    if gps_coordinates:
+        gps_history = catalog.GpsHistory(max_age_sec=2 * max(
+            output.camera.video_segment_length_sec for output in outputs
+        ))
+        gps_coordinates.subscribe(gps_history.on_fix)
+    for output in outputs:
+        output_dir = output.camera.output_dir
+        if output_dir not in segment_catalogs:
+            segment_catalogs[output_dir] = catalog.SegmentCatalog(
+                Path(output_dir) / catalog.CATALOG_FILENAME,
+            )
+        cataloger = catalog.SegmentCataloger(
+            segment_catalogs[output_dir],
+            camera=output.camera.name,
+            framerate=output.camera.video_framerate,
+            gps_history=gps_history,
+        )
+        output.segments.subscribe(cataloger.on_segment)
+    return segment_catalogs
+
+
+def _start_track_sidecars(
+    outputs: Sequence[RecordedOutput],
+    gps_coordinates: location.GpsCoordinates,
+    track_format: config.TrackFormat,
+) -> None:
+    # each output keeps its own track, as segments roll over independently
+    for output in outputs:
+        track_sidecar = track.TrackSidecar(track_format)
+        gps_coordinates.subscribe(track_sidecar.track.on_fix)
+        output.segments.subscribe(track_sidecar.on_segment)
+
+
+def _start_retention(
+    outputs: Sequence[RecordedOutput],
+    segment_catalogs: Dict[str, catalog.SegmentCatalog],
+) -> None:
+    for output in outputs:
+        retention_manager = retention.RetentionManager(
+            Path(output.camera.output_dir),
+            output.camera.output_filename,
+            max_bytes=config.settings.retention_max_bytes,
+            max_percent=config.settings.retention_max_percent,
+        )
+        segment_catalog = segment_catalogs.get(output.camera.output_dir)
+        if segment_catalog:
+            retention_manager.subscribe(segment_catalog.remove)
+        output.segments.subscribe(retention_manager.start().on_segment)
+
+
+def _start_storage(
+    recorders: Sequence[AnyRecorder],
+    gps_coordinates: Optional[location.GpsCoordinates],
+) -> None:
+    # track sidecars, catalog, and retention of all recorded segments
+    outputs = [output for recorder in recorders for output in recorder.outputs]
+    if gps_coordinates and config.settings.gps_track_format:
+        _start_track_sidecars(
+            outputs, gps_coordinates, config.settings.gps_track_format,
+        )
+    segment_catalogs = (
+        _start_catalogs(outputs, gps_coordinates)
+        if config.settings.enable_catalog
+        else {}
+    )
+    quotas = (
+        config.settings.retention_max_bytes,
+        config.settings.retention_max_percent,
+    )
+    if any(quotas):
+        _start_retention(outputs, segment_catalogs)
+
+
+def _start_servers(
+    recorders: Sequence[AnyRecorder],
+    clip_buffers: Sequence[clips.ClipBuffer],
+) -> None:
+    pipelines = [
+        recorder.pipeline for recorder in recorders if recorder.pipeline
+    ]
+    if config.settings.metrics_port:
+        metrics.start_metrics_server(
+            pipelines,
+            host=config.settings.metrics_host,
+            port=config.settings.metrics_port,
+        )
+    if config.settings.metrics_log_interval_sec > 0:
+        metrics.start_metrics_logger(
+            pipelines,
+            interval_sec=config.settings.metrics_log_interval_sec,
+        )
+    previews = [recorder.preview for recorder in recorders if recorder.preview]
+    if previews and config.settings.preview_port:
+        preview.start_preview_server(
+            previews,
+            host=config.settings.preview_host,
+            port=config.settings.preview_port,
+        )
+    if clip_buffers and config.settings.clip_port:
+        clips.start_clip_server(
+            clip_buffers,
+            host=config.settings.clip_host,
+            port=config.settings.clip_port,
         )
 
-        # conversion back to original color space
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
 
-        writer.write(img)
+def _report_first_frames(
+    unreported: List[AnyRecorder],
+    started_at: float,
+) -> None:
+    for recorder in list(unreported):
+        if recorder.first_frame_at is not None:
+            unreported.remove(recorder)
+            logger.info(
+                '{0}: first frame recorded {1:.2f}s after startup',
+                recorder.camera.name,
+                recorder.first_frame_at - started_at,
+            )
+
+
+def _wait_for_recorders(
+    recorders: Sequence[AnyRecorder],
+    started_at: float,
+) -> None:
+    # report the time to the first recorded frame once per camera
+    unreported = list(recorders)
+    try:
+        while any(recorder.is_alive() for recorder in recorders):
+            for recorder in recorders:
+                recorder.join(timeout=1)
+            _report_first_frames(unreported, started_at)
+    except Exception:
+        # a recorder failed for good, the others finish their segments
+        _stop_recorders(recorders)
+        raise
+    _report_first_frames(unreported, started_at)
+
+
+def _stop_recorders(recorders: Sequence[AnyRecorder]) -> None:
+    for recorder in recorders:
+        recorder.stop()
+    for stopped in recorders:
+        while stopped.is_alive():
+            time.sleep(1)
+
+
+def _close_recorders(
+    recorders: Sequence[AnyRecorder],
+    drawtext_annotations: Optional[drawtext.DrawtextAnnotations],
+) -> None:
+    # safely close video streams & writers
+    for recorder in recorders:
+        recorder.close()
+    if drawtext_annotations:
+        drawtext_annotations.stop()
+
+
+def _start_recording(
+    recorders: Sequence[AnyRecorder],
+    drawtext_annotations: Optional[drawtext.DrawtextAnnotations],
+    gps_coordinates: Optional[location.GpsCoordinates],
+    started_at: float,
+) -> None:
+    clip_buffers = [
+        recorder.clip_buffer for recorder in recorders if recorder.clip_buffer
+    ]
+
+    # Register handler for (keyboard) interrupts
+    stop_handler = partial(_signal_handler, recorders, drawtext_annotations)
+    signal.signal(signal.SIGINT, stop_handler)
+    signal.signal(signal.SIGTERM, stop_handler)
+    # Register handler for clip exports, e.g. `kill -USR1 <pid>`
+    signal.signal(signal.SIGUSR1, partial(_clip_signal_handler, clip_buffers))
+
+    _start_storage(recorders, gps_coordinates)
+    for recorder in recorders:
+        recorder.start()
+    logger.info(
+        'Started {0} recorders in {1:.2f}s',
+        len(recorders),
+        time.monotonic() - started_at,
+    )
+    _start_servers(recorders, clip_buffers)
+
+
+def main() -> None:
+    """Record all cameras until their streams end or a signal arrives.
+
+    Raises:
+        Exception: If a recorder failed for good, after all recorders got
+            stopped and closed.
+    """
+    started_at = time.monotonic()
+    setup_logging(
+        log_level=config.settings.log_level,
+        log_format=config.settings.log_format,
+    )
+    gps_coordinates = (
+        location.start_gps_thread() if config.settings.enable_gps else None
+    )
+    annotator = Annotator(gps_coordinates)
+    drawtext_annotations = create_drawtext_annotations(annotator)
+    if drawtext_annotations:
+        drawtext_annotations.start()
+    recorders = create_recorders(annotator, drawtext_annotations)
+    _start_recording(
+        recorders, drawtext_annotations, gps_coordinates, started_at,
+    )
+    try:
+        _wait_for_recorders(recorders, started_at)
+    except Exception:
+        _close_recorders(recorders, drawtext_annotations)
+        raise
+    # all streams ended
+    _close_recorders(recorders, drawtext_annotations)
+
+
+if __name__ == '__main__':
+    main()
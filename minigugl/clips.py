@@ -0,0 +1,289 @@
+"""In-memory ring buffer of encoded video for exporting incident clips.
+
+FFmpeg writes the encoded video as MPEG-TS to its stdout, in addition to
+the segmented output (tee muxer), so the buffer holds exactly what gets
+recorded. On a trigger, the buffered past plus the next seconds are
+remuxed into a standalone MP4 clip without encoding again.
+"""
+import json
+import os
+import queue
+import subprocess  # noqa: S404
+import time
+from collections import deque
+from http import HTTPStatus
+from pathlib import Path
+from threading import Lock, Thread, Timer
+from typing import IO, Deque, List, Sequence, Tuple
+
+from loguru import logger
+
+from minigugl.server import (
+    QuietRequestHandler,
+    ThreadingHTTPServer,
+    serve_in_thread,
+)
+
+# tee output sending the encoded video to stdout, which must never stall
+# or break the regular output
+CLIP_TEE_OUTPUT = '[f=mpegts:onfail=ignore]pipe:1'
+CHUNK_SIZE = 65536  # bytes per read, 64 KiB
+CLIP_FILENAME = '{0}_%Y-%m-%d_%H-%M-%S.mp4'  # noqa: WPS323
+
+# no encoding, leading non-key frames are skipped
+REMUX_OPTIONS = (
+    '-hide_banner',
+    '-loglevel',
+    'error',
+    '-f',
+    'mpegts',
+    '-i',
+    'pipe:0',
+    '-map',
+    '0',
+    '-c',
+    'copy',
+    '-movflags',
+    '+faststart',
+)
+
+# Marker ending the input of a clip export
+END_OF_CLIP = b''
+
+
+class ClipExport(object):
+    """Remux buffered and live MPEG-TS chunks into an MP4 file.
+
+    Chunks are queued and fed to FFmpeg in a separate thread, so a slow
+    export never blocks reading from the recording FFmpeg.
+
+    Attributes:
+        path: Path of the clip file.
+        deadline: Monotonic time after which no more chunks are added.
+    """
+
+    def __init__(self, path: Path, deadline: float, ffmpeg_path: str) -> None:
+        """Start FFmpeg remuxing to the clip file.
+
+        Args:
+            path: Path of the clip file.
+            deadline: Monotonic time after which no more chunks are added.
+            ffmpeg_path: Path to the FFmpeg executable.
+        """
+        self.path = path
+        self.deadline = deadline
+        self._chunks: 'queue.Queue[bytes]' = queue.Queue()
+        self._process = subprocess.Popen(  # noqa: S603
+            [ffmpeg_path, *REMUX_OPTIONS, str(path)],
+            stdin=subprocess.PIPE,
+        )
+        self._thread = Thread(
+            target=self._run,
+            name='clip-{0}'.format(path.name),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def add(self, chunk: bytes) -> None:
+        """Queue a chunk of MPEG-TS data for the clip.
+
+        Args:
+            chunk: MPEG-TS data.
+        """
+        self._chunks.put(chunk)
+
+    def finish(self) -> None:
+        """Finalize the clip once all queued chunks are written."""
+        self._chunks.put(END_OF_CLIP)
+
+    def join(self) -> None:
+        """Wait for the clip file to be written completely."""
+        self._thread.join()
+
+    def _run(self) -> None:
+        stdin = self._process.stdin
+        try:
+            while True:  # noqa: WPS457
+                chunk = self._chunks.get()
+                if chunk == END_OF_CLIP:
+                    break
+                stdin.write(chunk)  # type: ignore
+        except BrokenPipeError:
+            logger.error('Clip export of {0} failed', self.path)
+        finally:
+            stdin.close()  # type: ignore
+        self._process.wait()
+        logger.info('Saved clip {0}', self.path)
+
+
+class ClipBuffer(object):  # noqa: WPS214, WPS230
+    """Ring buffer of the most recent encoded video of a camera.
+
+    The buffer is bounded by both duration and size, whichever is reached
+    first. Chunks are kept as read from FFmpeg, without parsing.
+
+    Attributes:
+        name: Name of the camera, used for clip filenames.
+        clip_dir: Directory for exported clips.
+        size: Number of bytes currently buffered.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        name: str,
+        clip_dir: Path,
+        max_sec: float,
+        max_bytes: int,
+        post_event_sec: float,
+        ffmpeg_path: str = 'ffmpeg',
+    ) -> None:
+        """Initialize empty buffer.
+
+        Args:
+            name: Name of the camera, used for clip filenames.
+            clip_dir: Directory for exported clips.
+            max_sec: Maximum duration of buffered video in seconds.
+            max_bytes: Maximum size of buffered video in bytes.
+            post_event_sec: Duration recorded after a trigger in seconds.
+            ffmpeg_path: Path to the FFmpeg executable.
+        """
+        self.name = name
+        self.clip_dir = clip_dir
+        self.size = 0
+        self._max_sec = max_sec
+        self._max_bytes = max_bytes
+        self._post_event_sec = post_event_sec
+        self._ffmpeg_path = ffmpeg_path
+        self._chunks: Deque[Tuple[float, bytes]] = deque()
+        self._exports: List[ClipExport] = []
+        self._lock = Lock()
+
+    def attach(self, stream: IO[bytes]) -> None:
+        """Read MPEG-TS data from a stream in a separate thread until EOF.
+
+        Called for every (re)started FFmpeg process of the camera.
+
+        Args:
+            stream: Stdout of FFmpeg writing MPEG-TS.
+        """
+        Thread(
+            target=self._read,
+            args=(stream,),
+            name='{0}-clip-buffer'.format(self.name),
+            daemon=True,
+        ).start()
+
+    def trigger(self) -> Path:
+        """Export the buffered video plus the post-event duration as clip.
+
+        Returns:
+            Path of the clip file, written completely after the
+            post-event duration.
+        """
+        self.clip_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            export = ClipExport(
+                self._unique_path(),
+                deadline=time.monotonic() + self._post_event_sec,
+                ffmpeg_path=self._ffmpeg_path,
+            )
+            for _, chunk in self._chunks:
+                export.add(chunk)
+            self._exports.append(export)
+        # finished on time even if FFmpeg stops writing, e.g. while idle
+        timer = Timer(self._post_event_sec, self._finish, args=(export,))
+        timer.daemon = True
+        timer.start()
+        logger.info('{0}: exporting clip {1}', self.name, export.path)
+        return export.path
+
+    def close(self) -> None:
+        """Finish all pending clip exports and wait for them."""
+        with self._lock:
+            exports = self._exports
+            self._exports = []
+        for export in exports:
+            export.finish()
+        for export in exports:  # noqa: WPS440
+            export.join()
+
+    def _unique_path(self) -> Path:
+        # triggers within the same second get numbered clips, instead of
+        # two FFmpeg processes writing the same file
+        path = self.clip_dir / time.strftime(CLIP_FILENAME.format(self.name))
+        pending = {export.path for export in self._exports}
+        unique_path = path
+        number = 0
+        while unique_path.exists() or unique_path in pending:
+            number += 1
+            unique_path = path.with_name('{0}_{1}{2}'.format(
+                path.stem, number, path.suffix,
+            ))
+        return unique_path
+
+    def _finish(self, export: ClipExport) -> None:
+        with self._lock:
+            if export not in self._exports:
+                return  # already finished by close()
+            self._exports.remove(export)
+        export.finish()
+
+    def _read(self, stream: IO[bytes]) -> None:
+        fd = stream.fileno()
+        while True:  # noqa: WPS457
+            chunk = os.read(fd, CHUNK_SIZE)  # returns as soon as data arrives
+            if not chunk:
+                break
+            self._append(chunk)
+        stream.close()
+
+    def _append(self, chunk: bytes) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._chunks.append((now, chunk))
+            self.size += len(chunk)
+            while self._chunks and self._is_over_limit(now):
+                self.size -= len(self._chunks.popleft()[1])
+            # chunks past the deadline are left to the export's timer
+            for export in self._exports:
+                if now <= export.deadline:
+                    export.add(chunk)
+
+    def _is_over_limit(self, now: float) -> bool:
+        oldest_at = self._chunks[0][0]
+        return self.size > self._max_bytes or oldest_at < now - self._max_sec
+
+
+def start_clip_server(
+    buffers: Sequence[ClipBuffer],
+    host: str,
+    port: int,
+) -> ThreadingHTTPServer:
+    """Export clips of all cameras on POST /clip.
+
+    Responds with a JSON list of the clip file paths.
+
+    Args:
+        buffers: Clip buffers (one per camera) to export from.
+        host: Host address to bind to.
+        port: Port to bind to.
+
+    Returns:
+        The running HTTP server.
+    """
+    class ClipHandler(QuietRequestHandler):  # noqa: WPS431
+        def do_POST(self) -> None:  # noqa: N802
+            if self.path.split('?')[0] != '/clip':
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            body = json.dumps(
+                [str(clip_buffer.trigger()) for clip_buffer in buffers],
+            ).encode()
+            self.send_response(HTTPStatus.ACCEPTED)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    logger.info('Accepting clip triggers on http://{0}:{1}/clip', host, port)
+    return serve_in_thread(ClipHandler, host, port)
@@ -0,0 +1,159 @@
+"""Capture timestamps of frames and their cached formatting.
+
+Frames are stamped with monotonic time as soon as they are read from the
+video source, so queueing and processing delays never shift the time
+shown in the video. Monotonic time is mapped to wall-clock time with an
+offset that gets refreshed regularly, following clock adjustments (e.g.
+NTP syncing on a Raspberry Pi without real-time clock).
+"""
+import math
+import re
+import time
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+import arrow
+
+RESYNC_SEC = 1
+MAX_PRECISION = 6  # microseconds
+# placeholder for sub-second digits within a formatted timestamp
+SUBSECOND_MARKER = '\x00'
+SECONDS_FIELD = 'ss'
+# escaped literal text or the seconds token, as tokenized by arrow
+FORMAT_TOKENS = re.compile(r'\[[^\]]*\]|{0}'.format(SECONDS_FIELD))
+
+Read = Callable[[], Optional[Any]]
+
+
+class CapturedFrame(NamedTuple):
+    """Frame with the time it was read from the video source.
+
+    Attributes:
+        image: Frame as OpenCV image (numpy array).
+        captured_at: Monotonic time of capture.
+    """
+
+    image: Any
+    captured_at: float
+
+
+def capture_frame(read: Read) -> Optional[CapturedFrame]:
+    """Read the next frame and stamp it with the current monotonic time.
+
+    Args:
+        read: Callable returning the next frame or None at the end.
+
+    Returns:
+        Captured frame or None at the end of the stream.
+    """
+    image = read()
+    if image is None:
+        return None
+    return CapturedFrame(image, time.monotonic())
+
+
+class WallClock(object):
+    """Map monotonic time to wall-clock time, safe to share across threads.
+
+    Attributes:
+        resync_sec: Interval in seconds to refresh the offset.
+    """
+
+    def __init__(self, resync_sec: float = RESYNC_SEC) -> None:
+        """Initialize with the current offset between both clocks.
+
+        Args:
+            resync_sec: Interval in seconds to refresh the offset.
+        """
+        self.resync_sec = resync_sec
+        self._sync = self._measure()
+
+    def to_wall(self, monotonic: float) -> float:
+        """Convert a monotonic time to wall-clock time.
+
+        Args:
+            monotonic: Time as returned by time.monotonic().
+
+        Returns:
+            Wall-clock time as UNIX timestamp.
+        """
+        synced_at, offset = self._sync
+        if time.monotonic() - synced_at > self.resync_sec:
+            synced_at, offset = self._measure()
+            self._sync = (synced_at, offset)  # replaced as a whole
+        return monotonic + offset
+
+    def _measure(self) -> Tuple[float, float]:
+        monotonic = time.monotonic()
+        return monotonic, time.time() - monotonic
+
+
+class TimestampFormatter(object):
+    """Format timestamps with arrow, memoized per second.
+
+    Only the first timestamp of every second gets formatted by arrow,
+    optional sub-second digits are inserted into the cached text after the
+    seconds. Safe to share across threads.
+
+    Attributes:
+        timestamp_format: Arrow format string.
+        precision: Number of sub-second digits (0-6).
+    """
+
+    def __init__(
+        self,
+        timestamp_format: str = arrow.FORMAT_RFC2822,
+        precision: int = 0,
+    ) -> None:
+        """Initialize formatter with an empty cache.
+
+        Args:
+            timestamp_format: Arrow format string.
+            precision: Number of sub-second digits (0-6).
+        """
+        self.timestamp_format = timestamp_format
+        self.precision = min(max(precision, 0), MAX_PRECISION)
+        self._scale = 10 ** self.precision
+        self._marked_format = timestamp_format
+        if self.precision:
+            self._marked_format = _mark_subseconds(timestamp_format)
+        # second and formatted text before and after the sub-second digits
+        self._cached: Tuple[int, str, str] = (-1, '', '')
+
+    def format(self, timestamp: float) -> str:  # noqa: WPS125
+        """Format a wall-clock time in the local timezone.
+
+        Args:
+            timestamp: Wall-clock time as UNIX timestamp.
+
+        Returns:
+            Formatted timestamp.
+        """
+        second = math.floor(timestamp)
+        cached_second, head, tail = self._cached
+        if second != cached_second:
+            head, _, tail = arrow.Arrow.fromtimestamp(second).format(
+                self._marked_format,
+            ).partition(SUBSECOND_MARKER)
+            self._cached = (second, head, tail)  # replaced as a whole
+        if not self.precision:
+            return head
+        fraction = int((timestamp - second) * self._scale)
+        return '{0}.{1:0{2}d}{3}'.format(
+            head, min(fraction, self._scale - 1), self.precision, tail,
+        )
+
+
+def _mark_subseconds(timestamp_format: str) -> str:
+    # escaped marker after the last seconds token outside of escaped
+    # literal text, or at the end
+    positions = [
+        match.end()
+        for match in FORMAT_TOKENS.finditer(timestamp_format)
+        if match.group() == SECONDS_FIELD
+    ]
+    position = positions[-1] if positions else len(timestamp_format)
+    return '{0}[{1}]{2}'.format(
+        timestamp_format[:position],
+        SUBSECOND_MARKER,
+        timestamp_format[position:],
+    )
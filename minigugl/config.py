@@ -1,7 +1,112 @@
 """Settings management using pydantic."""
-from typing import Optional, Union
+from enum import Enum
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple, Union, cast
 
-from pydantic import BaseSettings
+from pydantic import BaseModel, BaseSettings
+
+LOCALHOST = '127.0.0.1'
+MIB = 1024 * 1024
+CLIP_BUFFER_MIB = 64
+NAME_KEY = 'name'
+
+
+class DropPolicy(str, Enum):  # noqa: WPS600
+    """Backpressure policy when a pipeline stage falls behind."""
+
+    BLOCK = 'block'  # wait for the stage, stalling the previous stages
+    DROP_OLDEST = 'drop_oldest'  # discard the longest waiting frame
+    DROP_NEWEST = 'drop_newest'  # discard the incoming frame
+
+
+class WriterBackend(str, Enum):  # noqa: WPS600
+    """Implementation used to pass frames to FFmpeg."""
+
+    WRITEGEAR = 'writegear'  # vidgear's WriteGear
+    FFMPEG = 'ffmpeg'  # minigugl's own zero-copy FFmpeg writer
+
+
+class AnnotationBackend(str, Enum):  # noqa: WPS600
+    """Implementation used to burn annotations into the video."""
+
+    OPENCV = 'opencv'  # draw on decoded frames in Python
+    FFMPEG = 'ffmpeg'  # draw with FFmpeg's drawtext filter while encoding
+
+
+class RecordingMode(str, Enum):  # noqa: WPS600
+    """How video from the source gets into the segmented output."""
+
+    DECODE = 'decode'  # decode, annotate, and encode frames in Python
+    PASSTHROUGH = 'passthrough'  # FFmpeg reads the source directly
+
+
+class TrackFormat(str, Enum):  # noqa: WPS600
+    """File format of GPS track sidecars."""
+
+    BINARY = 'binary'  # compact columnar format, see minigugl.track
+    GPX = 'gpx'  # GPS Exchange Format 1.0, readable by most GIS tools
+
+
+class Corner(str, Enum):  # noqa: WPS600
+    """Corner of a frame holding annotations."""
+
+    TOP_LEFT = 'top_left'
+    TOP_RIGHT = 'top_right'
+    BOTTOM_LEFT = 'bottom_left'
+    BOTTOM_RIGHT = 'bottom_right'
+
+
+class GapFill(str, Enum):  # noqa: WPS600
+    """Frames inserted while the video source is stalled."""
+
+    NONE = 'none'  # insert nothing, the gap is skipped in the video
+    HOLD = 'hold'  # repeat the last frame
+    BLANK = 'blank'  # black frames
+
+
+class CameraSettings(BaseModel):
+    """Settings for recording a single video source.
+
+    Fields not set for a camera in CAMERAS fall back to the global settings.
+    """
+
+    name: str
+    video_source: str
+    output_dir: str
+    output_filename: str
+    video_width: int
+    video_height: int
+    video_framerate: int
+    video_codec: str
+    video_crf: int
+    video_preset: str
+    video_segment_length_sec: int
+    recording_mode: RecordingMode
+    renditions: List[Dict[str, Any]]
+
+    def resolve_renditions(self) -> List['CameraSettings']:
+        """Resolve the settings of the additional output renditions.
+
+        Fields not set for a rendition fall back to the camera's settings,
+        except for the output directory, which defaults to a subdirectory
+        named after the rendition.
+
+        Returns:
+            List of settings for each rendition, named <camera>-<rendition>.
+        """
+        defaults = self.dict(exclude={'renditions'})
+        renditions = []
+        for index, overrides in enumerate(self.renditions):
+            name = overrides.get(NAME_KEY, 'rendition{0}'.format(index))
+            renditions.append(CameraSettings(**{
+                **defaults,
+                'output_dir': str(Path(self.output_dir) / name),
+                **overrides,
+                NAME_KEY: '{0}-{1}'.format(self.name, name),
+                'renditions': [],
+            }))
+        return renditions
 
 
 class Settings(BaseSettings):
@@ -23,21 +128,178 @@ class Settings(BaseSettings):
     video_width: int = 640
     video_height: int = 480
     video_framerate: int = 24
-    video_source: str
+    video_source: Optional[str]
     video_codec: str = 'libx264'
+    video_crf: int = 22
+    video_preset: str = 'fast'
     video_segment_length_sec: int = 60
-    output_dir: str
+    output_dir: Optional[str]
+    # Example: video_2021-04-14_20-15-30.mp4
+    # April 14th, 2021, at 8:15:30pm
+    output_filename: str = 'video_%Y-%m-%d_%H-%M-%S.mp4'  # noqa: WPS323
+    cameras: List[Dict[str, Any]] = []
+    # additional outputs of each camera, e.g. a low-resolution substream
+    renditions: List[Dict[str, Any]] = []
+    recording_mode: RecordingMode = RecordingMode.DECODE
+    video_writer_backend: WriterBackend = WriterBackend.WRITEGEAR
+    stream_stall_timeout_sec: float = 0  # watchdog disabled
+    stream_reconnect_max_sec: float = 30
+    stream_gap_fill: GapFill = GapFill.NONE
+    ffmpeg_path: Optional[str]
+    encoder_governor: bool = False
+    governor_max_temperature: float = 75
     enable_gps: bool = False
     gps_interval_sec: Union[float, int] = 0.1
+    gpsd_host: str = LOCALHOST
+    gpsd_port: int = 2947
+    gps_track_format: Optional[TrackFormat]
     annotation_padding: int = 5
     annotation_margin: int = 5
     annotation_font_height: int = 15
     annotation_override_text_height: Optional[int]
+    annotation_backend: AnnotationBackend = AnnotationBackend.OPENCV
+    annotation_opacity: float = 0.7
+    annotation_cache_size: int = 32
+    # arrow format, RFC 2822 by default
+    annotation_timestamp_format: str = 'ddd, DD MMM YYYY HH:mm:ss Z'
+    annotation_timestamp_precision: int = 0
+    # format strings of the lines per corner, see minigugl.layout
+    annotation_layout: Dict[Corner, List[str]] = {
+        Corner.BOTTOM_LEFT: ['{time}'],
+        Corner.BOTTOM_RIGHT: ['{location}'],
+    }
+    motion_detection: bool = False
+    motion_threshold: int = 25
+    motion_min_area: float = 0.01
+    motion_regions: List[Tuple[float, float, float, float]] = []
+    motion_hold_sec: float = 10
+    motion_analysis_width: int = 64
+    enable_catalog: bool = False
+    retention_max_bytes: Optional[int]
+    retention_max_percent: Optional[float]
+    clip_buffer_sec: float = 0
+    clip_buffer_max_bytes: int = CLIP_BUFFER_MIB * MIB
+    clip_post_event_sec: float = 30
+    clip_dir: Optional[str]
+    clip_host: str = LOCALHOST
+    clip_port: Optional[int]
+    preview_host: str = LOCALHOST
+    preview_port: Optional[int]
+    preview_width: int = 320
+    preview_max_fps: float = 5
+    preview_jpeg_quality: int = 70
+    pipeline_queue_size: int = 8
+    pipeline_drop_policy: DropPolicy = DropPolicy.BLOCK
+    metrics_host: str = LOCALHOST
+    metrics_port: Optional[int]
+    metrics_log_interval_sec: float = 60
 
     class Config(object):  # noqa: WPS431
         """Enable support to load settings from .env files."""
 
         env_file = '.env'
 
+    def resolve_cameras(self) -> List[CameraSettings]:
+        """Resolve the settings of all cameras to be recorded.
+
+        Without CAMERAS, a single camera is derived from the global
+        settings (VIDEO_SOURCE, OUTPUT_DIR, etc.). Cameras in CAMERAS
+        without an output directory record into a subdirectory of
+        OUTPUT_DIR named after the camera.
+
+        VIDEO_SOURCE and OUTPUT_DIR are only required here, so tools without
+        live recording (e.g. minigugl.batch) can use all other settings.
+
+        Raises:
+            ValueError: If neither CAMERAS nor a single video source is set,
+                or if cameras or renditions share a name or output files.
+
+        Returns:
+            List of settings for each camera.
+        """
+        if not self.cameras and not (self.video_source and self.output_dir):
+            raise ValueError(
+                'VIDEO_SOURCE and OUTPUT_DIR are required without CAMERAS',
+            )
+        cameras = [
+            self._resolve_camera(index, overrides)
+            for index, overrides in enumerate(self.cameras or [{}])
+        ]
+        _check_unique(cameras)
+        return cameras
+
+    def _resolve_camera(
+        self,
+        index: int,
+        overrides: Dict[str, Any],
+    ) -> CameraSettings:
+        name = overrides.get(NAME_KEY, 'camera{0}'.format(index))
+        # global settings that are no camera settings are ignored
+        defaults = {**self.dict(), NAME_KEY: name}
+        if self.cameras and self.output_dir:
+            defaults['output_dir'] = str(Path(self.output_dir) / name)
+        return CameraSettings(**{**defaults, **overrides})
+
+
+def _check_unique(cameras: List[CameraSettings]) -> None:
+    # renditions write, watch, and retain their segments like cameras
+    outputs = [
+        output
+        for camera in cameras
+        for output in (camera, *camera.resolve_renditions())
+    ]
+    names = [output.name for output in outputs]
+    if len(set(names)) < len(names):
+        raise ValueError('Camera names must be unique: {0}'.format(
+            ', '.join(names),
+        ))
+    output_files = {
+        (str(Path(output.output_dir).resolve()), output.output_filename)
+        for output in outputs
+    }
+    if len(output_files) < len(outputs):
+        raise ValueError(
+            'Cameras and renditions must not share OUTPUT_DIR and ' +
+            'OUTPUT_FILENAME',
+        )
+
+
+class LazySettings(object):
+    """Proxy parsing the settings on first attribute access.
+
+    Importing modules that use settings stays cheap and never fails on
+    missing environment variables, e.g. in tooling.
+    """
+
+    def __init__(self) -> None:
+        """Initialize proxy without parsing the settings yet."""
+        self._settings: Optional[Settings] = None
+        self._lock = Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        """Get a setting, parsing all settings on first access.
+
+        Args:
+            name: Name of the setting.
+
+        Returns:
+            Value of the setting.
+        """
+        return getattr(self.load(), name)
+
+    def load(self) -> Settings:
+        """Parse the settings from environment variables and .env file once.
+
+        Returns:
+            The parsed settings.
+        """
+        loaded = self._settings
+        if loaded is None:
+            with self._lock:  # lock only until the settings are parsed
+                if self._settings is None:
+                    self._settings = Settings()
+                loaded = self._settings
+        return loaded
+
 
-settings = Settings()
+settings = cast(Settings, LazySettings())
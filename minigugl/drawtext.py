@@ -0,0 +1,184 @@
+"""Annotations rendered by FFmpeg's drawtext filter instead of OpenCV.
+
+Same four-corner layout as minigugl.annotation: text in the configured
+font and height on a white box with annotation padding and margin. Texts
+are read from files, so they can change without restarting FFmpeg.
+"""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from threading import Event, Thread
+from typing import Callable, Dict, List, Optional
+
+from minigugl import config
+from minigugl.annotation import font_file
+
+TOP_LEFT = 'top_left'
+TOP_RIGHT = 'top_right'
+BOTTOM_LEFT = 'bottom_left'
+BOTTOM_RIGHT = 'bottom_right'
+
+# drawtext expands this to the local time in RFC 2822 format for each frame
+TIMESTAMP_EXPANSION = (
+    r'%{localtime:%a, %d %b %Y %H\:%M\:%S %z}'  # noqa: WPS323
+)
+OPTION_ESCAPES = str.maketrans({'\\': r'\\', ':': r'\:', "'": r"\'"})
+FILTERGRAPH_ESCAPES = str.maketrans({
+    special: r'\{0}'.format(special)
+    for special in ('\\', "'", '[', ']', ',', ';')
+})
+# drawtext expands '%', so escape it for literal text
+TEXT_ESCAPES = str.maketrans({'\\': r'\\', '%': r'\%'})
+
+TextSource = Callable[[], Optional[str]]
+
+
+def _escape(filter_value: str) -> str:
+    # first escape for the filter option, then for the filtergraph
+    option_escaped = filter_value.translate(OPTION_ESCAPES)
+    return option_escaped.translate(FILTERGRAPH_ESCAPES)
+
+
+def _get_position(corner: str) -> Dict[str, str]:
+    offset = (
+        config.settings.annotation_margin + config.settings.annotation_padding
+    )
+    horizontal = str(offset) if corner.endswith('left') else (
+        'w-tw-{0}'.format(offset)
+    )
+    vertical = str(offset) if corner.startswith('top') else (
+        'h-th-{0}'.format(offset)
+    )
+    return {'x': horizontal, 'y': vertical}
+
+
+def build_drawtext(corner: str, textfile: Path, reload: bool) -> str:
+    """Build a drawtext filter for a text file placed in a frame corner.
+
+    Args:
+        corner: One of TOP_LEFT, TOP_RIGHT, BOTTOM_LEFT, BOTTOM_RIGHT.
+        textfile: File with the text to be drawn.
+        reload: Whether FFmpeg should re-read the file for every frame.
+
+    Returns:
+        drawtext filter as string.
+    """
+    opacity = config.settings.annotation_opacity
+    options = {
+        'fontfile': _escape(str(font_file)),
+        'textfile': _escape(str(textfile)),
+        'reload': '1' if reload else '0',
+        'fontsize': str(config.settings.annotation_font_height),
+        'fontcolor': 'black@{0}'.format(opacity),
+        'box': '1',
+        'boxcolor': 'white@{0}'.format(opacity),
+        'boxborderw': str(config.settings.annotation_padding),
+        **_get_position(corner),
+    }
+    return 'drawtext={0}'.format(':'.join(
+        '{0}={1}'.format(name, option) for name, option in options.items()
+    ))
+
+
+def write_text_atomically(path: Path, text: str) -> None:
+    """Replace a file's content so readers never see a partial write.
+
+    Args:
+        path: File to be written.
+        text: New file content.
+    """
+    tmp_path = path.with_name('.{0}.tmp'.format(path.name))
+    tmp_path.write_text(text)
+    os.replace(str(tmp_path), str(path))
+
+
+class DrawtextAnnotations(object):
+    """Corner annotations drawn by FFmpeg from (reloaded) text files.
+
+    The timestamp is expanded by drawtext itself for every frame. Other
+    texts (e.g. GPS coordinates) are polled from their source and written
+    to a text file whenever they change, which FFmpeg reloads per frame.
+
+    Attributes:
+        directory: Directory holding the text files.
+    """
+
+    def __init__(
+        self,
+        timestamp_corner: Optional[str],
+        text_sources: Dict[str, TextSource],
+        interval_sec: float,
+    ) -> None:
+        """Create text files for all annotated corners.
+
+        Args:
+            timestamp_corner: Corner showing the timestamp, None to disable.
+            text_sources: Callables returning the text per corner.
+            interval_sec: Time between polling the text sources in seconds.
+        """
+        self.directory = Path(tempfile.mkdtemp(prefix='minigugl-drawtext-'))
+        self._sources = text_sources
+        self._interval_sec = interval_sec
+        self._texts: Dict[str, Optional[str]] = {}
+        self._filters: List[str] = []
+        if timestamp_corner:
+            timestamp_file = self.directory / 'timestamp.txt'
+            timestamp_file.write_text(TIMESTAMP_EXPANSION)
+            self._filters.append(
+                build_drawtext(timestamp_corner, timestamp_file, reload=False),
+            )
+        for corner in text_sources:
+            self._filters.append(
+                build_drawtext(corner, self._get_path(corner), reload=True),
+            )
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name='drawtext', daemon=True)
+
+    @property
+    def video_filter(self) -> str:
+        """Get the filter chain drawing all annotations.
+
+        Returns:
+            FFmpeg filter chain, e.g. for '-vf'.
+        """
+        return ','.join(self._filters)
+
+    def start(self) -> 'DrawtextAnnotations':
+        """Write the initial texts and start polling the text sources.
+
+        Must be called before FFmpeg starts, which requires the text files.
+
+        Returns:
+            The started instance itself.
+        """
+        self._update()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop polling the text sources and remove the text files.
+
+        Must be called after all FFmpeg processes using the filter exited.
+        """
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _get_path(self, corner: str) -> Path:
+        return self.directory / '{0}.txt'.format(corner)
+
+    def _update(self) -> None:
+        for corner, source in self._sources.items():
+            text = source()
+            if text != self._texts.get(corner):
+                self._texts[corner] = text
+                write_text_atomically(
+                    self._get_path(corner),
+                    (text or '').translate(TEXT_ESCAPES),
+                )
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval_sec):
+            self._update()
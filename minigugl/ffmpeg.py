@@ -0,0 +1,349 @@
+"""Direct FFmpeg subprocess writer for raw video frames."""
+import fcntl
+import subprocess  # noqa: S404
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+# fcntl.F_SETPIPE_SZ is only exposed by Python 3.10+
+LINUX_F_SETPIPE_SZ = 1031
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', LINUX_F_SETPIPE_SZ)
+PIPE_MAX_SIZE_FILE = Path('/proc/sys/fs/pipe-max-size')
+PIXEL_FORMATS = {  # noqa: WPS407
+    1: 'gray',
+    3: 'bgr24',
+    4: 'bgra',
+}
+CLONES_PARAM = '-clones'
+FORMAT_PARAM = '-f'
+INPUT_FRAMERATE_PARAM = '-input_framerate'
+# WriteGear parameters not passed to FFmpeg as key/value pairs
+SPECIAL_PARAMS = frozenset((INPUT_FRAMERATE_PARAM, CLONES_PARAM))
+# options of the segment muxer, which become slave options within a tee
+SEGMENT_MUXER_OPTIONS = frozenset((
+    '-segment_time',
+    '-segment_list',
+    '-segment_list_type',
+    '-reset_timestamps',
+    '-strftime',
+))
+TEE_ESCAPES = str.maketrans({
+    special: r'\{0}'.format(special)
+    for special in ('\\', '|', '[', ']')
+})
+
+StdoutReader = Callable[[IO[bytes]], None]
+# output file (pattern) with its FFmpeg parameters as expected by WriteGear
+Output = Tuple[str, Dict[str, Any]]
+
+
+def build_output_args(output_params: Dict[str, Any]) -> List[str]:
+    """Translate WriteGear-style output parameters to FFmpeg arguments.
+
+    Input-only parameters (e.g. '-input_framerate') are skipped and '-clones'
+    are appended at the end, right before the output filename.
+
+    Args:
+        output_params: Dict of FFmpeg parameters as expected by WriteGear.
+
+    Returns:
+        List of FFmpeg command line arguments.
+    """
+    args: List[str] = []
+    for key, param_value in output_params.items():
+        if key in SPECIAL_PARAMS:
+            continue
+        args.extend([key, str(param_value)])
+    args.extend(str(clone) for clone in output_params.get(CLONES_PARAM, []))
+    return args
+
+
+def _get_slave_options(output_params: Dict[str, Any]) -> List[str]:
+    clones = [str(clone) for clone in output_params.get(CLONES_PARAM, [])]
+    slave_options = []
+    if FORMAT_PARAM in clones:
+        muxer = clones[clones.index(FORMAT_PARAM) + 1]
+        slave_options.append('f={0}'.format(muxer))
+    slave_options.extend(
+        '{0}={1}'.format(
+            key.lstrip('-'),
+            str(param_value).translate(TEE_ESCAPES),
+        )
+        for key, param_value in output_params.items()
+        if key in SEGMENT_MUXER_OPTIONS
+    )
+    return slave_options
+
+
+def build_tee_output_args(
+    output_params: Dict[str, Any],
+    output_filename: str,
+    tee_outputs: Sequence[str],
+) -> List[str]:
+    """Build FFmpeg arguments writing the encoded video to multiple outputs.
+
+    The tee muxer writes the encoded packets to the regular (segmented)
+    output and each additional output without encoding them again.
+
+    Args:
+        output_params: Dict of FFmpeg parameters as expected by WriteGear.
+        output_filename: Output file (pattern) of the regular output.
+        tee_outputs: Additional tee outputs, e.g. '[f=mpegts]pipe:1'.
+
+    Returns:
+        List of FFmpeg command line arguments including the output.
+    """
+    encoder_params = {
+        key: param_value
+        for key, param_value in output_params.items()
+        if key not in SEGMENT_MUXER_OPTIONS and key != CLONES_PARAM
+    }
+    main_output = '[{0}]{1}'.format(
+        ':'.join(_get_slave_options(output_params)),
+        output_filename.translate(TEE_ESCAPES),
+    )
+    return [
+        *build_output_args(encoder_params),
+        FORMAT_PARAM,
+        'tee',
+        '|'.join([main_output, *tee_outputs]),
+    ]
+
+
+def build_split_output_args(
+    outputs: Sequence[Output],
+    shared_filter: Optional[str] = None,
+    tee_outputs: Sequence[str] = (),
+) -> List[str]:
+    """Build FFmpeg arguments encoding the video into multiple outputs.
+
+    The video is filtered once (e.g. annotations) and split within the
+    filter graph, so it is read and decoded only once. Each output applies
+    its own '-vf' chain (e.g. scaling) after the split and is encoded with
+    its own parameters.
+
+    Args:
+        outputs: Output files (patterns) with their parameters.
+        shared_filter: Optional filter chain applied before splitting.
+        tee_outputs: Additional tee outputs of the first output.
+
+    Returns:
+        List of FFmpeg command line arguments including the outputs.
+    """
+    output_args: List[str] = []
+    for index, output in enumerate(outputs):
+        output_args.extend(_build_split_output(
+            index, output, tee_outputs if index == 0 else (),
+        ))
+    return [
+        '-filter_complex',
+        _build_split_filter(outputs, shared_filter),
+        *output_args,
+    ]
+
+
+def _build_split_filter(
+    outputs: Sequence[Output],
+    shared_filter: Optional[str],
+) -> str:
+    shared_chain = '{0},'.format(shared_filter) if shared_filter else ''
+    split_labels = ''.join(
+        '[split{0}]'.format(index) for index, _ in enumerate(outputs)
+    )
+    chains = [
+        '[0:v]{0}split={1}{2}'.format(
+            shared_chain, len(outputs), split_labels,
+        ),
+    ]
+    chains.extend(
+        '[split{0}]{1}[out{0}]'.format(index, output[1].get('-vf') or 'null')
+        for index, output in enumerate(outputs)
+    )
+    return ';'.join(chains)
+
+
+def _build_split_output(
+    index: int,
+    output: Output,
+    tee_outputs: Sequence[str],
+) -> List[str]:
+    output_filename, output_params = output
+    encoder_params = {
+        '-map': '[out{0}]'.format(index),
+        **{
+            key: param_value
+            for key, param_value in output_params.items()
+            if key not in {'-map', '-vf'}
+        },
+    }
+    if tee_outputs:
+        return build_tee_output_args(
+            encoder_params, output_filename, tee_outputs,
+        )
+    return [*build_output_args(encoder_params), output_filename]
+
+
+def build_input_args(
+    frame_shape: Tuple[int, ...],
+    output_params: Dict[str, Any],
+) -> List[str]:
+    """Build FFmpeg arguments to read raw frames from stdin.
+
+    Args:
+        frame_shape: Shape of the frames (height, width, channels).
+        output_params: Dict of FFmpeg parameters as expected by WriteGear.
+
+    Returns:
+        List of FFmpeg command line arguments.
+    """
+    height, width = frame_shape[:2]
+    channels = frame_shape[2] if len(frame_shape) > 2 else 1
+    args = [
+        FORMAT_PARAM,
+        'rawvideo',
+        '-vcodec',
+        'rawvideo',
+        '-s',
+        '{0}x{1}'.format(width, height),
+        '-pix_fmt',
+        PIXEL_FORMATS[channels],
+    ]
+    input_framerate = output_params.get(INPUT_FRAMERATE_PARAM)
+    if input_framerate is not None:
+        args.extend(['-framerate', str(input_framerate)])
+    return [*args, '-i', '-']
+
+
+class FFmpegWriter(object):
+    """Write raw frames to an FFmpeg subprocess without intermediate copies.
+
+    Drop-in replacement for WriteGear in compression mode: it accepts the
+    same output parameters and starts FFmpeg lazily with the first frame.
+    With split outputs, the same FFmpeg process also encodes additional
+    renditions of the frames (see build_split_output_args). Frames are
+    passed as memoryview straight to the unbuffered stdin pipe, which gets
+    enlarged to hold a whole frame if the system allows it.
+
+    Attributes:
+        output_filename: Output file (pattern) passed to FFmpeg.
+        output_params: Dict of FFmpeg parameters as expected by WriteGear.
+        tee_outputs: Additional outputs of the encoded video (tee muxer).
+        split_outputs: Additional outputs encoded from the same frames.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        output_filename: str,
+        ffmpeg_path: str = 'ffmpeg',
+        tee_outputs: Sequence[str] = (),
+        stdout_reader: Optional[StdoutReader] = None,
+        split_outputs: Sequence[Output] = (),
+        **output_params: Any,
+    ) -> None:
+        """Initialize writer without starting FFmpeg yet.
+
+        Args:
+            output_filename: Output file (pattern) passed to FFmpeg.
+            ffmpeg_path: Path to the FFmpeg executable.
+            tee_outputs: Additional tee outputs, e.g. '[f=mpegts]pipe:1'.
+            stdout_reader: Callable consuming FFmpeg's stdout, called once
+                FFmpeg started. It must not block and keep reading.
+            split_outputs: Additional outputs with their parameters, each
+                applying its own '-vf' chain after the '-vf' chain of
+                output_params.
+            output_params: FFmpeg parameters as expected by WriteGear.
+        """
+        self.output_filename = output_filename
+        self.output_params = output_params
+        self.tee_outputs = tee_outputs
+        self.split_outputs = split_outputs
+        self._stdout_reader = stdout_reader
+        self._ffmpeg_path = ffmpeg_path
+        self._process: Optional['subprocess.Popen[bytes]'] = None
+        self._stdin: Optional[IO[bytes]] = None
+
+    def build_command(self, frame_shape: Tuple[int, ...]) -> List[str]:
+        """Build the full FFmpeg command line.
+
+        Args:
+            frame_shape: Shape of the frames (height, width, channels).
+
+        Returns:
+            FFmpeg command as list of arguments.
+        """
+        if self.split_outputs:
+            # the '-vf' chain of the main output is shared by all outputs
+            output_params = dict(self.output_params)
+            shared_filter = output_params.pop('-vf', None)
+            output_args = build_split_output_args(
+                [(self.output_filename, output_params), *self.split_outputs],
+                shared_filter=shared_filter,
+                tee_outputs=self.tee_outputs,
+            )
+        elif self.tee_outputs:
+            output_args = build_tee_output_args(
+                self.output_params, self.output_filename, self.tee_outputs,
+            )
+        else:
+            output_args = [
+                *build_output_args(self.output_params), self.output_filename,
+            ]
+        return [
+            self._ffmpeg_path,
+            '-y',
+            '-hide_banner',
+            *build_input_args(frame_shape, self.output_params),
+            *output_args,
+        ]
+
+    def write(self, frame: Any) -> None:
+        """Write a single frame to FFmpeg, starting FFmpeg if necessary.
+
+        Args:
+            frame: Frame as OpenCV image (numpy array).
+        """
+        frame = np.ascontiguousarray(frame)  # no-op for contiguous frames
+        if self._stdin is None:
+            self._start(frame.shape, frame.nbytes)
+        view = memoryview(frame).cast('B')  # type: ignore
+        while view:
+            written = self._stdin.write(view)  # type: ignore
+            view = view[written:]
+
+    def close(self) -> None:
+        """Close stdin and wait for FFmpeg to finalize the output."""
+        if self._process is None:
+            return
+        self._stdin.close()  # type: ignore
+        self._process.wait()
+        self._process = None
+        self._stdin = None
+
+    def _start(self, frame_shape: Tuple[int, ...], frame_size: int) -> None:
+        command = self.build_command(frame_shape)
+        logger.debug('Starting FFmpeg: {0}', ' '.join(command))
+        self._process = subprocess.Popen(  # noqa: S603
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE if self._stdout_reader else None,
+            bufsize=0,  # unbuffered, writes go straight to the pipe
+        )
+        self._stdin = self._process.stdin
+        if self._stdout_reader:
+            self._stdout_reader(self._process.stdout)  # type: ignore
+        _resize_pipe(self._stdin.fileno(), frame_size)  # type: ignore
+
+
+def _resize_pipe(fd: int, size: int) -> None:
+    sizes = [size]
+    if PIPE_MAX_SIZE_FILE.exists():
+        sizes.append(min(size, int(PIPE_MAX_SIZE_FILE.read_text())))
+    for pipe_size in sizes:
+        try:
+            fcntl.fcntl(fd, F_SETPIPE_SZ, pipe_size)
+        except OSError:
+            continue
+        return
+    logger.debug('Unable to resize FFmpeg pipe to {0} bytes', size)
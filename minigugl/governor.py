@@ -0,0 +1,402 @@
+"""Adaptive encoder settings keeping recording real-time under load.
+
+The governor watches how busy the encoder is, how many frames wait for it,
+and the CPU's temperature and frequency cap. Whenever a segment completes,
+it steps the encoding down (faster preset, higher CRF, lower resolution,
+lower framerate) if the encoder falls behind, and back up once there is
+headroom again. Changes take effect by restarting FFmpeg exactly at the
+segment boundary, so each segment is encoded with consistent settings.
+"""
+import time
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from loguru import logger
+
+from minigugl import config
+from minigugl.pipeline import Pipeline
+
+# x264 presets from fastest to slowest
+X264_PRESETS = (
+    'ultrafast',
+    'superfast',
+    'veryfast',
+    'faster',
+    'fast',
+    'medium',
+    'slow',
+    'slower',
+    'veryslow',
+)
+CRF_STEP = 3
+CRF_STEPS = 2
+SCALES = (0.75, 0.5)
+FRAMERATE_DIVISORS = (2,)
+
+BUSY_HIGH = 0.9  # encoder busy for more than 90% of the segment's duration
+BUSY_LOW = 0.6
+QUEUE_HIGH = 0.5  # encoder queue more than half full
+QUEUE_LOW = 0.25
+TEMPERATURE_HYSTERESIS = 5
+RECOVERY_SEGMENTS = 2  # healthy segments in a row before stepping up
+
+THERMAL_ZONE_FILE = Path('/sys/class/thermal/thermal_zone0/temp')
+CPUFREQ_DIR = Path('/sys/devices/system/cpu/cpu0/cpufreq')
+MILLIDEGREES = 1000
+MIN_ELAPSED_SEC = 1e-3
+
+WriterFactory = Callable[[config.CameraSettings, Optional[str]], Any]
+
+
+class EncoderTuning(NamedTuple):
+    """Encoder settings for a single step of the governor.
+
+    Attributes:
+        preset: x264 preset.
+        crf: x264 constant rate factor.
+        scale: Factor applied to the frame width and height.
+        framerate_divisor: Only every n-th frame gets encoded.
+    """
+
+    preset: str
+    crf: int
+    scale: float
+    framerate_divisor: int
+
+
+class LoadSample(NamedTuple):
+    """Load observed while encoding a segment.
+
+    Attributes:
+        busy_ratio: Share of the segment's wall-clock time spent writing.
+        queue_fill: Highest share of the encoder queue's capacity in use.
+        dropped: Number of frames dropped during the segment.
+        temperature: CPU temperature in degree Celsius, None if unknown.
+        frequency_cap: Current maximum CPU frequency relative to the
+            hardware maximum (less than 1 if throttled), None if unknown.
+    """
+
+    busy_ratio: float
+    queue_fill: float
+    dropped: int
+    temperature: Optional[float]
+    frequency_cap: Optional[float]
+
+
+def build_tunings(camera: config.CameraSettings) -> List[EncoderTuning]:
+    """Build the steps from the configured settings down to the cheapest.
+
+    Faster x264 presets come first, then higher CRF values (both only for
+    libx264), then lower resolutions, and finally lower framerates.
+
+    Args:
+        camera: Settings of the recorded camera.
+
+    Returns:
+        List of tunings, starting with the configured settings.
+    """
+    preset, crf = camera.video_preset, camera.video_crf
+    tunings = [EncoderTuning(preset, crf, 1, 1)]
+    if camera.video_codec == 'libx264' and preset in X264_PRESETS:
+        tunings.extend(
+            EncoderTuning(faster_preset, crf, 1, 1)
+            for faster_preset in reversed(
+                X264_PRESETS[:X264_PRESETS.index(preset)],
+            )
+        )
+        preset = tunings[-1].preset
+        tunings.extend(
+            EncoderTuning(preset, crf + CRF_STEP * step, 1, 1)
+            for step in range(1, CRF_STEPS + 1)
+        )
+    crf = tunings[-1].crf
+    tunings.extend(EncoderTuning(preset, crf, scale, 1) for scale in SCALES)
+    tunings.extend(
+        EncoderTuning(preset, crf, tunings[-1].scale, divisor)
+        for divisor in FRAMERATE_DIVISORS
+    )
+    return tunings
+
+
+def tune_camera(
+    camera: config.CameraSettings,
+    tuning: EncoderTuning,
+) -> config.CameraSettings:
+    """Apply a tuning's preset, CRF, and framerate to camera settings.
+
+    Args:
+        camera: Settings of the recorded camera.
+        tuning: Encoder settings to be applied.
+
+    Returns:
+        Copy of the camera settings with the tuning applied.
+    """
+    return camera.copy(update={
+        'video_preset': tuning.preset,
+        'video_crf': tuning.crf,
+        'video_framerate': max(
+            camera.video_framerate // tuning.framerate_divisor, 1,
+        ),
+    })
+
+
+def build_scale_filter(scale: float) -> Optional[str]:
+    """Build an FFmpeg filter scaling frames down by a factor.
+
+    Args:
+        scale: Factor applied to the frame width and height.
+
+    Returns:
+        scale filter keeping dimensions even (for yuv420p), None if 1.
+    """
+    if scale == 1:
+        return None
+    return 'scale=trunc(iw*{0}/2)*2:trunc(ih*{0}/2)*2'.format(scale)
+
+
+def _read_number(path: Path) -> Optional[float]:
+    try:
+        return float(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def read_cpu_temperature() -> Optional[float]:
+    """Read the CPU temperature from sysfs.
+
+    Returns:
+        Temperature in degree Celsius or None if unavailable.
+    """
+    millidegrees = _read_number(THERMAL_ZONE_FILE)
+    return None if millidegrees is None else millidegrees / MILLIDEGREES
+
+
+def read_cpu_frequency_cap() -> Optional[float]:
+    """Read how far the CPU's maximum frequency is currently capped.
+
+    Thermal throttling lowers 'scaling_max_freq' below 'cpuinfo_max_freq'.
+
+    Returns:
+        Current relative to hardware maximum frequency or None if unknown.
+    """
+    scaling_max = _read_number(CPUFREQ_DIR / 'scaling_max_freq')
+    hardware_max = _read_number(CPUFREQ_DIR / 'cpuinfo_max_freq')
+    if not scaling_max or not hardware_max:
+        return None
+    return scaling_max / hardware_max
+
+
+class EncoderGovernor(object):
+    """Decide on the encoder tuning based on the load per segment.
+
+    Steps down immediately on overload, but only steps up again after
+    RECOVERY_SEGMENTS segments in a row with headroom to avoid oscillation.
+
+    Attributes:
+        tunings: Available steps, from the configured to the cheapest.
+        level: Index of the current step in tunings.
+    """
+
+    def __init__(
+        self,
+        tunings: List[EncoderTuning],
+        max_temperature: float,
+    ) -> None:
+        """Initialize governor at the configured settings.
+
+        Args:
+            tunings: Available steps, from the configured to the cheapest.
+            max_temperature: CPU temperature in degree Celsius to step down.
+        """
+        self.tunings = tunings
+        self.level = 0
+        self._max_temperature = max_temperature
+        self._healthy_segments = 0
+
+    @property
+    def tuning(self) -> EncoderTuning:
+        """Get the encoder settings of the current step.
+
+        Returns:
+            Current encoder tuning.
+        """
+        return self.tunings[self.level]
+
+    def update(self, sample: LoadSample) -> bool:
+        """Step the tuning up or down based on the load of a segment.
+
+        Args:
+            sample: Load observed while encoding the last segment.
+
+        Returns:
+            True if the tuning changed.
+        """
+        if self._is_overloaded(sample):
+            self._healthy_segments = 0
+            if self.level + 1 < len(self.tunings):
+                self.level += 1
+                return True
+            return False
+        if not self._has_headroom(sample):
+            self._healthy_segments = 0
+            return False
+        self._healthy_segments += 1
+        if self._healthy_segments >= RECOVERY_SEGMENTS and self.level > 0:
+            self._healthy_segments = 0
+            self.level -= 1
+            return True
+        return False
+
+    def _is_overloaded(self, sample: LoadSample) -> bool:
+        if sample.busy_ratio >= BUSY_HIGH or sample.queue_fill >= QUEUE_HIGH:
+            return True
+        return sample.dropped > 0 or (
+            sample.temperature is not None and
+            sample.temperature >= self._max_temperature
+        )
+
+    def _has_headroom(self, sample: LoadSample) -> bool:
+        if sample.busy_ratio >= BUSY_LOW or sample.queue_fill > QUEUE_LOW:
+            return False
+        if sample.frequency_cap is not None and sample.frequency_cap < 1:
+            return False
+        return sample.temperature is None or sample.temperature < (
+            self._max_temperature - TEMPERATURE_HYSTERESIS
+        )
+
+
+class GovernedWriter(object):  # noqa: WPS230
+    """Writer restarting FFmpeg with retuned settings at segment boundaries.
+
+    Drop-in replacement for WriteGear and FFmpegWriter. Frames are counted
+    to detect segment boundaries, which FFmpeg cuts based on the frames'
+    timestamps. The previous writer is closed before the next one starts,
+    as both would write the same segment list, which FFmpeg truncates on
+    start.
+
+    Attributes:
+        camera: Settings of the recorded camera.
+        governor: Governor deciding on the encoder tuning.
+    """
+
+    def __init__(
+        self,
+        camera: config.CameraSettings,
+        video_filter: Optional[str],
+        create_writer: WriterFactory,
+        on_closed: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Initialize writer at the configured settings.
+
+        Args:
+            camera: Settings of the camera to be recorded.
+            video_filter: Optional filter chain applied before encoding.
+            create_writer: Callable creating a writer for camera settings
+                and a video filter.
+            on_closed: Optional callable invoked after a writer got closed
+                for retuning, before the next one starts, e.g. to read the
+                last entries of the segment list.
+        """
+        self.camera = camera
+        self.governor = EncoderGovernor(
+            build_tunings(camera),
+            max_temperature=config.settings.governor_max_temperature,
+        )
+        self._video_filter = video_filter
+        self._create_writer = create_writer
+        self._on_closed = on_closed
+        self._pipeline: Optional[Pipeline] = None
+        self._frame_index = 0
+        # load of the current segment
+        self._segment_started_at = time.monotonic()
+        self._segment_frames = 0
+        self._busy_sec: float = 0
+        self._peak_queue_size = 0
+        self._dropped_before = 0
+        self._frames_per_segment = 0
+        self._writer = self._open_writer()
+
+    def attach(self, pipeline: Pipeline) -> None:
+        """Observe the queue and drops of the pipeline feeding this writer.
+
+        Args:
+            pipeline: Pipeline whose last stage writes to this writer.
+        """
+        self._pipeline = pipeline
+
+    def write(self, frame: Any) -> None:
+        """Write a single frame, skipping frames for a reduced framerate.
+
+        Args:
+            frame: Frame as OpenCV image (numpy array).
+        """
+        self._frame_index += 1
+        divisor = self.governor.tuning.framerate_divisor
+        if (self._frame_index - 1) % divisor:
+            return
+        started_at = time.perf_counter()
+        self._writer.write(frame)
+        self._busy_sec += time.perf_counter() - started_at
+        if self._pipeline is not None:
+            self._peak_queue_size = max(
+                self._peak_queue_size, self._pipeline.queues[-1].qsize(),
+            )
+        self._segment_frames += 1
+        if self._segment_frames >= self._frames_per_segment:
+            self._end_segment()
+
+    def close(self) -> None:
+        """Safely close the current writer."""
+        self._writer.close()
+
+    def _open_writer(self) -> Any:
+        tuning = self.governor.tuning
+        tuned_camera = tune_camera(self.camera, tuning)
+        self._frames_per_segment = (
+            tuned_camera.video_framerate *
+            tuned_camera.video_segment_length_sec
+        )
+        video_filter = ','.join(filter(None, (
+            build_scale_filter(tuning.scale), self._video_filter,
+        )))
+        return self._create_writer(tuned_camera, video_filter or None)
+
+    def _end_segment(self) -> None:
+        sample = self._take_sample()
+        if not self.governor.update(sample):
+            return
+        logger.info(
+            '{0}: retuning encoder to level {1} {2} ({3})',
+            self.camera.name,
+            self.governor.level,
+            self.governor.tuning,
+            sample,
+        )
+        # FFmpeg finalizes its last segment before the next one truncates
+        # the shared segment list
+        self._writer.close()
+        if self._on_closed:
+            self._on_closed()
+        self._writer = self._open_writer()
+
+    def _take_sample(self) -> LoadSample:
+        # sample the load of the ended segment and start the next one
+        now = time.monotonic()
+        dropped = self._pipeline.dropped if self._pipeline else 0
+        sample = LoadSample(
+            busy_ratio=self._busy_sec / max(
+                now - self._segment_started_at, MIN_ELAPSED_SEC,
+            ),
+            queue_fill=(
+                self._peak_queue_size / config.settings.pipeline_queue_size
+            ),
+            dropped=dropped - self._dropped_before,
+            temperature=read_cpu_temperature(),
+            frequency_cap=read_cpu_frequency_cap(),
+        )
+        self._segment_started_at = now
+        self._segment_frames = 0
+        self._busy_sec = 0
+        self._peak_queue_size = 0
+        self._dropped_before = dropped
+        return sample
@@ -0,0 +1,188 @@
+"""Event-driven client for gpsd's JSON protocol.
+
+https://gpsd.gitlab.io/gpsd/gpsd_json.html
+
+Messages are processed as soon as they arrive: the client waits on the
+socket with a selector and handles every complete line received, so
+bursts are drained at once instead of piling up in the socket buffer.
+Lost connections (e.g. gpsd restarting) are re-established with
+exponential backoff, which is only reset once a connection delivered a
+data report, so a gpsd accepting and dropping connections is not hammered.
+Silence is not a lost connection, as gpsd only reports while a receiver
+is attached; TCP keepalive detects peers that are gone instead.
+"""
+import json
+import selectors
+import socket
+from threading import Event, Thread
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+WATCH_COMMAND = b'?WATCH={"enable":true,"json":true}\n'
+RECV_SIZE = 4096
+BACKOFF_INITIAL_SEC = 0.5
+BACKOFF_MAX_SEC = 30
+# gpsd stays silent without a receiver, so only TCP notices dead peers
+KEEPALIVE_OPTIONS = (
+    ('TCP_KEEPIDLE', 30),
+    ('TCP_KEEPINTVL', 10),
+    ('TCP_KEEPCNT', 3),
+)
+# replies to connecting and watching, sent even without a working receiver
+HANDSHAKE_CLASSES = frozenset(('VERSION', 'DEVICES', 'WATCH', 'ERROR'))
+
+Report = Dict[str, Any]
+ReportCallback = Callable[[Report], None]
+
+
+class GpsdClient(object):  # noqa: WPS214, WPS230
+    """Watch gpsd in a separate thread and pass on each JSON report.
+
+    Attributes:
+        host: Host gpsd listens on.
+        port: Port gpsd listens on.
+        connected: Whether the client is currently connected.
+    """
+
+    def __init__(
+        self,
+        on_report: ReportCallback,
+        host: str = '127.0.0.1',
+        port: int = 2947,
+    ) -> None:
+        """Initialize client without connecting yet.
+
+        Args:
+            on_report: Callable receiving every report (e.g. TPV, SKY) as
+                dict, called in the client's thread.
+            host: Host gpsd listens on.
+            port: Port gpsd listens on.
+        """
+        self.host = host
+        self.port = port
+        self.connected = False
+        self._on_report = on_report
+        self._stopped = Event()
+        self._buffer = b''
+        self._reported = False  # data report received on this connection
+        self._thread = Thread(target=self._run, name='gpsd', daemon=True)
+
+    def start(self) -> 'GpsdClient':
+        """Connect to gpsd and start processing reports.
+
+        Returns:
+            The started client itself.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Disconnect from gpsd."""
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        backoff = BACKOFF_INITIAL_SEC
+        while not self._stopped.is_set():
+            if self._connect(backoff):
+                # only a connection delivering reports resets the backoff
+                backoff = BACKOFF_INITIAL_SEC
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX_SEC)
+
+    def _connect(self, backoff: float) -> bool:
+        address = (self.host, self.port)
+        try:
+            connection = socket.create_connection(
+                address, timeout=BACKOFF_MAX_SEC,
+            )
+        except OSError as error:
+            logger.warning(
+                'Unable to connect to gpsd at {0}:{1} ({2}), ' +
+                'retrying in {3}s',
+                self.host,
+                self.port,
+                error,
+                backoff,
+            )
+            return False
+        with connection:
+            self._watch(connection)
+        if not self._reported and not self._stopped.is_set():
+            logger.warning(
+                'No reports from gpsd, reconnecting in {0}s', backoff,
+            )
+        return self._reported
+
+    def _watch(self, connection: socket.socket) -> None:
+        logger.info('Connected to gpsd at {0}:{1}', self.host, self.port)
+        self.connected = True
+        self._buffer = b''
+        self._reported = False
+        try:
+            self._follow(connection)
+        except OSError as error:
+            logger.warning('Lost connection to gpsd ({0})', error)
+        finally:
+            self.connected = False
+
+    def _follow(self, connection: socket.socket) -> None:
+        _enable_keepalive(connection)
+        connection.sendall(WATCH_COMMAND)
+        connection.setblocking(False)
+        with selectors.DefaultSelector() as selector:
+            selector.register(connection, selectors.EVENT_READ)
+            is_open = True
+            while is_open and not self._stopped.is_set():
+                # short timeout only to notice being stopped
+                if selector.select(timeout=1):
+                    is_open = self._receive(connection)
+
+    def _receive(self, connection: socket.socket) -> bool:
+        # read everything available, then handle all complete lines
+        is_open = self._read_available(connection)
+        lines = self._buffer.split(b'\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            self._process_line(line)
+        return is_open
+
+    def _read_available(self, connection: socket.socket) -> bool:
+        while True:  # noqa: WPS457
+            try:
+                received = connection.recv(RECV_SIZE)
+            except BlockingIOError:
+                return True
+            if not received:
+                logger.warning('gpsd closed the connection')
+                return False
+            self._buffer += received
+
+    def _process_line(self, line: bytes) -> None:
+        report = self._parse(line)
+        if report is None:
+            return
+        if report.get('class') not in HANDSHAKE_CLASSES:
+            self._reported = True
+        try:
+            self._on_report(report)
+        except Exception:
+            logger.exception('Failed to process gpsd report')
+
+    def _parse(self, line: bytes) -> Optional[Report]:
+        try:
+            report = json.loads(line.decode())
+        except ValueError:
+            logger.debug('Ignoring invalid gpsd message: {0!r}', line)
+            return None
+        return report if isinstance(report, dict) else None
+
+
+def _enable_keepalive(connection: socket.socket) -> None:
+    connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # probe after 30s of silence instead of the system default (2h on Linux)
+    for option, option_value in KEEPALIVE_OPTIONS:
+        option_id = getattr(socket, option, None)
+        if option_id is not None:
+            connection.setsockopt(socket.IPPROTO_TCP, option_id, option_value)
@@ -0,0 +1,255 @@
+"""Declarative layout of text annotations in the corners of frames.
+
+Each corner holds a stack of lines, each line a format string with
+fields, e.g. '{speed} {heading}' or plain text. The position of every
+line is resolved once per frame size. A line's text box is only
+re-measured when its text changes, so the cost per frame stays constant
+for static text and grows only with text actually changing.
+"""
+import itertools
+import string
+from typing import (
+    Any,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from minigugl import annotation, config
+
+TIME = 'time'
+LOCATION = 'location'
+SPEED = 'speed'
+HEADING = 'heading'
+ALTITUDE = 'altitude'
+CAMERA = 'camera'
+FIELDS = frozenset((TIME, LOCATION, SPEED, HEADING, ALTITUDE, CAMERA))
+
+# measured once for the height of all lines, covering ascenders & descenders
+LINE_HEIGHT_SAMPLE = 'Ag°"'
+
+FieldValues = Mapping[str, Optional[str]]
+# camera name and frame size (height, width)
+SlotKey = Tuple[Optional[str], int, int]
+
+
+class LineTemplate(NamedTuple):
+    """Parsed line of a corner.
+
+    Attributes:
+        template: Format string, e.g. '{speed} {heading}'.
+        fields: Names of the fields used in the format string.
+    """
+
+    template: str
+    fields: Tuple[str, ...]
+
+
+def parse_line(template: str) -> LineTemplate:
+    """Parse the format string of a line.
+
+    Args:
+        template: Format string with fields, e.g. '{speed} {heading}'.
+
+    Raises:
+        ValueError: If the format string contains an unknown field.
+
+    Returns:
+        Parsed line.
+    """
+    fields = tuple(
+        field_name
+        for _, field_name, _, _ in string.Formatter().parse(template)
+        if field_name is not None
+    )
+    unknown = set(fields) - FIELDS
+    if unknown:
+        raise ValueError('Unknown annotation fields: {0}'.format(
+            ', '.join(sorted(unknown)),
+        ))
+    return LineTemplate(template, fields)
+
+
+class _LineSlot(object):
+    """Position of a line within frames of one size, caching its text box."""
+
+    def __init__(
+        self,
+        baseline_y: int,
+        anchor_x: int,
+        align_right: bool,
+    ) -> None:
+        self.baseline_y = baseline_y
+        self.anchor_x = anchor_x  # left edge of text, or right edge if right
+        self.align_right = align_right
+        # text with its coordinates, replaced as a whole
+        self.cached: Tuple[str, annotation.AnnotationCoords] = (
+            '', annotation.AnnotationCoords((0, 0), ((0, 0), (0, 0))),
+        )
+
+    def get_coords(
+        self,
+        text: str,
+        line_height: int,
+        padding: int,
+    ) -> annotation.AnnotationCoords:
+        cached_text, coords = self.cached
+        if text == cached_text:
+            return coords
+        text_width = annotation.get_text_size(text, line_height)[0]
+        text_x = self.anchor_x - text_width if self.align_right else (
+            self.anchor_x
+        )
+        box_coords = (
+            (text_x - padding, self.baseline_y + padding),
+            (
+                text_x + text_width + padding,
+                self.baseline_y - line_height - padding,
+            ),
+        )
+        coords = annotation.AnnotationCoords(
+            text_org=(text_x, self.baseline_y),
+            box_coords=box_coords,
+        )
+        self.cached = (text, coords)
+        return coords
+
+
+Slots = List[List[_LineSlot]]
+
+
+class AnnotationLayout(object):
+    """Corner annotations as stacks of lines, safe to share across threads.
+
+    Lines without a value for any of their fields are left out, without
+    moving the other lines of the corner. Text boxes are cached per camera
+    (CAMERA field) and frame size.
+
+    Attributes:
+        corners: Parsed lines per corner, from top to bottom.
+        fields: Names of all fields used by any line.
+    """
+
+    def __init__(
+        self,
+        corners: Mapping[config.Corner, Sequence[str]],
+        opacity: int = annotation.OPACITY_OPAQUE,
+        color_order: str = annotation.BGR,
+    ) -> None:
+        """Parse the lines of all corners.
+
+        Args:
+            corners: Format strings of the lines per corner, from top to
+                bottom.
+            opacity: Fixed-point opacity of the annotations (see
+                annotation.to_fixed_opacity).
+            color_order: Channel order of the frames (BGR or RGB).
+        """
+        self.corners: Dict[config.Corner, List[LineTemplate]] = {
+            config.Corner(corner): [parse_line(line) for line in lines]
+            for corner, lines in corners.items()
+        }
+        self.fields = frozenset(
+            field_name
+            for line in itertools.chain.from_iterable(self.corners.values())
+            for field_name in line.fields
+        )
+        self._opacity = opacity
+        self._color_order = color_order
+        self._padding = config.settings.annotation_padding
+        self._margin = config.settings.annotation_margin
+        # measured with the first frame, loading the font
+        self._line_height = 0
+        self._slots: Dict[SlotKey, Slots] = {}
+
+    def draw(self, frame: Any, field_values: FieldValues) -> Any:
+        """Draw all lines onto a frame in place.
+
+        Args:
+            frame: Input frame as OpenCV image.
+            field_values: Text per field name, None or empty if unavailable.
+
+        Returns:
+            The annotated frame.
+        """
+        slots = self._get_slots(field_values.get(CAMERA), *frame.shape[:2])
+        for lines, line_slots in zip(self.corners.values(), slots):
+            for line, slot in zip(lines, line_slots):
+                self._draw_line(frame, line, slot, field_values)
+        return frame
+
+    def _get_slots(
+        self,
+        camera: Optional[str],
+        height: int,
+        width: int,
+    ) -> Slots:
+        # each camera caches the text boxes of its own name
+        slot_key = (camera, height, width)
+        slots = self._slots.get(slot_key)
+        if slots is None:
+            slots = self._resolve_slots(height, width)
+            self._slots[slot_key] = slots
+        return slots
+
+    def _draw_line(
+        self,
+        frame: Any,
+        line: LineTemplate,
+        slot: _LineSlot,
+        field_values: FieldValues,
+    ) -> None:
+        if not all(field_values.get(name) for name in line.fields):
+            return
+        text = line.template.format(**field_values)
+        if not text:
+            return
+        coords = slot.get_coords(text, self._line_height, self._padding)
+        annotation.add_text(
+            frame=frame,
+            text=text,
+            box_coords=coords.box_coords,
+            opacity=self._opacity,
+            color_order=self._color_order,
+        )
+
+    def _resolve_slots(self, height: int, width: int) -> Slots:
+        if not self._line_height:
+            self._line_height = annotation.get_text_size(
+                LINE_HEIGHT_SAMPLE,
+                config.settings.annotation_override_text_height,
+            )[1]
+        return [
+            self._resolve_corner(corner, len(lines), height, width)
+            for corner, lines in self.corners.items()
+        ]
+
+    def _resolve_corner(
+        self,
+        corner: config.Corner,
+        line_count: int,
+        height: int,
+        width: int,
+    ) -> List[_LineSlot]:
+        # boxes of neighboring lines touch (inclusive corners, hence +1)
+        pitch = self._line_height + 2 * self._padding + 1
+        inset = self._margin + self._padding
+        align_right = corner in {
+            config.Corner.TOP_RIGHT, config.Corner.BOTTOM_RIGHT,
+        }
+        if corner in {config.Corner.TOP_LEFT, config.Corner.TOP_RIGHT}:
+            first_y = inset + self._line_height
+        else:
+            first_y = height - inset - (line_count - 1) * pitch
+        return [
+            _LineSlot(
+                first_y + index * pitch,
+                width - inset if align_right else inset,
+                align_right,
+            )
+            for index in range(line_count)
+        ]
@@ -1,12 +1,15 @@
 """Integration with gpsd through separate thread."""
 import math
-from threading import Lock, Thread
-from time import sleep
+import time
+from functools import partial
 from types import MappingProxyType
+from typing import Callable, List, NamedTuple, Optional
 
-import gps
+import arrow
 
 from minigugl import config
+from minigugl.gpsd import GpsdClient, Report
+from minigugl.track import GpsFix
 
 LATITUDE = 'lat'
 LONGITUDE = 'lon'
@@ -15,48 +18,186 @@ COMPASS = MappingProxyType({
     LONGITUDE: ('E', 'W'),
 })
 
+GpsCallback = Callable[[GpsFix], None]
 
-class GpsCoordinates(object):
-    """Thread-safe wrapper for GPS coordinates (latitude/longitude).
+
+class GpsSnapshot(NamedTuple):
+    """Immutable GPS position, published as a whole on every update.
 
     Attributes:
         lat: GPS latitude.
         lon: GPS longitude.
+        dms: Precomputed DMS representation of latitude and longitude.
+        received_at: Monotonic time of reception, None before the first fix.
+        satellites: Number of satellites used for the fix.
+        speed: Speed over ground in m/s, NaN if unknown.
+        track: Course over ground in degrees, NaN if unknown.
+        alt: Altitude (MSL) in meters, NaN if unknown.
+    """
+
+    lat: float
+    lon: float
+    dms: str
+    received_at: Optional[float] = None
+    satellites: int = 0
+    speed: float = math.nan
+    track: float = math.nan
+    alt: float = math.nan
+
+    @property
+    def age(self) -> float:
+        """Get the time since the fix was received.
+
+        Returns:
+            Age in seconds, infinite before the first fix.
+        """
+        if self.received_at is None:
+            return math.inf
+        return time.monotonic() - self.received_at
+
+
+def create_snapshot(
+    lat: float,
+    lon: float,
+    received_at: Optional[float] = None,
+) -> GpsSnapshot:
+    """Create a snapshot with precomputed DMS representation.
+
+    DMS = degrees, minutes, and seconds
+
+    Args:
+        lat: GPS latitude.
+        lon: GPS longitude.
+        received_at: Monotonic time of reception.
+
+    Returns:
+        Immutable GPS snapshot.
+    """
+    return GpsSnapshot(lat, lon, _format_dms(lat, lon), received_at)
+
+
+def _format_dms(lat: float, lon: float) -> str:
+    return '{0} {1}'.format(
+        deg_to_dms(lat, unit=LATITUDE),
+        deg_to_dms(lon, unit=LONGITUDE),
+    )
+
+
+class GpsCoordinates(object):
+    """Latest GPS coordinates (latitude/longitude) as immutable snapshot.
+
+    Each update replaces the snapshot reference at once, so readers (e.g.
+    the annotation of every frame) get a consistent position without any
+    locking or formatting. Subscribers are notified about every update in
+    the GPS thread.
+
+    Attributes:
+        snapshot: Latest GPS snapshot.
     """
 
     def __init__(self) -> None:
-        """Initialize latitude, longitude, and internal lock."""
-        self._lock = Lock()
-        self.lat: float = 0
-        self.lon: float = 0
+        """Initialize with a snapshot at latitude and longitude 0."""
+        self._subscribers: List[GpsCallback] = []
+        self.snapshot = create_snapshot(0, 0)
+
+    @property
+    def lat(self) -> float:
+        """Get the latest latitude.
 
-    def update(self, lat: float, lon: float) -> None:
-        """Thread-safe update of latitude & longitude.
+        Returns:
+            GPS latitude.
+        """
+        return self.snapshot.lat
+
+    @property
+    def lon(self) -> float:
+        """Get the latest longitude.
+
+        Returns:
+            GPS longitude.
+        """
+        return self.snapshot.lon
+
+    def subscribe(self, callback: GpsCallback) -> None:
+        """Register a callback for GPS updates.
+
+        Args:
+            callback: Callable receiving each GpsFix.
+        """
+        self._subscribers.append(callback)
+
+    def update(  # noqa: WPS211
+        self,
+        lat: float,
+        lon: float,
+        speed: float = math.nan,
+        track: float = math.nan,
+        alt: float = math.nan,
+        fix_time: Optional[float] = None,
+    ) -> None:
+        """Publish a new snapshot of latitude & longitude.
+
+        Must only be called from a single (GPS) thread.
 
         Args:
             lat: GPS latitude.
             lon: GPS longitude.
+            speed: Speed over ground in m/s, NaN if unknown.
+            track: Course over ground in degrees, NaN if unknown.
+            alt: Altitude (MSL) in meters, NaN if unknown.
+            fix_time: Time of the fix as UNIX timestamp, None to use the
+                time of reception.
         """
-        self._lock.acquire()
-        self.lat = lat
-        self.lon = lon
-        self._lock.release()
+        self.snapshot = GpsSnapshot(
+            lat=lat,
+            lon=lon,
+            dms=_format_dms(lat, lon),
+            received_at=time.monotonic(),
+            satellites=self.snapshot.satellites,
+            speed=speed,
+            track=track,
+            alt=alt,
+        )
+        fix = GpsFix(
+            time.time() if fix_time is None else fix_time,
+            lat,
+            lon,
+            speed,
+            track,
+            alt,
+        )
+        for callback in self._subscribers:
+            callback(fix)
+
+    def update_satellites(self, satellites: int) -> None:
+        """Publish a new snapshot with the number of satellites used.
+
+        Must only be called from a single (GPS) thread.
+
+        Args:
+            satellites: Number of satellites used for the fix.
+        """
+        snapshot = self.snapshot
+        self.snapshot = GpsSnapshot(
+            lat=snapshot.lat,
+            lon=snapshot.lon,
+            dms=snapshot.dms,
+            received_at=snapshot.received_at,
+            satellites=satellites,
+            speed=snapshot.speed,
+            track=snapshot.track,
+            alt=snapshot.alt,
+        )
 
     def __str__(self) -> str:
-        """Thread-safe string representation in DMS.
+        """Get the precomputed string representation in DMS.
 
         DMS = degrees, minutes, and seconds
 
         Returns:
             DMS-converted GPS coordinates.
         """
-        self._lock.acquire()
-        dms = '{0} {1}'.format(
-            deg_to_dms(self.lat, unit=LATITUDE),
-            deg_to_dms(self.lon, unit=LONGITUDE),
-        )
-        self._lock.release()
-        return dms
+        return self.snapshot.dms
 
 
 def deg_to_dms(deg: float, unit: str) -> str:  # noqa: WPS210
@@ -85,24 +226,50 @@ def deg_to_dms(deg: float, unit: str) -> str:  # noqa: WPS210
     )
 
 
-def _update_gps(gpsd: 'gps.gps', gps_coordinates: GpsCoordinates) -> None:
-    """Update geo coordinates with gps data from gpsd.
+def parse_fix_time(report: Report) -> Optional[float]:
+    """Get the time of the fix from a TPV report.
+
+    Args:
+        report: TPV report from gpsd as dict.
+
+    Returns:
+        Time of the fix as UNIX timestamp, None if missing or invalid.
+    """
+    fix_time = report.get('time')
+    if fix_time is None:
+        return None
+    try:
+        # ISO 8601 in UTC, seconds since the epoch in old gpsd versions
+        return arrow.get(fix_time).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def handle_report(gps_coordinates: GpsCoordinates, report: Report) -> None:
+    """Update geo coordinates with a report from gpsd.
 
     https://gpsd.gitlab.io/gpsd/gpsd_json.html#_tpv
+    https://gpsd.gitlab.io/gpsd/gpsd_json.html#_sky
 
     Args:
-        gpsd: An instance of the GPS daemon interface.
         gps_coordinates: A GpsCoordinates instance.
+        report: Report from gpsd as dict.
     """
-    while True:  # noqa: WPS457
-        gps_data = next(gpsd)
-        if gps_data.get('class') == 'TPV':
-            if gps_data.get(LATITUDE) and gps_data.get(LONGITUDE):
-                gps_coordinates.update(
-                    gps_data.get(LATITUDE),
-                    gps_data.get(LONGITUDE),
-                )
-        sleep(config.settings.gps_interval_sec)
+    if report.get('class') == 'TPV':
+        if LATITUDE in report and LONGITUDE in report:
+            gps_coordinates.update(
+                report[LATITUDE],
+                report[LONGITUDE],
+                speed=report.get('speed', math.nan),
+                track=report.get('track', math.nan),
+                alt=report.get('altMSL', report.get('alt', math.nan)),
+                fix_time=parse_fix_time(report),
+            )
+    elif report.get('class') == 'SKY':
+        satellites = report.get('satellites', [])
+        gps_coordinates.update_satellites(report.get('uSat', sum(
+            1 for satellite in satellites if satellite.get('used')
+        )))
 
 
 def start_gps_thread() -> GpsCoordinates:
@@ -111,14 +278,10 @@ def start_gps_thread() -> GpsCoordinates:
     Returns:
         An instance of GpsCoordinates which gets continously updated.
     """
-    # WATCH_ENABLE   # enable streaming
-    # WATCH_NEWSTYLE # force JSON streaming
-    gpsd = gps.gps(mode=gps.WATCH_ENABLE | gps.WATCH_NEWSTYLE)
     gps_coordinates = GpsCoordinates()
-    gps_thread = Thread(
-        target=_update_gps,
-        args=(gpsd, gps_coordinates),
-        daemon=True,
-    )
-    gps_thread.start()
+    GpsdClient(
+        on_report=partial(handle_report, gps_coordinates),
+        host=config.settings.gpsd_host,
+        port=config.settings.gpsd_port,
+    ).start()
     return gps_coordinates
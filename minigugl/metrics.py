@@ -0,0 +1,229 @@
+"""Pipeline metrics as histograms, Prometheus endpoint, and periodic logs."""
+import math
+from bisect import bisect_left
+from collections import deque
+from http import HTTPStatus
+from itertools import repeat
+from threading import Event, Thread
+from typing import (  # noqa: WPS235
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Sequence,
+)
+
+from loguru import logger
+
+from minigugl.server import (
+    QuietRequestHandler,
+    ThreadingHTTPServer,
+    serve_in_thread,
+)
+
+if TYPE_CHECKING:
+    from minigugl.pipeline import Pipeline  # noqa: F401
+
+# Upper bounds of the histogram buckets in seconds
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+ROLLING_WINDOW = 256
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+BUCKET_TEMPLATE = 'minigugl_stage_seconds_bucket{{{0},le="{1}"}} {2}'
+SUM_TEMPLATE = 'minigugl_stage_seconds_sum{{{0}}} {1}'
+COUNT_TEMPLATE = 'minigugl_stage_seconds_count{{{0}}} {1}'
+LABEL_ESCAPES = str.maketrans({'\\': r'\\', '"': r'\"', '\n': r'\n'})
+SUMMARY_PERCENTILES = (50, 99)
+
+
+class Histogram(object):
+    """Histogram of durations with a rolling window for percentiles.
+
+    Bucket counts, sum, and count are cumulative (as Prometheus expects),
+    while percentiles are calculated from the most recent observations only.
+    Each histogram is expected to be updated by a single thread.
+
+    Attributes:
+        bucket_counts: Number of observations per bucket (not cumulative).
+        count: Total number of observations.
+        sum: Total of all observed durations in seconds.
+    """
+
+    def __init__(self, window: int = ROLLING_WINDOW) -> None:
+        """Initialize empty histogram.
+
+        Args:
+            window: Number of most recent observations kept for percentiles.
+        """
+        # last bucket is +Inf
+        self.bucket_counts = list(repeat(0, len(BUCKETS) + 1))
+        self.count = 0
+        self.sum: float = 0  # noqa: WPS125
+        self._recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        """Record a single duration.
+
+        Args:
+            seconds: Observed duration in seconds.
+        """
+        self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self._recent.append(seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Calculate a percentile of the most recent observations.
+
+        Args:
+            percent: Percentile between 0 and 100.
+
+        Returns:
+            Duration in seconds or NaN without any observations.
+        """
+        recent = sorted(self._recent)
+        if not recent:
+            return math.nan
+        index = int(len(recent) * percent / 100)
+        return recent[min(index, len(recent) - 1)]
+
+
+def _escape_label(label_value: str) -> str:
+    return label_value.translate(LABEL_ESCAPES)
+
+
+def render_prometheus(pipelines: Sequence['Pipeline']) -> str:  # noqa: WPS210
+    """Render metrics of all pipelines in Prometheus text format.
+
+    Args:
+        pipelines: Pipelines (one per camera) to report on.
+
+    Returns:
+        Metrics in Prometheus text exposition format.
+    """
+    lines = [
+        '# HELP minigugl_stage_seconds Time spent per frame in each stage.',
+        '# TYPE minigugl_stage_seconds histogram',
+    ]
+    for pipeline in pipelines:
+        camera = _escape_label(pipeline.name)
+        for stage, histogram in pipeline.timings.items():
+            labels = 'camera="{0}",stage="{1}"'.format(camera, stage)
+            cumulative = 0
+            bounds = [*(str(bound) for bound in BUCKETS), '+Inf']
+            for bound, bucket_count in zip(bounds, histogram.bucket_counts):
+                cumulative += bucket_count
+                lines.append(BUCKET_TEMPLATE.format(labels, bound, cumulative))
+            lines.append(SUM_TEMPLATE.format(labels, histogram.sum))
+            lines.append(COUNT_TEMPLATE.format(labels, histogram.count))
+    counters = (
+        ('frames_in_total', 'counter', 'Frames read from the source.'),
+        ('frames_written_total', 'counter', 'Frames passed to the encoder.'),
+        ('frames_dropped_total', 'counter', 'Frames dropped by backpressure.'),
+        ('encoder_lag_frames', 'gauge', 'Frames waiting for the encoder.'),
+    )
+    for name, metric_type, description in counters:
+        lines.append('# HELP minigugl_{0} {1}'.format(name, description))
+        lines.append('# TYPE minigugl_{0} {1}'.format(name, metric_type))
+        for pipeline in pipelines:  # noqa: WPS440
+            lines.append('minigugl_{0}{{camera="{1}"}} {2}'.format(
+                name,
+                _escape_label(pipeline.name),
+                _get_counters(pipeline)[name],
+            ))
+    return '{0}\n'.format('\n'.join(lines))
+
+
+def summarize(pipelines: Sequence['Pipeline']) -> List[Dict[str, Any]]:
+    """Summarize metrics of all pipelines, e.g. as log payload.
+
+    Args:
+        pipelines: Pipelines (one per camera) to report on.
+
+    Returns:
+        List with a dict of counters and stage percentiles per pipeline.
+    """
+    return [
+        {
+            'camera': pipeline.name,
+            **_get_counters(pipeline),
+            'stages_ms': {
+                stage: _summarize_histogram(histogram)
+                for stage, histogram in pipeline.timings.items()
+            },
+        }
+        for pipeline in pipelines
+    ]
+
+
+def _summarize_histogram(histogram: Histogram) -> Dict[str, float]:
+    return {
+        'p{0}'.format(percent): round(1000 * histogram.percentile(percent), 2)
+        for percent in SUMMARY_PERCENTILES
+    }
+
+
+def _get_counters(pipeline: 'Pipeline') -> Dict[str, int]:
+    return {
+        'frames_in_total': pipeline.frames_in,
+        'frames_written_total': pipeline.frames_out,
+        'frames_dropped_total': pipeline.dropped,
+        'encoder_lag_frames': pipeline.queues[-1].qsize(),
+    }
+
+
+def start_metrics_server(
+    pipelines: Sequence['Pipeline'],
+    host: str,
+    port: int,
+) -> ThreadingHTTPServer:
+    """Serve metrics in Prometheus text format on /metrics.
+
+    Args:
+        pipelines: Pipelines (one per camera) to report on.
+        host: Host address to bind to.
+        port: Port to bind to.
+
+    Returns:
+        The running HTTP server.
+    """
+    class MetricsHandler(QuietRequestHandler):  # noqa: WPS431
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            body = render_prometheus(pipelines).encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    logger.info('Serving metrics on http://{0}:{1}/metrics', host, port)
+    return serve_in_thread(MetricsHandler, host, port)
+
+
+def start_metrics_logger(
+    pipelines: Sequence['Pipeline'],
+    interval_sec: float,
+) -> Callable[[], None]:
+    """Periodically log a metrics summary as payload.
+
+    Args:
+        pipelines: Pipelines (one per camera) to report on.
+        interval_sec: Time between log entries in seconds.
+
+    Returns:
+        Callable to stop logging.
+    """
+    stopped = Event()
+
+    def log_metrics() -> None:  # noqa: WPS430
+        while not stopped.wait(interval_sec):
+            logger.bind(payload=summarize(pipelines)).info('Pipeline metrics')
+
+    Thread(target=log_metrics, name='metrics-logger', daemon=True).start()
+    return stopped.set
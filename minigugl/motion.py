@@ -0,0 +1,138 @@
+"""Motion detection gating which frames get recorded.
+
+Each frame is downscaled to a small grayscale image and compared to the
+previous one. Frames are passed on while there is motion in any of the
+configured regions, and for a hold time afterwards (post-roll).
+"""
+from typing import Any, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from minigugl.clock import CapturedFrame
+
+# left, top, right, bottom as fractions of the frame's width and height
+Region = Tuple[float, float, float, float]
+WHOLE_FRAME: Region = (0, 0, 1, 1)
+
+
+def get_region_slices(
+    shape: Tuple[int, ...],
+    regions: Sequence[Region],
+) -> List[Tuple[slice, slice]]:
+    """Convert relative regions to slices of an image of the given shape.
+
+    Args:
+        shape: Shape of the image (height, width).
+        regions: Regions as fractions of the width and height.
+
+    Returns:
+        List of (rows, columns) slices, each covering at least one pixel.
+    """
+    height, width = shape[:2]
+    return [
+        _get_region_slice(region, height, width)
+        for region in regions or [WHOLE_FRAME]
+    ]
+
+
+def _get_region_slice(
+    region: Region,
+    height: int,
+    width: int,
+) -> Tuple[slice, slice]:
+    left, top, right, bottom = region
+    return _get_span(top, bottom, height), _get_span(left, right, width)
+
+
+def _get_span(start: float, end: float, size: int) -> slice:
+    first = int(start * size)
+    return slice(first, max(int(end * size), first + 1))
+
+
+class MotionDetector(object):
+    """Pipeline stage dropping frames without recent motion.
+
+    Attributes:
+        name: Name used for logging.
+        motion: Whether the last frame is being recorded due to motion.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        threshold: int,
+        min_area: float,
+        regions: Sequence[Region],
+        hold_sec: float,
+        analysis_width: int,
+        name: str = 'motion',
+    ) -> None:
+        """Initialize detector without a reference frame.
+
+        Args:
+            threshold: Minimum change of a pixel's gray value (0-255).
+            min_area: Minimum share (0-1) of changed pixels within a region.
+            regions: Regions to watch, empty for the whole frame.
+            hold_sec: Time to keep recording after the last motion.
+            analysis_width: Width of the downscaled frames compared.
+            name: Name used for logging.
+        """
+        self.name = name
+        self.motion = False
+        self._threshold = threshold
+        self._min_area = min_area
+        self._regions = regions
+        self._hold_sec = hold_sec
+        self._analysis_width = analysis_width
+        self._previous: Optional[Any] = None
+        self._slices: List[Tuple[slice, slice]] = []
+        self._recording_until: float = 0
+
+    def __call__(self, frame: CapturedFrame) -> Optional[CapturedFrame]:
+        """Pass on the frame if there was motion within the hold time.
+
+        Args:
+            frame: Captured frame with OpenCV image (numpy array) in BGR.
+
+        Returns:
+            The unmodified frame or None to skip it.
+        """
+        now = frame.captured_at
+        if self._detect(frame.image):
+            self._recording_until = now + self._hold_sec
+        recording = now < self._recording_until
+        if recording != self.motion:
+            self.motion = recording
+            logger.info(
+                '{0}: {1}',
+                self.name,
+                'motion detected' if recording else 'no motion anymore',
+            )
+        return frame if recording else None
+
+    def _detect(self, frame: Any) -> bool:
+        gray = self._downscale(frame)
+        previous = self._previous
+        self._previous = gray
+        if previous is None or previous.shape != gray.shape:
+            self._slices = get_region_slices(gray.shape, self._regions)
+            return False
+        changed = cv2.absdiff(gray, previous) > self._threshold
+        return any(
+            self._is_moving(changed[region_slice])
+            for region_slice in self._slices
+        )
+
+    def _downscale(self, frame: Any) -> Any:
+        height, width = frame.shape[:2]
+        size = (
+            self._analysis_width,
+            max(height * self._analysis_width // width, 1),
+        )
+        # averaging while downscaling also suppresses sensor noise
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _is_moving(self, changed: Any) -> bool:
+        return np.count_nonzero(changed) >= self._min_area * changed.size
@@ -0,0 +1,273 @@
+"""Staged frame processing with one thread per stage and bounded queues."""
+import queue
+import time
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from minigugl.config import DropPolicy
+from minigugl.metrics import Histogram
+
+Source = Callable[[], Optional[Any]]
+Work = Callable[[Any], Optional[Any]]
+
+# Marker passed through all queues to shut down the stages one after another
+END_OF_STREAM = object()
+
+
+class FrameQueue(object):
+    """Bounded queue between two stages applying a backpressure policy.
+
+    Attributes:
+        drop_policy: Behavior when putting an item into a full queue.
+        dropped: Number of items dropped due to the queue being full.
+    """
+
+    def __init__(self, maxsize: int, drop_policy: DropPolicy) -> None:
+        """Initialize queue with maximum size and drop policy.
+
+        Args:
+            maxsize: Maximum number of items in the queue.
+            drop_policy: Behavior when putting an item into a full queue.
+        """
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._queue: 'queue.Queue[Any]' = queue.Queue(maxsize=maxsize)
+        self._lock = Lock()
+
+    def put(self, frame: Any) -> None:
+        """Put an item into the queue according to the drop policy.
+
+        END_OF_STREAM is never dropped and always waits for a free slot.
+
+        Args:
+            frame: Item to be put into the queue.
+        """
+        if frame is END_OF_STREAM or self.drop_policy == DropPolicy.BLOCK:
+            self._queue.put(frame)
+        elif self.drop_policy == DropPolicy.DROP_NEWEST:
+            if not self._put_nowait(frame):
+                self._count_drop()
+        else:
+            self._put_drop_oldest(frame)
+
+    def get(self) -> Any:
+        """Remove and return the next item, blocking until one is available.
+
+        Returns:
+            The next item in the queue.
+        """
+        return self._queue.get()
+
+    def qsize(self) -> int:
+        """Get the approximate number of queued items.
+
+        Returns:
+            Number of items in the queue.
+        """
+        return self._queue.qsize()
+
+    def _put_nowait(self, frame: Any) -> bool:
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            return False
+        return True
+
+    def _put_drop_oldest(self, frame: Any) -> None:
+        while not self._put_nowait(frame):
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                continue  # consumer emptied the queue in the meantime
+            self._count_drop()
+
+    def _count_drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+
+class Pipeline(object):  # noqa: WPS214
+    """Chain of stages connected by bounded queues, each in its own thread.
+
+    The first thread pulls items from the source and feeds the first stage.
+    Each stage processes one item at a time and passes its result on to the
+    next stage. A stage returning None consumes the item. The pipeline ends
+    once the source returns None or the pipeline gets stopped.
+
+    A failing stage skips the item, except for an OSError (e.g. a broken
+    pipe to FFmpeg) or any failure of the last stage: both stop the
+    pipeline, the remaining items are drained, and join() raises the error.
+
+    Attributes:
+        name: Name used for threads and logging.
+        frames_in: Number of items read from the source.
+        frames_out: Number of items processed by the last stage.
+        queues: Queues in front of each stage.
+        timings: Histograms of the time spent per item in reading from the
+            source ('read') and in each stage (by stage name).
+        error: Error that stopped the pipeline, None while healthy.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        source: Source,
+        stages: Sequence[Tuple[str, Work]],
+        queue_size: int,
+        drop_policy: DropPolicy,
+        name: str = 'pipeline',
+    ) -> None:
+        """Set up queues and threads for all stages.
+
+        Args:
+            source: Callable returning the next item or None at the end.
+            stages: Sequence of stage names and work callables.
+            queue_size: Maximum number of items waiting in front of a stage.
+            drop_policy: Behavior when a stage falls behind.
+            name: Name used for threads and logging.
+        """
+        self.name = name
+        self.frames_in = 0
+        self.frames_out = 0
+        self.queues: List[FrameQueue] = [
+            FrameQueue(queue_size, drop_policy) for _ in stages
+        ]
+        self.timings: Dict[str, Histogram] = {'read': Histogram()}
+        self.timings.update(
+            (stage_name, Histogram()) for stage_name, _ in stages
+        )
+        self.error: Optional[Exception] = None
+        self._source = source
+        self._stopped = Event()
+        self._threads = [
+            Thread(
+                target=self._capture,
+                name='{0}-capture'.format(name),
+                daemon=True,
+            ),
+        ]
+        for index, (stage_name, work) in enumerate(stages):
+            self._threads.append(Thread(
+                target=self._process,
+                args=(index, stage_name, work),
+                name='{0}-{1}'.format(name, stage_name),
+                daemon=True,
+            ))
+
+    @property
+    def dropped(self) -> int:
+        """Get the number of items dropped in front of any stage.
+
+        Returns:
+            Number of dropped items.
+        """
+        return sum(frame_queue.dropped for frame_queue in self.queues)
+
+    def start(self) -> 'Pipeline':
+        """Start all stage threads.
+
+        Returns:
+            The started pipeline itself.
+        """
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop reading from the source and let the stages drain."""
+        self._stopped.set()
+
+    def is_alive(self) -> bool:
+        """Check whether any stage is still processing.
+
+        Returns:
+            True if at least one thread is still running.
+        """
+        return any(thread.is_alive() for thread in self._threads)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the last stage to finish.
+
+        Args:
+            timeout: Maximum time to wait in seconds, None to wait forever.
+
+        Raises:
+            error: Error of a stage that stopped the pipeline, once all
+                stages finished.
+        """
+        self._threads[-1].join(timeout)
+        if self.error is not None and not self.is_alive():
+            raise self.error
+
+    def _capture(self) -> None:
+        read_timing = self.timings['read']
+        while not self._stopped.is_set():
+            started_at = time.perf_counter()
+            frame = self._source()
+            read_timing.observe(time.perf_counter() - started_at)
+            if frame is None:
+                logger.info('{0}: end of stream', self.name)
+                break
+            self.frames_in += 1
+            self.queues[0].put(frame)
+        self.queues[0].put(END_OF_STREAM)
+
+    def _process(self, index: int, stage_name: str, work: Work) -> None:
+        inbox = self.queues[index]
+        frame = inbox.get()
+        while frame is not END_OF_STREAM:
+            # after a fatal error, the remaining frames are only drained
+            if self.error is None:
+                self._process_frame(index, stage_name, work, frame)
+            frame = inbox.get()
+        if index + 1 < len(self.queues):
+            self.queues[index + 1].put(END_OF_STREAM)
+        else:
+            logger.info(
+                '{0}: {1} frames in, {2} frames out, {3} frames dropped',
+                self.name,
+                self.frames_in,
+                self.frames_out,
+                self.dropped,
+            )
+
+    def _process_frame(
+        self,
+        index: int,
+        stage_name: str,
+        work: Work,
+        frame: Any,
+    ) -> None:
+        is_last = index + 1 == len(self.queues)
+        started_at = time.perf_counter()
+        try:
+            processed = work(frame)
+        except Exception as error:
+            self._handle_error(stage_name, error, is_fatal=is_last)
+            return
+        finally:
+            self.timings[stage_name].observe(time.perf_counter() - started_at)
+        if is_last:
+            self.frames_out += 1
+        elif processed is not None:
+            self.queues[index + 1].put(processed)
+
+    def _handle_error(
+        self,
+        stage_name: str,
+        error: Exception,
+        is_fatal: bool,
+    ) -> None:
+        if not is_fatal and not isinstance(error, OSError):
+            logger.exception('{0}: failed to process frame', self.name)
+            return
+        # e.g. FFmpeg died, every further frame would fail the same way
+        logger.error(
+            '{0}: stage {1} failed, stopping: {2!r}',
+            self.name,
+            stage_name,
+            error,
+        )
+        self.error = error
+        self.stop()
@@ -0,0 +1,189 @@
+"""Low-resolution live preview of recorded frames as MJPEG over HTTP.
+
+The preview taps frames from the recording pipeline instead of opening
+the video source a second time. A separate thread downscales and encodes
+the latest frame at a capped rate, only while anyone is watching, and all
+viewers share the same JPEG. The recording never waits for the preview:
+frames arriving while the previous one is still being encoded are
+skipped.
+"""
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from threading import Condition, Thread
+from typing import Any, Optional, Sequence, Tuple
+
+import cv2
+from loguru import logger
+
+from minigugl.clock import CapturedFrame
+from minigugl.server import (
+    QuietRequestHandler,
+    ThreadingHTTPServer,
+    send_mjpeg_frame,
+    send_mjpeg_headers,
+    serve_in_thread,
+)
+
+PREVIEW_PATH = '/preview/{0}'
+# idle viewers get the last image again to notice disconnects
+VIEWER_TIMEOUT_SEC = 1
+
+
+class PreviewTap(object):  # noqa: WPS214, WPS230
+    """Pipeline stage passing frames on unchanged, sampling a preview.
+
+    Attributes:
+        name: Name of the camera, used in the preview URL.
+        viewers: Number of clients currently watching.
+        sequence: Number of the latest encoded JPEG, 0 before the first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        width: int,
+        max_fps: float,
+        jpeg_quality: int,
+    ) -> None:
+        """Start the encoding thread, idle until a viewer connects.
+
+        Args:
+            name: Name of the camera, used in the preview URL.
+            width: Width of the preview in pixels, keeping the aspect ratio.
+            max_fps: Maximum framerate of the preview.
+            jpeg_quality: JPEG quality (0-100).
+        """
+        self.name = name
+        self.viewers = 0
+        self.sequence = 0
+        self._width = width
+        self._interval_sec = 1 / max_fps
+        self._encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self._next_at: float = 0
+        self._pending: Optional[Any] = None
+        self._jpeg = b''
+        self._condition = Condition()
+        Thread(
+            target=self._run,
+            name='{0}-preview'.format(name),
+            daemon=True,
+        ).start()
+
+    def __call__(self, frame: CapturedFrame) -> CapturedFrame:
+        """Hand the frame over for the preview if one is due.
+
+        Never waits for the encoding thread.
+
+        Args:
+            frame: Captured frame, must not be modified by later stages.
+
+        Returns:
+            The unmodified frame.
+        """
+        if self.viewers and frame.captured_at >= self._next_at:
+            self._next_at = frame.captured_at + self._interval_sec
+            # only the latest frame is kept if encoding falls behind
+            with self._condition:
+                self._pending = frame.image
+                self._condition.notify_all()
+        return frame
+
+    def watch(self, sequence: int) -> Optional[Tuple[int, bytes]]:
+        """Wait for a JPEG newer than the one a viewer has seen.
+
+        Args:
+            sequence: Number of the JPEG the viewer has seen, 0 if none.
+
+        Returns:
+            Number and data of the latest JPEG, None on timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.sequence > sequence, timeout=VIEWER_TIMEOUT_SEC,
+            )
+            if self.sequence <= sequence:
+                return None
+            return self.sequence, self._jpeg
+
+    def subscribe(self) -> None:
+        """Register a viewer, enabling the preview."""
+        with self._condition:
+            self.viewers += 1
+
+    def unsubscribe(self) -> None:
+        """Unregister a viewer, disabling the preview without viewers."""
+        with self._condition:
+            self.viewers -= 1
+
+    def _run(self) -> None:
+        while True:  # noqa: WPS457
+            jpeg = self._encode(self._take_pending())
+            with self._condition:
+                self.sequence += 1
+                self._jpeg = jpeg
+                self._condition.notify_all()
+
+    def _take_pending(self) -> Any:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending is not None)
+            image = self._pending
+            self._pending = None
+        return image
+
+    def _encode(self, image: Any) -> bytes:
+        height, width = image.shape[:2]
+        if width > self._width:
+            size = (self._width, max(height * self._width // width, 1))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return cv2.imencode('.jpg', image, self._encode_params)[1].tobytes()
+
+
+def start_preview_server(
+    taps: Sequence[PreviewTap],
+    host: str,
+    port: int,
+) -> ThreadingHTTPServer:
+    """Serve the preview of each camera as MJPEG at /preview/<camera>.
+
+    Args:
+        taps: Preview taps (one per camera).
+        host: Host address to bind to.
+        port: Port to bind to.
+
+    Returns:
+        The running HTTP server.
+    """
+    taps_by_path = {PREVIEW_PATH.format(tap.name): tap for tap in taps}
+
+    class PreviewHandler(QuietRequestHandler):  # noqa: WPS431
+        def do_GET(self) -> None:  # noqa: N802
+            tap = taps_by_path.get(self.path.split('?')[0])
+            if tap is None:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            send_mjpeg_headers(self)
+            tap.subscribe()
+            try:
+                _stream(self, tap)
+            except ConnectionError:
+                return  # client disconnected
+            finally:
+                tap.unsubscribe()
+
+    for path in taps_by_path:
+        logger.info('Serving preview on http://{0}:{1}{2}', host, port, path)
+    return serve_in_thread(PreviewHandler, host, port)
+
+
+def _stream(
+    request_handler: BaseHTTPRequestHandler,
+    tap: PreviewTap,
+) -> None:
+    sequence, jpeg = 0, b''
+    while True:  # noqa: WPS457
+        latest = tap.watch(sequence)
+        if latest is not None:
+            sequence, jpeg = latest
+        if jpeg:
+            # repeated on timeout to notice disconnected viewers
+            send_mjpeg_frame(request_handler, jpeg)
@@ -0,0 +1,708 @@
+"""Recording of a single video source into segmented video files."""
+import subprocess  # noqa: S404
+import time
+from functools import partial
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from loguru import logger
+from vidgear.gears import VideoGear, WriteGear
+
+from minigugl import config
+from minigugl.clips import CLIP_TEE_OUTPUT, ClipBuffer
+from minigugl.clock import CapturedFrame, capture_frame
+from minigugl.ffmpeg import (
+    FFmpegWriter,
+    build_output_args,
+    build_split_output_args,
+    build_tee_output_args,
+)
+from minigugl.governor import GovernedWriter
+from minigugl.motion import MotionDetector
+from minigugl.pipeline import Pipeline, Work
+from minigugl.preview import PreviewTap
+from minigugl.segments import (
+    SegmentWatcher,
+    segment_list_options,
+    segment_list_path,
+)
+from minigugl.sidecar import SubtitleSidecar
+from minigugl.watchdog import StreamWatchdog
+
+Annotate = Callable[[CapturedFrame], CapturedFrame]
+Caption = Callable[[], str]
+STREAM_COPY = 'copy'
+RENDITION_FALLBACK_CODEC = 'libx264'  # renditions can't copy the stream
+
+
+def build_ffmpeg_options(
+    camera: config.CameraSettings,
+    video_filter: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Build the WriteGear/FFmpeg output parameters for a camera.
+
+    https://trac.ffmpeg.org/wiki/Encode/H.264
+    https://www.ffmpeg.org/ffmpeg-all.html#Codec-Options
+
+    Args:
+        camera: Settings of the camera to be recorded.
+        video_filter: Optional filter chain applied before encoding.
+
+    Returns:
+        Dict of FFmpeg parameters as expected by WriteGear.
+    """
+    ffmpeg_options: Dict[str, Any] = {
+        '-c:v': camera.video_codec,
+        '-map': 0,  # map all streams from the first input to output
+        '-segment_time': camera.video_segment_length_sec,
+        '-g': camera.video_framerate,  # group of picture (GOP) size = fps
+        '-sc_threshold': 0,  # disable scene detection
+        '-force_key_frames': 'expr:gte(t,n_forced*{0})'.format(
+            # force key frame every x seconds
+            camera.video_segment_length_sec,
+        ),
+        # use `-clones` for `-f` parameter since WriteGear internally applies
+        # critical '-f rawvideo' parameter to every FFmpeg pipeline
+        '-clones': ['-f', 'segment'],  # enable segment muxer
+        '-input_framerate': camera.video_framerate,
+        '-r': camera.video_framerate,  # output framerate
+        '-pix_fmt': 'yuv420p',  # for output to work in QuickTime
+        # reset timestamps at beginning of each segment
+        '-reset_timestamps': 1,
+        '-strftime': 1,  # expand the segment filename with localtime
+        **segment_list_options(
+            segment_list_path(camera.output_dir, camera.name),
+        ),
+    }
+    if camera.video_codec == 'libx264':
+        ffmpeg_options.update({
+            '-crf': camera.video_crf,  # constant rate factor, decides quality
+            # preset for encoding speed/compression ratio
+            '-preset': camera.video_preset,
+            '-tune': 'zerolatency',  # fast encoding and low-latency streaming
+        })
+    if video_filter:
+        ffmpeg_options['-vf'] = video_filter
+    return ffmpeg_options
+
+
+def build_rendition_filter(
+    camera: config.CameraSettings,
+    rendition: config.CameraSettings,
+) -> Optional[str]:
+    """Build the filter chain converting a camera's frames for a rendition.
+
+    Args:
+        camera: Settings of the recorded camera.
+        rendition: Settings of the rendition.
+
+    Returns:
+        Filter chain scaling and/or reducing the framerate, None if the
+        rendition matches the camera.
+    """
+    filters = []
+    size = (rendition.video_width, rendition.video_height)
+    if size != (camera.video_width, camera.video_height):
+        filters.append('scale={0}:{1}'.format(
+            rendition.video_width, rendition.video_height,
+        ))
+    if rendition.video_framerate != camera.video_framerate:
+        filters.append('fps={0}'.format(rendition.video_framerate))
+    return ','.join(filters) or None
+
+
+def build_rendition_options(
+    camera: config.CameraSettings,
+    rendition: config.CameraSettings,
+    video_filter: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Build the FFmpeg output parameters for a rendition of a camera.
+
+    Args:
+        camera: Settings of the recorded camera.
+        rendition: Settings of the rendition.
+        video_filter: Optional filter chain applied before the conversion.
+
+    Returns:
+        Dict of FFmpeg parameters as expected by WriteGear.
+    """
+    if rendition.video_codec == STREAM_COPY:
+        rendition = rendition.copy(
+            update={'video_codec': RENDITION_FALLBACK_CODEC},
+        )
+    rendition_filter = ','.join(filter(None, (
+        video_filter, build_rendition_filter(camera, rendition),
+    )))
+    ffmpeg_options = build_ffmpeg_options(rendition, rendition_filter or None)
+    # frames arrive at the camera's framerate
+    ffmpeg_options['-input_framerate'] = camera.video_framerate
+    return ffmpeg_options
+
+
+def get_output_filename(camera: config.CameraSettings) -> str:
+    """Get the output file pattern of a camera or rendition.
+
+    Args:
+        camera: Settings of the camera or rendition.
+
+    Returns:
+        strftime pattern of the segment files within the output directory.
+    """
+    return str(Path(camera.output_dir) / camera.output_filename)
+
+
+def create_stream(camera: config.CameraSettings) -> Any:
+    """Open and start reading the video source of a camera.
+
+    Args:
+        camera: Settings of the camera to be recorded.
+
+    Returns:
+        Started VideoGear instance.
+    """
+    opencv_options = {
+        'CAP_PROP_FRAME_WIDTH': camera.video_width,
+        'CAP_PROP_FRAME_HEIGHT': camera.video_height,
+        'CAP_PROP_FPS': camera.video_framerate,
+    }
+    return VideoGear(
+        source=camera.video_source,
+        **opencv_options,
+    ).start()
+
+
+class RecordedOutput(NamedTuple):
+    """Segmented output of a recorder, the camera's own or a rendition.
+
+    Attributes:
+        camera: Settings of the camera or rendition.
+        segments: Watcher notifying about completed segments.
+    """
+
+    camera: config.CameraSettings
+    segments: SegmentWatcher
+
+
+def create_outputs(camera: config.CameraSettings) -> List[RecordedOutput]:
+    """Create the output directories and segment watchers of a camera.
+
+    Args:
+        camera: Settings of the camera to be recorded.
+
+    Returns:
+        The camera's own output, followed by one output per rendition.
+    """
+    outputs = []
+    for output in (camera, *camera.resolve_renditions()):
+        Path(output.output_dir).mkdir(parents=True, exist_ok=True)
+        outputs.append(RecordedOutput(output, SegmentWatcher(
+            segment_list_path(output.output_dir, output.name),
+            output.output_filename,
+        )))
+    return outputs
+
+
+def create_watched_stream(camera: config.CameraSettings) -> Any:
+    """Open the video source of a camera, reconnecting whenever it stalls.
+
+    Args:
+        camera: Settings of the camera to be recorded.
+
+    Returns:
+        StreamWatchdog instance, or the VideoGear instance if
+        STREAM_STALL_TIMEOUT_SEC is 0.
+    """
+    stream = create_stream(camera)
+    if config.settings.stream_stall_timeout_sec <= 0:
+        return stream
+    return StreamWatchdog(
+        stream,
+        open_stream=partial(create_stream, camera),
+        name=camera.name,
+        stall_timeout_sec=config.settings.stream_stall_timeout_sec,
+        framerate=camera.video_framerate,
+        gap_fill=config.settings.stream_gap_fill,
+        reconnect_max_sec=config.settings.stream_reconnect_max_sec,
+    )
+
+
+def create_clip_buffer(camera: config.CameraSettings) -> Optional[ClipBuffer]:
+    """Create the in-memory buffer for clip exports of a camera.
+
+    Args:
+        camera: Settings of the camera to be recorded.
+
+    Returns:
+        ClipBuffer instance or None if CLIP_BUFFER_SEC is not set.
+    """
+    if config.settings.clip_buffer_sec <= 0:
+        return None
+    clip_dir = config.settings.clip_dir or str(
+        Path(camera.output_dir) / 'clips',
+    )
+    return ClipBuffer(
+        name=camera.name,
+        clip_dir=Path(clip_dir),
+        max_sec=config.settings.clip_buffer_sec,
+        max_bytes=config.settings.clip_buffer_max_bytes,
+        post_event_sec=config.settings.clip_post_event_sec,
+        ffmpeg_path=config.settings.ffmpeg_path or 'ffmpeg',
+    )
+
+
+def create_preview(camera: config.CameraSettings) -> Optional[PreviewTap]:
+    """Create the live preview tap of a camera.
+
+    Args:
+        camera: Settings of the camera to be recorded.
+
+    Returns:
+        PreviewTap instance or None if PREVIEW_PORT is not set.
+    """
+    if not config.settings.preview_port:
+        return None
+    return PreviewTap(
+        name=camera.name,
+        width=config.settings.preview_width,
+        max_fps=config.settings.preview_max_fps,
+        jpeg_quality=config.settings.preview_jpeg_quality,
+    )
+
+
+def create_writer(
+    camera: config.CameraSettings,
+    video_filter: Optional[str] = None,
+    clip_buffer: Optional[ClipBuffer] = None,
+) -> Any:
+    """Create the writer for the segmented output of a camera.
+
+    Args:
+        camera: Settings of the camera to be recorded.
+        video_filter: Optional filter chain applied before encoding.
+        clip_buffer: Optional buffer receiving the encoded video, requires
+            VIDEO_WRITER_BACKEND=ffmpeg.
+
+    Returns:
+        WriteGear or FFmpegWriter instance, see VIDEO_WRITER_BACKEND, or
+        FanOutWriter of one WriteGear instance per rendition.
+    """
+    renditions = camera.resolve_renditions()
+    for output in (camera, *renditions):
+        Path(output.output_dir).mkdir(parents=True, exist_ok=True)
+    if config.settings.video_writer_backend == config.WriterBackend.FFMPEG:
+        # one FFmpeg process encodes all renditions
+        return FFmpegWriter(
+            output_filename=get_output_filename(camera),
+            ffmpeg_path=config.settings.ffmpeg_path or 'ffmpeg',
+            tee_outputs=[CLIP_TEE_OUTPUT] if clip_buffer else [],
+            stdout_reader=clip_buffer.attach if clip_buffer else None,
+            split_outputs=[
+                (
+                    get_output_filename(rendition),
+                    build_rendition_options(camera, rendition),
+                )
+                for rendition in renditions
+            ],
+            **build_ffmpeg_options(camera, video_filter),
+        )
+    # without a shared FFmpeg process, every rendition needs its own
+    writers = [
+        _create_write_gear(camera, build_ffmpeg_options(camera, video_filter)),
+        *(
+            _create_write_gear(
+                rendition,
+                build_rendition_options(camera, rendition, video_filter),
+            )
+            for rendition in renditions
+        ),
+    ]
+    return FanOutWriter(writers) if renditions else writers[0]
+
+
+def _create_write_gear(
+    camera: config.CameraSettings,
+    output_params: Dict[str, Any],
+) -> Any:
+    return WriteGear(
+        output_filename=get_output_filename(camera),
+        logging=True,
+        custom_ffmpeg=config.settings.ffmpeg_path or '',
+        **output_params,
+    )
+
+
+class FanOutWriter(object):
+    """Write the same frames to multiple writers, e.g. one per rendition.
+
+    Attributes:
+        writers: WriteGear or FFmpegWriter instances.
+    """
+
+    def __init__(self, writers: Sequence[Any]) -> None:
+        """Initialize with writers that are already open.
+
+        Args:
+            writers: WriteGear or FFmpegWriter instances.
+        """
+        self.writers = writers
+
+    def write(self, frame: Any) -> None:
+        """Write a single frame to all writers.
+
+        Args:
+            frame: Frame as OpenCV image (numpy array).
+        """
+        for writer in self.writers:
+            writer.write(frame)
+
+    def close(self) -> None:
+        """Safely close all writers."""
+        for writer in self.writers:
+            writer.close()
+
+
+class Recorder(object):  # noqa: WPS214, WPS230
+    """Capture, annotate, and encode the video stream of one camera.
+
+    With MOTION_DETECTION, only frames with recent motion get annotated and
+    encoded, while FFmpeg idles otherwise.
+
+    Attributes:
+        camera: Settings of the recorded camera.
+        stream: StreamWatchdog (see STREAM_STALL_TIMEOUT_SEC) or VideoGear
+            instance reading the video source.
+        writer: WriteGear, FFmpegWriter, or GovernedWriter (see
+            ENCODER_GOVERNOR) encoding the segmented output.
+        pipeline: Pipeline running capture, annotation, and encoding.
+        clip_buffer: Buffer of the encoded video for clip exports, None if
+            disabled.
+        preview: Live preview of the annotated frames, None if disabled.
+        outputs: Segmented outputs, the camera's own first, then one per
+            rendition.
+        segments: Watcher notifying about completed segments of the
+            camera's own output.
+        first_frame_at: Monotonic time the first frame was encoded, None
+            before.
+    """
+
+    def __init__(
+        self,
+        camera: config.CameraSettings,
+        annotate: Optional[Annotate],
+        video_filter: Optional[str] = None,
+    ) -> None:
+        """Open the video source and the segmented output.
+
+        Args:
+            camera: Settings of the camera to be recorded.
+            annotate: Callable adding annotations to a captured frame, None
+                to skip the annotation stage. It is shared between all
+                cameras and therefore needs to be thread-safe.
+            video_filter: Optional FFmpeg filter chain applied before
+                encoding, e.g. to draw annotations within FFmpeg.
+        """
+        self.camera = camera
+        self.first_frame_at: Optional[float] = None
+        self.outputs = create_outputs(camera)
+        self.segments = self.outputs[0].segments
+        self.stream = create_watched_stream(camera)
+        self.clip_buffer = create_clip_buffer(camera)
+        writer_backend = config.settings.video_writer_backend
+        if self.clip_buffer and writer_backend != config.WriterBackend.FFMPEG:
+            logger.warning(
+                '{0}: clip buffer requires VIDEO_WRITER_BACKEND=ffmpeg',
+                camera.name,
+            )
+            self.clip_buffer = None
+        writer_factory = partial(create_writer, clip_buffer=self.clip_buffer)
+        if config.settings.encoder_governor:
+            self.writer = GovernedWriter(
+                camera,
+                video_filter,
+                writer_factory,
+                # last entries of a closed FFmpeg, before the next truncates
+                on_closed=self._poll_segments,
+            )
+        else:
+            self.writer = writer_factory(camera, video_filter)
+
+        # capture, annotation, and encoding overlap in separate threads
+        stages: List[Tuple[str, Work]] = []
+        if config.settings.motion_detection:
+            # skip annotating and encoding frames without motion
+            stages.append(('motion', MotionDetector(
+                threshold=config.settings.motion_threshold,
+                min_area=config.settings.motion_min_area,
+                regions=config.settings.motion_regions,
+                hold_sec=config.settings.motion_hold_sec,
+                analysis_width=config.settings.motion_analysis_width,
+                name=camera.name,
+            )))
+        if annotate:
+            stages.append(('annotate', annotate))
+        self.preview = create_preview(camera)
+        if self.preview:
+            # after annotating, frames are only read anymore
+            stages.append(('preview', self.preview))
+        stages.append(('encode', self._encode))
+        self.pipeline = Pipeline(
+            # frames are stamped right when read, before any queueing
+            source=partial(capture_frame, self.stream.read),
+            stages=stages,
+            queue_size=config.settings.pipeline_queue_size,
+            drop_policy=config.settings.pipeline_drop_policy,
+            name=camera.name,
+        )
+        if isinstance(self.writer, GovernedWriter):
+            self.writer.attach(self.pipeline)
+
+    def start(self) -> 'Recorder':
+        """Start recording.
+
+        Returns:
+            The started recorder itself.
+        """
+        for output in self.outputs:
+            output.segments.start()
+        self.pipeline.start()
+        return self
+
+    def is_alive(self) -> bool:
+        """Check whether the recorder is still processing frames.
+
+        Returns:
+            True if the pipeline is still running.
+        """
+        return self.pipeline.is_alive()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the recording to end.
+
+        Args:
+            timeout: Maximum time to wait in seconds, None to wait forever.
+        """
+        self.pipeline.join(timeout)
+
+    def stop(self) -> None:
+        """Stop reading from the video source and let queued frames drain."""
+        self.pipeline.stop()
+        if isinstance(self.stream, StreamWatchdog):
+            # stop waiting for a stalled video source
+            self.stream.stop()
+
+    def close(self) -> None:
+        """Safely close video stream & writer."""
+        self.stream.stop()
+        self.writer.close()
+        for output in self.outputs:
+            output.segments.stop()
+        if self.clip_buffer:
+            self.clip_buffer.close()
+
+    def _poll_segments(self) -> None:
+        for output in self.outputs:
+            output.segments.poll()
+
+    def _encode(self, frame: CapturedFrame) -> None:
+        self.writer.write(frame.image)
+        if self.first_frame_at is None:
+            self.first_frame_at = time.monotonic()
+
+
+def build_passthrough_command(
+    camera: config.CameraSettings,
+    video_filter: Optional[str] = None,
+    tee_outputs: Sequence[str] = (),
+) -> List[str]:
+    """Build the FFmpeg command reading and segmenting the source directly.
+
+    With VIDEO_CODEC=copy, the source's encoded stream (e.g. H.264 via RTSP)
+    is copied without decoding, so segments can only be cut at the source's
+    key frames and no filters can be applied. Any other codec transcodes
+    within FFmpeg. Renditions are always transcoded, by the same FFmpeg
+    process.
+
+    Args:
+        camera: Settings of the camera to be recorded.
+        video_filter: Optional filter chain applied before encoding.
+        tee_outputs: Additional tee outputs, e.g. '[f=mpegts]pipe:1'.
+
+    Returns:
+        FFmpeg command as list of arguments.
+    """
+    if camera.video_codec == STREAM_COPY:
+        if video_filter:
+            logger.warning(
+                '{0}: video filter ignored for stream copy', camera.name,
+            )
+        output_params: Dict[str, Any] = {
+            '-map': '0:v',
+            '-c:v': STREAM_COPY,
+            '-segment_time': camera.video_segment_length_sec,
+            '-clones': ['-f', 'segment'],
+            '-reset_timestamps': 1,
+            '-strftime': 1,
+            **segment_list_options(
+                segment_list_path(camera.output_dir, camera.name),
+            ),
+        }
+    else:
+        output_params = build_ffmpeg_options(camera, video_filter)
+        output_params['-map'] = '0:v'
+    output_filename = get_output_filename(camera)
+    rendition_outputs = [
+        (
+            get_output_filename(rendition),
+            build_rendition_options(camera, rendition),
+        )
+        for rendition in camera.resolve_renditions()
+    ]
+    if rendition_outputs and camera.video_codec != STREAM_COPY:
+        # filtered once and split for all renditions
+        shared_filter = output_params.pop('-vf', None)
+        output_args = build_split_output_args(
+            [(output_filename, output_params), *rendition_outputs],
+            shared_filter=shared_filter,
+            tee_outputs=tee_outputs,
+        )
+    elif tee_outputs:
+        output_args = build_tee_output_args(
+            output_params, output_filename, tee_outputs,
+        )
+    else:
+        output_args = [*build_output_args(output_params), output_filename]
+    if rendition_outputs and camera.video_codec == STREAM_COPY:
+        # the copied stream is decoded only for the renditions
+        output_args.extend(build_split_output_args(rendition_outputs))
+    return [
+        config.settings.ffmpeg_path or 'ffmpeg',
+        '-y',
+        '-hide_banner',
+        *_build_input_args(camera),
+        *output_args,
+    ]
+
+
+def _build_input_args(camera: config.CameraSettings) -> List[str]:
+    input_args = ['-i', camera.video_source]
+    if camera.video_source.startswith('rtsp://'):
+        return ['-rtsp_transport', 'tcp', *input_args]
+    return input_args
+
+
+class PassthroughRecorder(object):
+    """Record a camera with FFmpeg reading the source, bypassing Python.
+
+    Frames are neither decoded nor annotated in Python. Instead, captions
+    (e.g. timestamp and GPS coordinates) are sampled once per second and
+    written as SubRip subtitles next to each completed segment.
+
+    Attributes:
+        camera: Settings of the recorded camera.
+        pipeline: Always None, there is no Python-side pipeline.
+        clip_buffer: Buffer of the encoded video for clip exports, None if
+            disabled.
+        preview: Always None, frames are not decoded in Python.
+        outputs: Segmented outputs, the camera's own first, then one per
+            rendition.
+        segments: Watcher notifying about completed segments of the
+            camera's own output.
+        first_frame_at: Always None, frames never pass through Python.
+    """
+
+    pipeline: Optional[Pipeline] = None
+    preview: Optional[PreviewTap] = None
+    first_frame_at: Optional[float] = None
+
+    def __init__(
+        self,
+        camera: config.CameraSettings,
+        caption: Caption,
+        video_filter: Optional[str] = None,
+    ) -> None:
+        """Prepare output directory, segment watcher, and sidecar writer.
+
+        Args:
+            camera: Settings of the camera to be recorded.
+            caption: Callable returning the caption for the current time.
+            video_filter: Optional FFmpeg filter chain applied before
+                encoding, e.g. to draw annotations within FFmpeg.
+        """
+        self.camera = camera
+        self.clip_buffer = create_clip_buffer(camera)
+        self._video_filter = video_filter
+        self._process: Optional['subprocess.Popen[bytes]'] = None
+        self.outputs = create_outputs(camera)
+        self.segments = self.outputs[0].segments
+        self._sidecar = SubtitleSidecar(
+            caption,
+            max_cues=2 * camera.video_segment_length_sec,
+        )
+        self.segments.subscribe(self._sidecar.on_segment)
+
+    def start(self) -> 'PassthroughRecorder':
+        """Start recording.
+
+        Returns:
+            The started recorder itself.
+        """
+        for output in self.outputs:
+            output.segments.start()
+        self._sidecar.start()
+        command = build_passthrough_command(
+            self.camera,
+            self._video_filter,
+            tee_outputs=[CLIP_TEE_OUTPUT] if self.clip_buffer else [],
+        )
+        logger.debug('Starting FFmpeg: {0}', ' '.join(command))
+        self._process = subprocess.Popen(  # noqa: S603
+            command,
+            stdout=subprocess.PIPE if self.clip_buffer else None,
+        )
+        if self.clip_buffer:
+            self.clip_buffer.attach(self._process.stdout)  # type: ignore
+        return self
+
+    def is_alive(self) -> bool:
+        """Check whether FFmpeg is still recording.
+
+        Returns:
+            True if the FFmpeg process is still running.
+        """
+        return self._process is not None and self._process.poll() is None
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the recording to end.
+
+        Args:
+            timeout: Maximum time to wait in seconds, None to wait forever.
+        """
+        if self._process is None:
+            return
+        try:
+            self._process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return
+
+    def stop(self) -> None:
+        """Ask FFmpeg to finalize the current segment and exit."""
+        if self.is_alive():
+            self._process.terminate()  # type: ignore
+
+    def close(self) -> None:
+        """Wait for FFmpeg and write the sidecar of the last segment."""
+        self.join()
+        self._sidecar.stop()
+        for output in self.outputs:
+            output.segments.stop()
+        if self.clip_buffer:
+            self.clip_buffer.close()
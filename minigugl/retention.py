@@ -0,0 +1,198 @@
+"""Deletion of the oldest video segments to stay within a disk quota.
+
+Segments are indexed once on startup and then incrementally as FFmpeg
+completes them, so the output directory never needs to be rescanned.
+Deletion runs in a separate thread, away from capturing and encoding.
+"""
+import shutil
+import time
+from collections import deque
+from contextlib import suppress
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, Deque, List, Optional
+
+from loguru import logger
+
+from minigugl.segments import Segment, parse_start_time
+from minigugl.sidecar import SUBRIP_SUFFIX
+from minigugl.track import BINARY_SUFFIX, GPX_SUFFIX
+
+# a segment is kept regardless of the quota while this file exists next to it
+PROTECTED_SUFFIX = '.keep'
+# files deleted together with their segment
+SIDECAR_SUFFIXES = (SUBRIP_SUFFIX, BINARY_SUFFIX, GPX_SUFFIX)
+PERCENT = 100
+
+SegmentCallback = Callable[[Segment], None]
+
+
+def is_protected(segment_path: Path) -> bool:
+    """Check whether a segment is flagged to be kept.
+
+    Args:
+        segment_path: Path of the segment file.
+
+    Returns:
+        True if the segment must not be deleted.
+    """
+    return Path('{0}{1}'.format(segment_path, PROTECTED_SUFFIX)).exists()
+
+
+def protect(segment_path: Path) -> None:
+    """Flag a segment to be kept regardless of the quota.
+
+    Args:
+        segment_path: Path of the segment file.
+    """
+    Path('{0}{1}'.format(segment_path, PROTECTED_SUFFIX)).touch()
+
+
+class RetentionManager(object):  # noqa: WPS214, WPS230
+    """Keep the segments of a camera within a byte and/or percent quota.
+
+    Only files named exactly like the camera's filename pattern expands
+    count as its segments, so cameras sharing an output directory with
+    different patterns never delete each other's segments.
+
+    Attributes:
+        output_dir: Directory holding the segments.
+        size: Total size of all indexed segments in bytes.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        filename_pattern: str,
+        max_bytes: Optional[int] = None,
+        max_percent: Optional[float] = None,
+    ) -> None:
+        """Initialize manager without indexing or deleting anything yet.
+
+        Args:
+            output_dir: Directory holding the segments.
+            filename_pattern: strftime pattern of the segment filenames.
+            max_bytes: Maximum total size of all segments in bytes.
+            max_percent: Maximum usage (0-100) of the file system holding
+                the output directory.
+        """
+        self.output_dir = output_dir
+        self.size = 0
+        self._filename_pattern = filename_pattern
+        self._max_bytes = max_bytes
+        self._max_percent = max_percent
+        self._segments: Deque[Segment] = deque()  # oldest first
+        self._subscribers: List[SegmentCallback] = []
+        self._lock = Lock()
+        self._changed = Event()
+        self._stopped = Event()
+        self._thread = Thread(
+            target=self._run,
+            name='retention-{0}'.format(output_dir.name),
+            daemon=True,
+        )
+
+    def start(self) -> 'RetentionManager':
+        """Index existing segments and start enforcing the quota.
+
+        Returns:
+            The started manager itself.
+        """
+        self._index_existing()
+        self._thread.start()
+        self._changed.set()
+        return self
+
+    def stop(self) -> None:
+        """Stop enforcing the quota."""
+        self._stopped.set()
+        self._changed.set()
+
+    def subscribe(self, callback: SegmentCallback) -> None:
+        """Register a callback for deleted segments.
+
+        Args:
+            callback: Callable receiving each deleted Segment.
+        """
+        self._subscribers.append(callback)
+
+    def on_segment(self, segment: Segment) -> None:
+        """Add a completed segment to the index, see SegmentWatcher.
+
+        Args:
+            segment: Completed segment.
+        """
+        with self._lock:
+            self._segments.append(segment)
+            self.size += segment.size
+        self._changed.set()
+
+    def _index_existing(self) -> None:
+        segments = []
+        for path in self.output_dir.iterdir():
+            start = self._parse_own_start_time(path)
+            if start is not None and path.is_file():
+                size = path.stat().st_size
+                segments.append(Segment(path, start, start, size))
+        segments.sort(key=lambda segment: segment.start)
+        with self._lock:
+            self._segments.extendleft(reversed(segments))
+            self.size += sum(segment.size for segment in segments)
+        logger.info(
+            'Indexed {0} segments ({1} bytes) in {2}',
+            len(segments),
+            self.size,
+            self.output_dir,
+        )
+
+    def _parse_own_start_time(self, path: Path) -> Optional[float]:
+        # strptime also accepts other cases or unpadded numbers, matching
+        # files of similar patterns, e.g. of other cameras
+        start = parse_start_time(path, self._filename_pattern)
+        if start is None:
+            return None
+        own_name = time.strftime(self._filename_pattern, time.localtime(start))
+        return start if path.name == own_name else None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._changed.wait()
+            self._changed.clear()
+            if not self._stopped.is_set():
+                self._enforce_quota()
+
+    def _is_over_quota(self) -> bool:
+        if self._max_bytes is not None and self.size > self._max_bytes:
+            return True
+        if self._max_percent is None:
+            return False
+        usage = shutil.disk_usage(str(self.output_dir))
+        return PERCENT * usage.used > self._max_percent * usage.total
+
+    def _enforce_quota(self) -> None:
+        with self._lock:
+            candidates = list(self._segments)
+        for segment in candidates:
+            if not self._is_over_quota():
+                return
+            if not is_protected(segment.path):
+                self._delete(segment)
+        if self._is_over_quota():
+            logger.warning(
+                'Quota exceeded, but no more segments to delete in {0}',
+                self.output_dir,
+            )
+
+    def _delete(self, segment: Segment) -> None:
+        sidecars = (
+            segment.path.with_suffix(suffix) for suffix in SIDECAR_SUFFIXES
+        )
+        for path in (segment.path, *sidecars):
+            with suppress(FileNotFoundError):
+                path.unlink()
+        with self._lock:
+            self._segments.remove(segment)
+            self.size -= segment.size
+        logger.debug('Deleted segment {0}', segment.path)
+        for callback in self._subscribers:
+            callback(segment)
@@ -0,0 +1,200 @@
+"""Notifications about video segments completed by FFmpeg's segment muxer."""
+import csv
+from datetime import datetime
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from loguru import logger
+
+POLL_INTERVAL_SEC = 0.5
+
+
+class Segment(NamedTuple):
+    """Completed video segment.
+
+    Attributes:
+        path: Path of the segment file.
+        start: Wall-clock start time as UNIX timestamp.
+        end: Wall-clock end time as UNIX timestamp.
+        size: File size in bytes.
+    """
+
+    path: Path
+    start: float
+    end: float
+    size: int
+
+
+SegmentCallback = Callable[[Segment], None]
+
+
+def segment_list_path(output_dir: str, name: str) -> Path:
+    """Get the path of the segment list written by FFmpeg for a camera.
+
+    Args:
+        output_dir: Output directory of the camera.
+        name: Name of the camera.
+
+    Returns:
+        Path of the (hidden) segment list file.
+    """
+    return Path(output_dir) / '.{0}.segments.csv'.format(name)
+
+
+def segment_list_options(list_path: Path) -> Dict[str, Any]:
+    """Get FFmpeg segment muxer options to write a segment list.
+
+    FFmpeg appends a line (filename, start time, end time) to the list
+    whenever it completes a segment.
+
+    Args:
+        list_path: Path of the segment list file.
+
+    Returns:
+        Dict of FFmpeg parameters.
+    """
+    return {
+        '-segment_list': str(list_path),
+        '-segment_list_type': 'csv',
+    }
+
+
+def parse_start_time(
+    segment_path: Path,
+    filename_pattern: str,
+) -> Optional[float]:
+    """Parse the wall-clock start time from a segment filename.
+
+    Args:
+        segment_path: Path of the segment file.
+        filename_pattern: strftime pattern the filename was expanded from.
+
+    Returns:
+        UNIX timestamp or None if the filename does not match the pattern.
+    """
+    try:
+        started_at = datetime.strptime(segment_path.name, filename_pattern)
+    except ValueError:
+        return None
+    return started_at.timestamp()
+
+
+class SegmentWatcher(object):  # noqa: WPS214
+    """Follow the segment list written by FFmpeg and notify subscribers.
+
+    Each completed segment is reported once to every subscriber, in the
+    watcher's thread, or in the thread calling poll(). The list is truncated
+    whenever FFmpeg restarts, which is detected and handled transparently.
+    """
+
+    def __init__(
+        self,
+        list_path: Path,
+        filename_pattern: str,
+    ) -> None:
+        """Initialize watcher without starting it.
+
+        Args:
+            list_path: Path of the segment list file written by FFmpeg.
+            filename_pattern: strftime pattern of the segment filenames.
+        """
+        self._list_path = list_path
+        self._filename_pattern = filename_pattern
+        self._subscribers: List[SegmentCallback] = []
+        self._position = 0
+        self._lock = Lock()  # polled by the thread and e.g. on writer restarts
+        self._stopped = Event()
+        self._thread = Thread(
+            target=self._run,
+            name='segments-{0}'.format(list_path.name),
+            daemon=True,
+        )
+
+    def subscribe(self, callback: SegmentCallback) -> None:
+        """Register a callback for completed segments.
+
+        Args:
+            callback: Callable receiving each completed Segment.
+        """
+        self._subscribers.append(callback)
+
+    def start(self) -> 'SegmentWatcher':
+        """Start following the segment list.
+
+        Entries already in the list (e.g. from a previous run) are skipped.
+
+        Returns:
+            The started watcher itself.
+        """
+        if self._list_path.exists():
+            self._position = self._list_path.stat().st_size
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Process remaining entries and stop following the segment list."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def poll(self) -> None:
+        """Read new entries from the segment list and notify subscribers."""
+        with self._lock:
+            self._poll()
+
+    def _poll(self) -> None:
+        try:
+            size = self._list_path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size < self._position:
+            self._position = 0  # FFmpeg restarted and truncated the list
+        if size == self._position:
+            return
+        with open(self._list_path, 'rb') as segment_list:
+            segment_list.seek(self._position)
+            lines = segment_list.readlines()
+        if lines and not lines[-1].endswith(b'\n'):
+            lines.pop()  # incomplete line, FFmpeg is still writing
+        self._position += sum(len(line) for line in lines)
+        for row in csv.reader(line.decode() for line in lines):
+            if row:
+                self._notify(row)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(POLL_INTERVAL_SEC):
+            self._poll_safely()
+        self._poll_safely()
+
+    def _poll_safely(self) -> None:
+        # a corrupt entry must not stop following the list
+        try:
+            self.poll()
+        except Exception:
+            logger.exception(
+                'Failed to read segment list {0}', self._list_path,
+            )
+
+    def _notify(self, row: List[str]) -> None:
+        segment = self._create_segment(row)
+        if segment is None:
+            return
+        for callback in self._subscribers:
+            try:
+                callback(segment)
+            except Exception:
+                logger.exception('Failed to process segment {0}', segment.path)
+
+    def _create_segment(self, row: List[str]) -> Optional[Segment]:
+        segment_path = self._list_path.parent / row[0]
+        duration = float(row[2]) - float(row[1])
+        try:
+            stat = segment_path.stat()
+        except FileNotFoundError:
+            logger.warning('Segment {0} disappeared', segment_path)
+            return None
+        start = parse_start_time(segment_path, self._filename_pattern)
+        if start is None:
+            start = stat.st_mtime - duration
+        return Segment(segment_path, start, start + duration, stat.st_size)
@@ -0,0 +1,89 @@
+"""Minimal threaded HTTP server helpers, e.g. for serving MJPEG streams."""
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Thread
+from typing import Any, Type
+
+MJPEG_BOUNDARY = 'frame'
+MJPEG_CONTENT_TYPE = 'multipart/x-mixed-replace; boundary={0}'.format(
+    MJPEG_BOUNDARY,
+)
+MJPEG_PART_HEADER = (
+    '--{0}\r\nContent-Type: image/jpeg\r\nContent-Length: {1}\r\n\r\n'
+)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling each request in a separate daemon thread.
+
+    Equivalent to http.server.ThreadingHTTPServer from Python 3.7+.
+    """
+
+    daemon_threads = True
+
+
+class QuietRequestHandler(BaseHTTPRequestHandler):
+    """Request handler not logging every request to stderr."""
+
+    def log_message(self, *args: Any) -> None:
+        """Suppress request logging.
+
+        Args:
+            args: Format string and its values, ignored.
+        """
+
+
+def serve_in_thread(
+    handler_class: Type[BaseHTTPRequestHandler],
+    host: str,
+    port: int,
+) -> ThreadingHTTPServer:
+    """Start an HTTP server in a separate daemon thread.
+
+    Args:
+        handler_class: Request handler class.
+        host: Host address to bind to.
+        port: Port to bind to, 0 for any free port.
+
+    Returns:
+        The running server. Use server.server_address for the bound port.
+    """
+    server = ThreadingHTTPServer((host, port), handler_class)
+    Thread(
+        target=server.serve_forever,
+        name='http-{0}'.format(handler_class.__name__),
+        daemon=True,
+    ).start()
+    return server
+
+
+def send_mjpeg_headers(request_handler: BaseHTTPRequestHandler) -> None:
+    """Send response headers for a multipart MJPEG stream.
+
+    Args:
+        request_handler: Request handler of the client connection.
+    """
+    request_handler.send_response(HTTPStatus.OK)
+    request_handler.send_header('Content-Type', MJPEG_CONTENT_TYPE)
+    request_handler.send_header('Cache-Control', 'no-cache, private')
+    request_handler.send_header('Pragma', 'no-cache')
+    request_handler.end_headers()
+
+
+def send_mjpeg_frame(
+    request_handler: BaseHTTPRequestHandler,
+    jpeg: bytes,
+) -> None:
+    """Send a single JPEG image as part of a multipart MJPEG stream.
+
+    Writing to a disconnected client raises a ConnectionError.
+
+    Args:
+        request_handler: Request handler of the client connection.
+        jpeg: JPEG-encoded image.
+    """
+    part_header = MJPEG_PART_HEADER.format(MJPEG_BOUNDARY, len(jpeg))
+    request_handler.wfile.write(part_header.encode())
+    request_handler.wfile.write(jpeg)
+    request_handler.wfile.write(b'\r\n')
@@ -0,0 +1,141 @@
+"""Metadata sidecar files written next to video segments."""
+import time
+from collections import deque
+from itertools import count
+from threading import Event, Lock, Thread
+from typing import Callable, Deque, Iterable, List, Tuple
+
+from minigugl.segments import Segment
+
+Cue = Tuple[float, str]
+SUBRIP_SUFFIX = '.srt'
+MSEC_PER_SEC = 1000
+SEC_PER_MIN = 60
+SEC_PER_HOUR = 3600
+
+
+def format_subrip_time(seconds: float) -> str:
+    """Format a time offset as SubRip timestamp.
+
+    Args:
+        seconds: Time offset in seconds.
+
+    Returns:
+        Timestamp with hours, minutes, seconds, and milliseconds.
+    """
+    msec = int(round(max(seconds, 0) * MSEC_PER_SEC))
+    sec, msec = divmod(msec, MSEC_PER_SEC)
+    return '{0:02}:{1:02}:{2:02},{3:03}'.format(
+        sec // SEC_PER_HOUR,
+        sec % SEC_PER_HOUR // SEC_PER_MIN,
+        sec % SEC_PER_MIN,
+        msec,
+    )
+
+
+def format_subrip(cues: List[Cue], start: float, end: float) -> str:
+    """Format captions as SubRip subtitles relative to a segment start.
+
+    Each caption is shown until the next one or the end of the segment.
+
+    Args:
+        cues: Sorted list of wall-clock times and captions.
+        start: Wall-clock start time of the segment.
+        end: Wall-clock end time of the segment.
+
+    Returns:
+        SubRip (.srt) file content.
+    """
+    cue_ends = [cue_time for cue_time, _ in cues[1:]] + [end]
+    return '\n'.join(
+        '{0}\n{1} --> {2}\n{3}\n'.format(
+            number,
+            format_subrip_time(cue[0] - start),
+            format_subrip_time(min(cue_end, end) - start),
+            cue[1],
+        )
+        for number, cue, cue_end in zip(count(1), cues, cue_ends)
+    )
+
+
+def _select_cues(cues: Iterable[Cue], start: float, end: float) -> List[Cue]:
+    selected: List[Cue] = []
+    for cue_time, caption in cues:
+        if cue_time >= end:
+            break
+        if cue_time <= start:
+            # caption still shown at the beginning of the segment
+            selected = [(start, caption)]
+        else:
+            selected.append((cue_time, caption))
+    return selected
+
+
+class SubtitleSidecar(object):
+    """Sample captions periodically and write them as SRT per segment.
+
+    Players like VLC pick up video.srt next to video.mp4 automatically, so
+    timestamps and GPS coordinates are visible without burning them into
+    the video.
+    """
+
+    def __init__(
+        self,
+        caption: Callable[[], str],
+        max_cues: int,
+        interval_sec: float = 1,
+    ) -> None:
+        """Initialize sidecar writer without starting to sample.
+
+        Args:
+            caption: Callable returning the caption for the current time.
+            max_cues: Maximum number of captions kept in memory.
+            interval_sec: Time between captions in seconds.
+        """
+        self._caption = caption
+        self._interval_sec = interval_sec
+        self._cues: Deque[Cue] = deque(maxlen=max_cues)
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name='sidecar', daemon=True)
+
+    def start(self) -> 'SubtitleSidecar':
+        """Start sampling captions.
+
+        Returns:
+            The started sidecar writer itself.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop sampling captions."""
+        self._stopped.set()
+
+    def on_segment(self, segment: Segment) -> None:
+        """Write the captions sampled during a segment next to it.
+
+        Args:
+            segment: Completed video segment.
+        """
+        with self._lock:
+            cues = _select_cues(self._cues, segment.start, segment.end)
+            # keep the last caption before the next segment starts
+            while len(self._cues) > 1:
+                next_cue_time = self._cues[1][0]
+                if next_cue_time > segment.end:
+                    break
+                self._cues.popleft()
+        segment.path.with_suffix(SUBRIP_SUFFIX).write_text(
+            format_subrip(cues, segment.start, segment.end),
+        )
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            sampled_at = time.time()
+            caption = self._caption()
+            with self._lock:
+                self._cues.append((sampled_at, caption))
+            self._stopped.wait(
+                self._interval_sec - (time.time() - sampled_at),
+            )
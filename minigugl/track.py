@@ -0,0 +1,255 @@
+"""GPS track logs written as sidecar files next to video segments.
+
+All fixes are appended to fixed-width, array-backed columns and written
+out per completed segment, either in a compact binary format or as GPX.
+
+The binary format starts with a header (magic bytes and the number of
+fixes as little-endian uint32), followed by one column after another:
+time, lat, lon (float64 each), speed, track, and altitude (float32 each),
+all little-endian. Unknown values are NaN.
+"""
+import math
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from threading import Lock
+from types import MappingProxyType
+from typing import Dict, NamedTuple
+
+from minigugl.config import TrackFormat
+from minigugl.segments import Segment
+
+TRACK_MAGIC = b'MGTRACK1'
+TRACK_HEADER = struct.Struct('<8sI')
+TIME_COLUMN = 'time'
+# name and array typecode of each column in file order
+TRACK_COLUMNS = (
+    (TIME_COLUMN, 'd'),
+    ('lat', 'd'),
+    ('lon', 'd'),
+    ('speed', 'f'),
+    ('track', 'f'),
+    ('alt', 'f'),
+)
+BINARY_SUFFIX = '.track'
+GPX_SUFFIX = '.gpx'
+TRACK_SUFFIXES = MappingProxyType({
+    TrackFormat.BINARY: BINARY_SUFFIX,
+    TrackFormat.GPX: GPX_SUFFIX,
+})
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n' +
+    '<gpx version="1.0" creator="minigugl" ' +
+    'xmlns="http://www.topografix.com/GPX/1/0">\n' +
+    '<trk><trkseg>\n'
+)
+GPX_FOOTER = '</trkseg></trk>\n</gpx>\n'
+GPX_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'  # noqa: WPS323
+
+
+class GpsFix(NamedTuple):
+    """Single GPS fix as reported by gpsd (TPV).
+
+    Attributes:
+        time: Time of the fix as UNIX timestamp, as reported by the
+            receiver or the time of reception if unknown.
+        lat: Latitude in degrees.
+        lon: Longitude in degrees.
+        speed: Speed over ground in m/s.
+        track: Course over ground in degrees from true north.
+        alt: Altitude (MSL) in meters.
+    """
+
+    time: float
+    lat: float
+    lon: float
+    speed: float = math.nan
+    track: float = math.nan
+    alt: float = math.nan
+
+
+def _to_little_endian(column: 'array[float]') -> 'array[float]':
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+
+def encode_binary(columns: Dict[str, 'array[float]']) -> bytes:
+    """Encode track columns in the binary track format.
+
+    Args:
+        columns: Arrays of equal length per column name.
+
+    Returns:
+        Binary track data.
+    """
+    count = len(columns[TIME_COLUMN])
+    return TRACK_HEADER.pack(TRACK_MAGIC, count) + b''.join(
+        _to_little_endian(columns[name]).tobytes()
+        for name, _ in TRACK_COLUMNS
+    )
+
+
+def decode_binary(track_data: bytes) -> Dict[str, 'array[float]']:
+    """Decode binary track data into columns.
+
+    Args:
+        track_data: Binary track data.
+
+    Raises:
+        ValueError: If the data is not in the binary track format.
+
+    Returns:
+        Arrays of equal length per column name.
+    """
+    if track_data[:len(TRACK_MAGIC)] != TRACK_MAGIC:
+        raise ValueError('Not a minigugl track file')
+    count = TRACK_HEADER.unpack_from(track_data)[1]
+    offset = TRACK_HEADER.size
+    columns = {}
+    for name, typecode in TRACK_COLUMNS:
+        columns[name] = _read_column(typecode, track_data, offset, count)
+        offset += count * columns[name].itemsize
+    return columns
+
+
+def _read_column(
+    typecode: str,
+    track_data: bytes,
+    offset: int,
+    count: int,
+) -> 'array[float]':
+    column: 'array[float]' = array(typecode)
+    column.frombytes(track_data[offset:offset + count * column.itemsize])
+    return _to_little_endian(column)  # swaps back if needed
+
+
+def _format_gpx_point(fix: GpsFix) -> str:
+    # GPX 1.0 requires this order: ele, time, course, speed
+    elements = [] if math.isnan(fix.alt) else [
+        '<ele>{0:.2f}</ele>'.format(fix.alt),
+    ]
+    elements.append('<time>{0}</time>'.format(
+        time.strftime(GPX_TIME_FORMAT, time.gmtime(fix.time)),
+    ))
+    for tag, point_value in (('course', fix.track), ('speed', fix.speed)):
+        if not math.isnan(point_value):
+            elements.append('<{0}>{1:.2f}</{0}>'.format(tag, point_value))
+    return '<trkpt lat="{0:.7f}" lon="{1:.7f}">{2}</trkpt>\n'.format(
+        fix.lat, fix.lon, ''.join(elements),
+    )
+
+
+def encode_gpx(columns: Dict[str, 'array[float]']) -> bytes:
+    """Encode track columns as GPX 1.0 track.
+
+    Args:
+        columns: Arrays of equal length per column name.
+
+    Returns:
+        GPX document.
+    """
+    # columns are in the order of the GpsFix fields
+    points = zip(*(columns[name] for name, _ in TRACK_COLUMNS))
+    return '{0}{1}{2}'.format(
+        GPX_HEADER,
+        ''.join(_format_gpx_point(GpsFix(*point)) for point in points),
+        GPX_FOOTER,
+    ).encode()
+
+
+class GpsTrack(object):
+    """Track log of GPS fixes in array-backed columns, sorted by time."""
+
+    def __init__(self) -> None:
+        """Initialize empty track."""
+        self._columns: Dict[str, 'array[float]'] = {
+            name: array(typecode) for name, typecode in TRACK_COLUMNS
+        }
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        """Get the number of fixes.
+
+        Returns:
+            Number of fixes in the track.
+        """
+        return len(self._columns[TIME_COLUMN])
+
+    def on_fix(self, fix: GpsFix) -> None:
+        """Append a fix, see GpsCoordinates.subscribe.
+
+        Args:
+            fix: GPS fix, not older than any fix before.
+        """
+        with self._lock:
+            for name, _ in TRACK_COLUMNS:
+                self._columns[name].append(getattr(fix, name))
+
+    def slice(self, start: float, end: float) -> Dict[str, 'array[float]']:
+        """Get the fixes within a time range.
+
+        Args:
+            start: Start of the time range as UNIX timestamp.
+            end: End of the time range (exclusive) as UNIX timestamp.
+
+        Returns:
+            Copied arrays of equal length per column name.
+        """
+        with self._lock:
+            times = self._columns[TIME_COLUMN]
+            first, last = bisect_left(times, start), bisect_left(times, end)
+            return {
+                name: column[first:last]
+                for name, column in self._columns.items()
+            }
+
+    def discard(self, end: float) -> None:
+        """Discard all fixes before a point in time.
+
+        Args:
+            end: Time as UNIX timestamp.
+        """
+        with self._lock:
+            count = bisect_left(self._columns[TIME_COLUMN], end)
+            for column in self._columns.values():
+                del column[:count]  # noqa: WPS420
+
+
+class TrackSidecar(object):
+    """Write the GPS track of each completed segment as sidecar file.
+
+    Attributes:
+        track: Track log receiving all GPS fixes.
+        track_format: File format of the sidecars.
+    """
+
+    def __init__(self, track_format: TrackFormat) -> None:
+        """Initialize sidecar writer with an empty track.
+
+        Args:
+            track_format: File format of the sidecars.
+        """
+        self.track = GpsTrack()
+        self.track_format = track_format
+
+    def on_segment(self, segment: Segment) -> None:
+        """Write the segment's track next to it, see SegmentWatcher.
+
+        Args:
+            segment: Completed segment.
+        """
+        columns = self.track.slice(segment.start, segment.end)
+        self.track.discard(segment.end)
+        encode = (
+            encode_binary
+            if self.track_format == TrackFormat.BINARY
+            else encode_gpx
+        )
+        track_path = segment.path.with_suffix(
+            TRACK_SUFFIXES[self.track_format],
+        )
+        track_path.write_bytes(encode(columns))
@@ -0,0 +1,236 @@
+"""Reconnecting stalled video sources while the recording keeps running.
+
+A network hiccup either ends the video stream or leaves reads hanging.
+Instead of ending the recording, the source gets reopened with
+exponential backoff, while the pipeline and the FFmpeg writer keep
+running. Optionally, the gap is filled with frames at the camera's
+framerate, so segments keep their length and the video stays in sync
+with wall-clock time.
+"""
+import time
+from threading import Condition, Event, Thread
+from typing import Any, Callable, Optional
+
+import numpy as np
+from loguru import logger
+
+from minigugl.config import GapFill
+
+RECONNECT_MIN_SEC = 0.5
+STOP_TIMEOUT_SEC = 5
+
+OpenStream = Callable[[], Any]
+
+
+class StreamWatchdog(object):  # noqa: WPS214, WPS230
+    """Read frames from a video source, reopening it when it stalls.
+
+    Drop-in replacement for VideoGear's read() and stop(). Each connection
+    is read by its own thread handing over one frame at a time. A
+    connection without a new frame within the stall timeout is abandoned,
+    even if it hangs in a read, and replaced by a new one.
+
+    Attributes:
+        name: Name of the camera, used for threads and logging.
+        reconnects: Number of times the video source was reopened.
+        filled: Number of frames inserted into gaps.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        stream: Any,
+        open_stream: OpenStream,
+        name: str,
+        stall_timeout_sec: float,
+        framerate: float,
+        gap_fill: GapFill = GapFill.NONE,
+        reconnect_max_sec: float = 30,
+    ) -> None:
+        """Start reading from the already opened video source.
+
+        Args:
+            stream: Started VideoGear instance.
+            open_stream: Callable opening and starting the video source again.
+            name: Name of the camera, used for threads and logging.
+            stall_timeout_sec: Time without a new frame until reconnecting.
+            framerate: Framerate of the camera, used to fill gaps.
+            gap_fill: Frames inserted while the video source is stalled.
+            reconnect_max_sec: Maximum delay between reconnection attempts.
+        """
+        self.name = name
+        self.reconnects = 0
+        self.filled = 0
+        self._open_stream = open_stream
+        self._stall_timeout_sec = stall_timeout_sec
+        self._interval_sec = 1 / framerate
+        self._gap_fill = gap_fill
+        self._reconnect_max_sec = reconnect_max_sec
+        self._condition = Condition()
+        self._stopped = Event()
+        self._frame: Optional[Any] = None  # handed over, not read yet
+        self._held: Optional[Any] = None  # last frame, to fill gaps
+        self._last_frame_at = time.monotonic()
+        self._connected_at = self._last_frame_at
+        self._stalled = False
+        self._gap_frames = 0  # frames filled since the last frame
+        self._reconnecting = False  # reader is reopening the video source
+        self._generation = 0
+        with self._condition:
+            self._reader = self._start_reader(stream)
+
+    def read(self) -> Optional[Any]:
+        """Get the next frame, waiting for the video source to recover.
+
+        Returns:
+            Next frame as OpenCV image (numpy array), None once stopped.
+        """
+        with self._condition:
+            while not self._stopped.is_set():
+                if self._frame is not None:
+                    return self._take_frame()
+                now = time.monotonic()
+                stall_at = max(
+                    self._last_frame_at, self._connected_at,
+                ) + self._stall_timeout_sec
+                if now >= stall_at:
+                    self._on_stall(now)
+                    continue
+                fill_at = self._get_fill_at()
+                if fill_at is not None and now >= fill_at:
+                    return self._fill()
+                self._condition.wait(min(stall_at, fill_at or stall_at) - now)
+        return None
+
+    def stop(self) -> None:
+        """Stop reading and close the current video source."""
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify_all()
+        self._reader.join(STOP_TIMEOUT_SEC)
+
+    def _take_frame(self) -> Any:
+        frame = self._frame
+        self._frame = None
+        if self._stalled:
+            logger.info(
+                '{0}: video source recovered after {1:.1f}s, ' +
+                '{2} frames filled',
+                self.name,
+                time.monotonic() - self._last_frame_at,
+                self._gap_frames,
+            )
+        self._last_frame_at = time.monotonic()
+        self._stalled = False
+        self._gap_frames = 0
+        self._condition.notify_all()  # the reader may hand over the next
+        return frame
+
+    def _on_stall(self, now: float) -> None:
+        if not self._stalled:
+            logger.warning(
+                '{0}: no frame for {1:.1f}s',
+                self.name,
+                now - self._last_frame_at,
+            )
+        self._stalled = True
+        # checked again after another timeout
+        self._connected_at = now
+        if not self._reconnecting:
+            # the reader hangs in a read, replaced by a new connection
+            self._reader = self._start_reader(None)
+
+    def _get_fill_at(self) -> Optional[float]:
+        if not self._stalled or self._gap_fill == GapFill.NONE:
+            return None
+        if self._held is None:
+            return None  # shape unknown before the first frame
+        # frames missed since the last one, caught up once stalled
+        return self._last_frame_at + self._interval_sec * (
+            self._gap_frames + 1
+        )
+
+    def _fill(self) -> Any:
+        self._gap_frames += 1
+        self.filled += 1
+        # later stages draw onto frames, so every frame is a new image; the
+        # held last frame already carries its annotation, drawn over again
+        if self._gap_fill == GapFill.HOLD:
+            return self._held.copy()  # type: ignore
+        return np.zeros_like(self._held)
+
+    def _start_reader(self, stream: Optional[Any]) -> Thread:
+        # the previous reader notices the new generation and exits
+        self._generation += 1
+        self._reconnecting = stream is None
+        self._condition.notify_all()
+        reader = Thread(
+            target=self._read_stream,
+            args=(self._generation, stream),
+            name='{0}-reader'.format(self.name),
+            daemon=True,
+        )
+        reader.start()
+        return reader
+
+    def _is_current(self, generation: int) -> bool:
+        return generation == self._generation and not self._stopped.is_set()
+
+    def _read_stream(self, generation: int, stream: Optional[Any]) -> None:
+        delay_sec: float = 0
+        while self._is_current(generation):
+            if stream is None:
+                self._stopped.wait(delay_sec)
+                delay_sec = min(
+                    max(2 * delay_sec, RECONNECT_MIN_SEC),
+                    self._reconnect_max_sec,
+                )
+                stream = self._reopen(generation)
+                continue
+            frame = stream.read()
+            if frame is None:
+                self._on_end(generation, stream)
+                stream = None
+                continue
+            delay_sec = 0
+            self._hand_over(generation, frame)
+        if stream is not None:
+            stream.stop()
+
+    def _on_end(self, generation: int, stream: Any) -> None:
+        logger.warning('{0}: video source ended', self.name)
+        with self._condition:
+            if self._is_current(generation):
+                self._reconnecting = True
+        stream.stop()
+
+    def _reopen(self, generation: int) -> Optional[Any]:
+        try:
+            stream = self._open_stream()
+        except Exception as error:
+            logger.warning(
+                '{0}: failed to reopen video source: {1}', self.name, error,
+            )
+            return None
+        with self._condition:
+            if self._is_current(generation):
+                self.reconnects += 1
+                self._reconnecting = False
+                # a new connection gets the full timeout for its first frame
+                self._connected_at = time.monotonic()
+        logger.info('{0}: reopened video source', self.name)
+        return stream
+
+    def _hand_over(self, generation: int, frame: Any) -> None:
+        with self._condition:
+            # wait for the previous frame to be read, keeping backpressure
+            self._condition.wait_for(
+                lambda: self._frame is None or not self._is_current(
+                    generation,
+                ),
+            )
+            if not self._is_current(generation):
+                return
+            self._frame = frame
+            # a reference, copied only to fill gaps
+            self._held = frame
+            self._condition.notify_all()